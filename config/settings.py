@@ -58,6 +58,7 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'planner.middleware.QueryBudgetMiddleware',
 ]
 
 ROOT_URLCONF = 'config.urls'
@@ -133,6 +134,75 @@ STATIC_ROOT = BASE_DIR / "staticfiles"
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
+# Хранение истории (manage.py compact_history), в днях
+PLANNER_FORECAST_RETENTION_DAYS = int(os.getenv("PLANNER_FORECAST_RETENTION_DAYS", "30"))
+PLANNER_PLAN_SCORES_RETENTION_DAYS = int(os.getenv("PLANNER_PLAN_SCORES_RETENTION_DAYS", "90"))
+
+# Источник погоды: Open-Meteo или запись с диска (planner.services.weather.ReplayProvider)
+PLANNER_WEATHER_PROVIDER = os.getenv("PLANNER_WEATHER_PROVIDER", "planner.services.open_meteo.OpenMeteoProvider")
+PLANNER_WEATHER_REPLAY_PATH = os.getenv("PLANNER_WEATHER_REPLAY_PATH", str(BASE_DIR / "weather_replay"))
+# Ансамбль моделей Open-Meteo одним запросом, например "icon_seamless,gfs_seamless,ecmwf_ifs025":
+# в оценку идут вероятность ясного неба и разброс облачности между моделями. Пусто — одна модель
+PLANNER_WEATHER_ENSEMBLE_MODELS = [m.strip() for m in os.getenv("PLANNER_WEATHER_ENSEMBLE_MODELS", "").split(",") if m.strip()]
+# Искусственная задержка ReplayProvider (имитация сети в нагрузочных тестах), мс
+PLANNER_WEATHER_REPLAY_LATENCY_MS = int(os.getenv("PLANNER_WEATHER_REPLAY_LATENCY_MS", "0"))
+
+# Таблица эфемерид Солнца и Луны (manage.py build_ephemeris); без файла считаем через astropy
+PLANNER_EPHEMERIS_PATH = os.getenv("PLANNER_EPHEMERIS_PATH", str(BASE_DIR / "ephemeris.bin"))
+
+# Растр засветки (manage.py import_sky_raster); без файла яркость неба в оценке не учитывается
+PLANNER_SKY_RASTER_PATH = os.getenv("PLANNER_SKY_RASTER_PATH", str(BASE_DIR / "sky_quality.bin"))
+
+# Кэш результатов расчёта по содержимому входа (PlanResult): сколько записей держать
+PLANNER_PLAN_CACHE_MAX_ENTRIES = int(os.getenv("PLANNER_PLAN_CACHE_MAX_ENTRIES", "1000"))
+
+# Как часто manage.py replan_forecasts обновляет прогноз (модели Open-Meteo обновляются раз в 1–6 ч)
+PLANNER_FORECAST_REFRESH_MINUTES = int(os.getenv("PLANNER_FORECAST_REFRESH_MINUTES", "60"))
+
+# Демо-планировщик для гостей (planner.services.demo): ничего не пишет в БД, ответы — в кэше.
+# LocMemCache — свой на каждый процесс; при нескольких воркерах лучше общий бэкенд (Redis/Memcached)
+CACHES = {
+    "default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"},
+}
+PLANNER_DEMO_CACHE = "default"
+PLANNER_DEMO_CACHE_SECONDS = int(os.getenv("PLANNER_DEMO_CACHE_SECONDS", "1800"))
+# Не больше PLANNER_DEMO_RATE_LIMIT запросов с одного IP за PLANNER_DEMO_RATE_WINDOW_SECONDS
+PLANNER_DEMO_RATE_LIMIT = int(os.getenv("PLANNER_DEMO_RATE_LIMIT", "20"))
+PLANNER_DEMO_RATE_WINDOW_SECONDS = 60
+# Одновременных расчётов демо на процесс (остальным — «попробуйте позже»)
+PLANNER_DEMO_MAX_CONCURRENT = int(os.getenv("PLANNER_DEMO_MAX_CONCURRENT", "2"))
+
+# Лента окон для календарей (planner.services.ical): тело ленты кэшируется до пересчёта планов
+PLANNER_CALENDAR_FEED_CACHE = "default"
+PLANNER_CALENDAR_FEED_CACHE_SECONDS = int(os.getenv("PLANNER_CALENDAR_FEED_CACHE_SECONDS", "86400"))
+# Сколько клиенту можно не переспрашивать ленту, с
+PLANNER_CALENDAR_FEED_MAX_AGE = int(os.getenv("PLANNER_CALENDAR_FEED_MAX_AGE", "300"))
+
+# Бюджет SQL-запросов на запрос (planner.middleware.QueryBudgetMiddleware).
+# Доля проверяемых запросов: в разработке — все, в проде — выборка
+PLANNER_QUERY_SAMPLE_RATE = float(os.getenv("PLANNER_QUERY_SAMPLE_RATE", "1.0" if DEBUG else "0.0"))
+PLANNER_QUERY_REPEAT_THRESHOLD = 5
+PLANNER_QUERY_BUDGET_DEFAULT = 20
+PLANNER_QUERY_BUDGETS = {
+    "plan_list": 5,
+    "plan_detail": 6,  # + профили оценки для пересчёта
+    "plan_chart": 4,
+    "plan_calendar": 4,
+    "calendar_feed": 2,  # токен; окна — только после пересчёта, остальное из кэша или 304
+    "location_list": 3,
+    "target_list": 3,
+    "tonight": 6,
+    "compare": 6,
+    "demo": 2,  # сам расчёт в БД не ходит — только сессия и пользователь, если вошли
+}
+
+LOGGING = {
+    "version": 1,
+    "disable_existing_loggers": False,
+    "handlers": {"console": {"class": "logging.StreamHandler"}},
+    "loggers": {"planner.queries": {"handlers": ["console"], "level": "WARNING"}},
+}
+
 LOGIN_URL = "/login/"
 LOGIN_REDIRECT_URL = "/"
 LOGOUT_REDIRECT_URL = "/"
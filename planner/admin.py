@@ -1,4 +1,11 @@
 from django.contrib import admin
+from django.core.paginator import Paginator
+from django.db import connections
+from django.http import HttpResponse
+from django.shortcuts import get_object_or_404
+from django.urls import path, reverse
+from django.utils.functional import cached_property
+from django.utils.html import format_html
 
 from .models import (
     Location,
@@ -7,14 +14,50 @@ from .models import (
     ForecastHour,
     AstroWindow,
     PlanHourScore,
+    NightSummary,
+    RunLock,
+    PlanResult,
+    CalendarFeed,
+    PlanProfile,
+    ScoringProfile,
 )
+from .services.profiling import DOWNLOAD_NAMES
+
+
+class EstimatedCountPaginator(Paginator):
+    """
+    Для нефильтрованного списка на PostgreSQL берём оценку числа строк
+    из статистики (pg_class.reltuples) вместо COUNT(*) по всей таблице
+    """
+
+    @cached_property
+    def count(self):
+        qs = self.object_list
+        if not qs.query.where and connections[qs.db].vendor == "postgresql":
+            with connections[qs.db].cursor() as cursor:
+                cursor.execute("SELECT reltuples::bigint FROM pg_class WHERE relname = %s", [qs.model._meta.db_table])
+                row = cursor.fetchone()
+            if row and row[0] > 0:
+                return row[0]
+        return super().count
+
+
+class LargeTableAdmin(admin.ModelAdmin):
+    """
+    Общие настройки для таблиц на миллионы строк:
+    без второго COUNT(*) по всей таблице и без date_hierarchy (DISTINCT по датам)
+    """
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+    list_per_page = 50
 
 
 @admin.register(Location)
 class LocationAdmin(admin.ModelAdmin):
-    list_display = ("id", "name", "owner", "latitude", "longitude", "timezone", "created_at")
+    list_display = ("id", "name", "owner", "latitude", "longitude", "timezone", "sky_quality", "created_at")
     search_fields = ("name", "owner__username")
     list_filter = ("timezone", "created_at")
+    readonly_fields = ("sky_quality",)
 
 
 @admin.register(Target)
@@ -24,6 +67,12 @@ class TargetAdmin(admin.ModelAdmin):
     list_filter = ("target_type", "created_at")
 
 
+@admin.register(ScoringProfile)
+class ScoringProfileAdmin(admin.ModelAdmin):
+    list_display = ("id", "name", "owner", "cloud_weight", "moon_weight", "light_pollution_weight", "created_at")
+    search_fields = ("name", "owner__username")
+
+
 @admin.register(SessionRequest)
 class SessionRequestAdmin(admin.ModelAdmin):
     list_display = (
@@ -38,29 +87,122 @@ class SessionRequestAdmin(admin.ModelAdmin):
         "avoid_moon",
         "created_at",
     )
+    list_select_related = ("user", "location", "target")
+    raw_id_fields = ("user", "location", "target", "scoring_profile")
     search_fields = ("user__username", "location__name", "target__name")
-    list_filter = ("avoid_moon", "created_at")
+    list_filter = ("avoid_moon", "profile_next_run", "created_at")
+    readonly_fields = ("profile_next_run",)
+    actions = ("profile_next_run_action",)
+
+    @admin.action(description="Профилировать следующий расчёт")
+    def profile_next_run_action(self, request, queryset):
+        n = queryset.update(profile_next_run=True)
+        self.message_user(request, f"Следующий расчёт {n} планов будет записан в профиль.")
+
 
+# Фильтры только по индексированным полям (timestamp/start_time/night),
+# поиск — точный по id плана/локации или по префиксу логина
 
 @admin.register(ForecastHour)
-class ForecastHourAdmin(admin.ModelAdmin):
+class ForecastHourAdmin(LargeTableAdmin):
     list_display = ("id", "location", "timestamp", "cloud_cover", "precipitation", "visibility", "source")
-    search_fields = ("location__name",)
-    list_filter = ("source", "location")
-    date_hierarchy = "timestamp"
+    list_select_related = ("location",)
+    raw_id_fields = ("location",)
+    search_fields = ("=location__id", "^location__name")
+    list_filter = ("timestamp",)
 
 
 @admin.register(AstroWindow)
-class AstroWindowAdmin(admin.ModelAdmin):
+class AstroWindowAdmin(LargeTableAdmin):
     list_display = ("id", "plan", "start_time", "end_time", "score", "avg_cloud_cover", "max_target_altitude", "is_astronomical_dark")
-    search_fields = ("plan__user__username", "plan__location__name", "plan__target__name")
-    list_filter = ("is_astronomical_dark",)
-    date_hierarchy = "start_time"
+    list_select_related = ("plan__location", "plan__target")
+    raw_id_fields = ("plan",)
+    search_fields = ("=plan__id", "^plan__user__username")
+    list_filter = ("start_time",)
+    ordering = ("-start_time",)
 
 
 @admin.register(PlanHourScore)
-class PlanHourScoreAdmin(admin.ModelAdmin):
+class PlanHourScoreAdmin(LargeTableAdmin):
     list_display = ("id", "plan", "timestamp", "score", "cloud_cover", "target_altitude", "moon_illumination", "is_astronomical_dark")
-    search_fields = ("plan__user__username", "plan__location__name", "plan__target__name")
-    list_filter = ("is_astronomical_dark",)
-    date_hierarchy = "timestamp"
+    list_select_related = ("plan__location", "plan__target")
+    raw_id_fields = ("plan",)
+    search_fields = ("=plan__id", "^plan__user__username")
+    list_filter = ("timestamp",)
+
+
+@admin.register(NightSummary)
+class NightSummaryAdmin(LargeTableAdmin):
+    list_display = ("id", "plan", "night", "best_score", "dark_hours", "usable_hours", "windows_count", "moon_illumination", "has_forecast")
+    list_select_related = ("plan__location", "plan__target")
+    raw_id_fields = ("plan",)
+    search_fields = ("=plan__id", "^plan__user__username")
+    list_filter = ("night",)
+
+
+@admin.register(RunLock)
+class RunLockAdmin(admin.ModelAdmin):
+    list_display = ("key", "token", "started_at", "expires_at", "finished_at", "succeeded")
+    search_fields = ("^key",)
+    list_filter = ("succeeded",)
+
+
+@admin.register(PlanResult)
+class PlanResultAdmin(admin.ModelAdmin):
+    list_display = ("key", "hours", "hits", "created_at", "last_used_at")
+    exclude = ("data",)
+    readonly_fields = ("key", "hours", "hits", "created_at", "last_used_at")
+    search_fields = ("^key",)
+    ordering = ("-last_used_at",)
+
+
+@admin.register(CalendarFeed)
+class CalendarFeedAdmin(admin.ModelAdmin):
+    list_display = ("id", "user", "changed_at", "created_at")
+    search_fields = ("user__username",)
+    readonly_fields = ("token", "changed_at", "created_at")
+
+
+@admin.register(PlanProfile)
+class PlanProfileAdmin(admin.ModelAdmin):
+    list_display = ("id", "plan", "mode", "duration_ms", "requested_by", "created_at", "download_link")
+    list_select_related = ("plan__location", "plan__target")
+    raw_id_fields = ("plan",)
+    search_fields = ("=plan__id", "^requested_by")
+    list_filter = ("mode", "created_at")
+    exclude = ("data",)
+    readonly_fields = ("plan", "mode", "duration_ms", "requested_by", "created_at", "download_link", "summary_text")
+
+    def get_queryset(self, request):
+        # Трассы бывают по мегабайту — в списке и форме они не нужны
+        return super().get_queryset(request).defer("data")
+
+    def get_urls(self):
+        return [
+            path(
+                "<int:pk>/download/",
+                self.admin_site.admin_view(self.download_view),
+                name="planner_planprofile_download",
+            ),
+        ] + super().get_urls()
+
+    def download_view(self, request, pk: int):
+        if not self.has_view_permission(request):
+            return HttpResponse(status=403)
+        profile = get_object_or_404(PlanProfile, pk=pk)
+        ext, content_type = DOWNLOAD_NAMES[profile.mode]
+        response = HttpResponse(bytes(profile.data), content_type=content_type)
+        response["Content-Disposition"] = f'attachment; filename="plan-{profile.plan_id}-profile-{profile.pk}.{ext}"'
+        return response
+
+    @admin.display(description="Трасса")
+    def download_link(self, obj):
+        ext, _ = DOWNLOAD_NAMES[obj.mode]
+        return format_html('<a href="{}">.{}</a>', reverse("admin:planner_planprofile_download", args=[obj.pk]), ext)
+
+    @admin.display(description="Сводка")
+    def summary_text(self, obj):
+        return format_html('<pre style="white-space: pre; overflow-x: auto;">{}</pre>', obj.summary)
+
+    def has_add_permission(self, request):
+        return False
@@ -1,9 +1,29 @@
+import datetime as dt
+from decimal import Decimal
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+
 from django import forms
+from django.utils import timezone
 
-from .models import Location, Target, SessionRequest
+from .models import Location, ScoringProfile, Target, SessionRequest
+from .services.catalog import resolve_target
+from .services.demo import DEMO_MAX_NIGHTS
+from .services.horizon import parse_horizon
+from .services.scoring import FEATURES, FUNCTIONS, validate_extra_term
+from .services.weather import FORECAST_HORIZON_DAYS
 
 
 class LocationForm(forms.ModelForm):
+    # Максимальный размер файла горизонта (Stellarium/N.I.N.A. — единицы КБ)
+    HORIZON_FILE_MAX_BYTES = 256 * 1024
+
+    horizon_file = forms.FileField(
+        label="Профиль горизонта",
+        required=False,
+        help_text="Текстовый файл: строки «азимут высота» (Stellarium, N.I.N.A., APT, CSV) или ряд высот от севера по часовой.",
+    )
+    clear_horizon = forms.BooleanField(label="Убрать профиль горизонта", required=False)
+
     class Meta:
         model = Location
         fields = ["name", "latitude", "longitude", "timezone"]
@@ -12,6 +32,9 @@ class LocationForm(forms.ModelForm):
         super().__init__(*args, **kwargs)
         for field in self.fields.values():
             field.widget.attrs["class"] = "form-control"
+        self.fields["clear_horizon"].widget.attrs["class"] = "form-check-input"
+        if not self.instance.horizon:
+            del self.fields["clear_horizon"]
 
     def clean_latitude(self):
         lat = self.cleaned_data["latitude"]
@@ -25,11 +48,38 @@ class LocationForm(forms.ModelForm):
             raise forms.ValidationError("Долгота должна быть в диапазоне от -180 до 180.")
         return lon
 
+    def clean_horizon_file(self):
+        upload = self.cleaned_data.get("horizon_file")
+        if not upload:
+            return None
+        if upload.size > self.HORIZON_FILE_MAX_BYTES:
+            raise forms.ValidationError("Файл горизонта слишком большой.")
+        try:
+            text = upload.read().decode("utf-8-sig")
+        except UnicodeDecodeError:
+            raise forms.ValidationError("Файл горизонта должен быть текстовым (UTF-8).")
+        try:
+            return parse_horizon(text)
+        except ValueError as e:
+            raise forms.ValidationError(str(e))
+
+    def save(self, commit=True):
+        profile = self.cleaned_data.get("horizon_file")
+        if profile is not None:
+            self.instance.horizon = profile.tobytes()
+        elif self.cleaned_data.get("clear_horizon"):
+            self.instance.horizon = None
+        # Яркость неба пересчитает Location.save() — при смене координат
+        return super().save(commit)
+
 
 class TargetForm(forms.ModelForm):
     class Meta:
         model = Target
         fields = ["name", "target_type", "right_ascension", "declination"]
+        help_texts = {
+            "name": "Для DSO из каталога (M31, NGC 7000, Orion Nebula) и планет RA/Dec подставятся сами.",
+        }
 
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
@@ -45,15 +95,72 @@ class TargetForm(forms.ModelForm):
         ra = cleaned.get("right_ascension")
         dec = cleaned.get("declination")
 
-        if target_type == Target.TargetType.DSO:
-            if ra is None or dec is None:
-                raise forms.ValidationError(
-                    "Для DSO необходимо указать прямое восхождение (RA) и склонение (Dec)."
-                )
+        if not target_type:
+            return cleaned
+
+        try:
+            resolved = resolve_target(cleaned.get("name") or "", target_type, ra, dec)
+        except ValueError as e:
+            raise forms.ValidationError(str(e))
+
+        # Кэш разрешения заполнит Target.save() — по тем же полям
+        if target_type == Target.TargetType.DSO and (ra is None or dec is None):
+            cleaned["right_ascension"] = Decimal(f"{resolved.ra_deg:.4f}")
+            cleaned["declination"] = Decimal(f"{resolved.dec_deg:.4f}")
 
         return cleaned
 
 
+class ScoringProfileForm(forms.ModelForm):
+    class Meta:
+        model = ScoringProfile
+        fields = [
+            "name",
+            "cloud_weight",
+            "precipitation_penalty",
+            "dark_bonus",
+            "twilight_penalty",
+            "altitude_weight",
+            "altitude_bonus_max",
+            "low_altitude_penalty",
+            "moon_weight",
+            "light_pollution_weight",
+            "clear_weight",
+            "extra_term",
+        ]
+        widgets = {
+            "extra_term": forms.Textarea(attrs={"rows": 2}),
+        }
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        for field in self.fields.values():
+            field.widget.attrs["class"] = "form-control"
+        self.fields["extra_term"].help_text += (
+            f". Ряды: {', '.join(FEATURES)}; функции: {', '.join(FUNCTIONS)}; маски — через & и |"
+        )
+
+    def clean_extra_term(self):
+        try:
+            return validate_extra_term(self.cleaned_data.get("extra_term") or "")
+        except ValueError as e:
+            raise forms.ValidationError(str(e))
+
+
+class PlanRescoreForm(forms.Form):
+    scoring_profile = forms.ModelChoiceField(
+        queryset=ScoringProfile.objects.none(),
+        required=False,
+        empty_label="Стандартный",
+        label="Профиль оценки",
+    )
+
+    def __init__(self, *args, user=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.fields["scoring_profile"].queryset = ScoringProfile.objects.filter(owner=user)
+        self.fields["scoring_profile"].widget.attrs["class"] = "form-select form-select-sm"
+
+
 class SessionRequestForm(forms.ModelForm):
     class Meta:
         model = SessionRequest
@@ -65,6 +172,7 @@ class SessionRequestForm(forms.ModelForm):
             "min_target_altitude",
             "max_cloud_cover",
             "avoid_moon",
+            "scoring_profile",
         ]
         widgets = {
             "date_from": forms.DateInput(attrs={"type": "date"}),
@@ -74,7 +182,7 @@ class SessionRequestForm(forms.ModelForm):
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
         for name, field in self.fields.items():
-            if name in ("location", "target"):
+            if name in ("location", "target", "scoring_profile"):
                 field.widget.attrs["class"] = "form-select"
             elif name == "avoid_moon":
                 field.widget.attrs["class"] = "form-check-input"
@@ -91,6 +199,11 @@ class SessionRequestForm(forms.ModelForm):
         if date_from and date_to and date_from > date_to:
             raise forms.ValidationError("Дата начала не может быть позже даты окончания.")
 
+        if date_from and date_to and (date_to - date_from).days + 1 > SessionRequest.MAX_PERIOD_DAYS:
+            raise forms.ValidationError(
+                f"Период слишком большой. Выберите диапазон до {SessionRequest.MAX_PERIOD_DAYS} дней."
+            )
+
         if min_alt is not None and (min_alt < 0 or min_alt > 90):
             raise forms.ValidationError(
                 "Минимальная высота цели должна быть в диапазоне от 0 до 90 градусов."
@@ -102,3 +215,133 @@ class SessionRequestForm(forms.ModelForm):
             )
 
         return cleaned
+
+
+class TonightForm(forms.Form):
+    """
+    Параметры рейтинга целей на одну ночь (GET-форма, ничего не сохраняет)
+    """
+    location = forms.ModelChoiceField(queryset=Location.objects.none(), label="Локация")
+    night = forms.DateField(label="Ночь (дата вечера)", widget=forms.DateInput(attrs={"type": "date"}))
+    include_catalog = forms.BooleanField(label="Добавить объекты встроенного каталога", required=False)
+    min_target_altitude = forms.IntegerField(label="Мин. высота цели (°)", min_value=0, max_value=90, initial=20)
+    max_cloud_cover = forms.IntegerField(label="Макс. облачность (%)", min_value=0, max_value=100, initial=40)
+    avoid_moon = forms.BooleanField(label="Учитывать влияние Луны", required=False, initial=True)
+    top = forms.IntegerField(label="Сколько целей показать", min_value=1, max_value=100, initial=10)
+
+    def __init__(self, *args, user=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.fields["location"].queryset = Location.objects.filter(owner=user)
+        for name, field in self.fields.items():
+            if name == "location":
+                field.widget.attrs["class"] = "form-select"
+            elif name in ("include_catalog", "avoid_moon"):
+                field.widget.attrs["class"] = "form-check-input"
+            else:
+                field.widget.attrs["class"] = "form-control"
+
+
+class CompareForm(forms.Form):
+    """
+    Сравнение нескольких локаций для одной цели (GET-форма)
+    """
+    target = forms.ModelChoiceField(queryset=Target.objects.none(), label="Цель")
+    locations = forms.ModelMultipleChoiceField(
+        queryset=Location.objects.none(),
+        label="Локации",
+        widget=forms.CheckboxSelectMultiple,
+    )
+    date_from = forms.DateField(label="Начало периода", widget=forms.DateInput(attrs={"type": "date"}))
+    date_to = forms.DateField(label="Конец периода", widget=forms.DateInput(attrs={"type": "date"}))
+    min_target_altitude = forms.IntegerField(label="Мин. высота цели (°)", min_value=0, max_value=90, initial=20)
+    max_cloud_cover = forms.IntegerField(label="Макс. облачность (%)", min_value=0, max_value=100, initial=40)
+    avoid_moon = forms.BooleanField(label="Учитывать влияние Луны", required=False, initial=True)
+
+    def __init__(self, *args, user=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.fields["target"].queryset = Target.objects.filter(owner=user)
+        self.fields["locations"].queryset = Location.objects.filter(owner=user)
+        for name, field in self.fields.items():
+            if name == "target":
+                field.widget.attrs["class"] = "form-select"
+            elif name == "avoid_moon":
+                field.widget.attrs["class"] = "form-check-input"
+            elif name != "locations":
+                field.widget.attrs["class"] = "form-control"
+
+    def clean(self):
+        cleaned = super().clean()
+        date_from = cleaned.get("date_from")
+        date_to = cleaned.get("date_to")
+
+        if date_from and date_to:
+            if date_from > date_to:
+                raise forms.ValidationError("Дата начала не может быть позже даты окончания.")
+            if (date_to - date_from).days + 1 > FORECAST_HORIZON_DAYS:
+                raise forms.ValidationError(
+                    f"Период слишком большой. Выберите диапазон до {FORECAST_HORIZON_DAYS} дней."
+                )
+
+        return cleaned
+
+
+class DemoForm(forms.Form):
+    """
+    Демо-планировщик для гостей (GET-форма): координаты и цель из каталога, ничего не сохраняет.
+    Часовой пояс подставляет браузер
+    """
+    latitude = forms.DecimalField(label="Широта", min_value=-90, max_value=90, decimal_places=5)
+    longitude = forms.DecimalField(label="Долгота", min_value=-180, max_value=180, decimal_places=5)
+    target_type = forms.ChoiceField(label="Тип цели", choices=Target.TargetType.choices, initial=Target.TargetType.DSO)
+    target_name = forms.CharField(
+        label="Объект",
+        max_length=120,
+        required=False,
+        help_text="Для DSO — из каталога (M31, M42, NGC 7000), для планет — название (Jupiter).",
+    )
+    date_from = forms.DateField(label="Первая ночь", widget=forms.DateInput(attrs={"type": "date"}))
+    nights = forms.IntegerField(label="Ночей", min_value=1, max_value=DEMO_MAX_NIGHTS, initial=1)
+    min_target_altitude = forms.IntegerField(label="Мин. высота цели (°)", min_value=0, max_value=90, initial=20)
+    max_cloud_cover = forms.IntegerField(label="Макс. облачность (%)", min_value=0, max_value=100, initial=40)
+    avoid_moon = forms.BooleanField(label="Учитывать влияние Луны", required=False, initial=True)
+    tz = forms.CharField(required=False, widget=forms.HiddenInput)
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        for name, field in self.fields.items():
+            if name == "target_type":
+                field.widget.attrs["class"] = "form-select"
+            elif name == "avoid_moon":
+                field.widget.attrs["class"] = "form-check-input"
+            elif name != "tz":
+                field.widget.attrs["class"] = "form-control"
+
+    def clean_tz(self):
+        name = self.cleaned_data.get("tz") or "UTC"
+        try:
+            ZoneInfo(name)
+        except (ZoneInfoNotFoundError, ValueError):
+            return "UTC"
+        return name
+
+    def clean(self):
+        cleaned = super().clean()
+        target_type = cleaned.get("target_type")
+        if target_type:
+            try:
+                cleaned["resolved"] = resolve_target(cleaned.get("target_name") or "", target_type)
+            except ValueError as e:
+                self.add_error("target_name", str(e))
+
+        date_from = cleaned.get("date_from")
+        nights = cleaned.get("nights")
+        if date_from and nights:
+            today = timezone.localdate()
+            # Ночь — вечер date_from и утро следующего дня: последний день тоже должен быть в прогнозе
+            if not today <= date_from <= today + dt.timedelta(days=FORECAST_HORIZON_DAYS - 1 - nights):
+                raise forms.ValidationError(
+                    f"В демо — только ближайшие {FORECAST_HORIZON_DAYS} дней, пока есть прогноз погоды."
+                )
+            cleaned["date_to"] = date_from + dt.timedelta(days=nights)
+
+        return cleaned
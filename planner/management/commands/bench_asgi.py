@@ -0,0 +1,126 @@
+import asyncio
+import datetime as dt
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import AsyncClient, Client, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from planner.models import Location, RunLock, SessionRequest, Target
+
+
+class Command(BaseCommand):
+    help = (
+        "Нагрузочный тест запуска расчёта: WSGI (N синхронных воркеров) против ASGI (один event loop). "
+        "Погода — ReplayProvider с искусственной задержкой сети"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--replay",
+            type=Path,
+            default=Path(settings.PLANNER_WEATHER_REPLAY_PATH),
+            help="Записанные ответы Open-Meteo (см. record_weather)",
+        )
+        parser.add_argument("--latency-ms", type=int, default=300, help="Задержка ответа погоды, мс")
+        parser.add_argument("--requests", type=int, default=40, help="Сколько запусков расчёта (разных планов)")
+        parser.add_argument("--wsgi-workers", type=int, default=4, help="Синхронных воркеров WSGI")
+        parser.add_argument("--concurrency", type=int, default=40, help="Одновременных запросов к ASGI")
+
+    def handle(self, *args, **options):
+        if not options["replay"].exists():
+            raise CommandError(f"{options['replay']} не найден — запишите погоду: manage.py record_weather.")
+
+        with override_settings(
+            PLANNER_WEATHER_PROVIDER="planner.services.weather.ReplayProvider",
+            PLANNER_WEATHER_REPLAY_PATH=str(options["replay"]),
+            PLANNER_WEATHER_REPLAY_LATENCY_MS=options["latency_ms"],
+            PLANNER_QUERY_SAMPLE_RATE=0.0,
+            ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, "testserver"],  # хост тестовых клиентов
+        ):
+            user, plans = self._fixtures(options["requests"])
+            try:
+                urls = [reverse("plan_run", args=[plan.pk]) for plan in plans]
+
+                # Прогрев AstroPy/IERS — не должен попасть ни в один замер
+                client = Client()
+                client.force_login(user)
+                client.post(urls[0])
+
+                wsgi_s = self._wsgi(user, urls, options["wsgi_workers"])
+                self._report(f"WSGI, {options['wsgi_workers']} воркеров", len(urls), wsgi_s)
+
+                asgi_s = asyncio.run(self._asgi(user, urls, options["concurrency"]))
+                self._report(f"ASGI, 1 процесс, {options['concurrency']} одновременно", len(urls), asgi_s)
+
+                self.stdout.write(self.style.SUCCESS(f"ASGI быстрее в {wsgi_s / asgi_s:.1f} раза"))
+            finally:
+                RunLock.objects.filter(key__in=[f"plan:{plan.pk}" for plan in plans]).delete()
+                Location.objects.filter(owner=user).delete()
+                user.delete()
+
+    def _fixtures(self, n: int) -> tuple[User, list[SessionRequest]]:
+        """
+        Временный пользователь и n планов на одну ночь в разных точках
+        (разные локации — чтобы запросы погоды не склеивались блокировкой)
+        """
+        user = User.objects.create_user(f"bench-{uuid.uuid4().hex[:8]}")
+        target = Target.objects.create(
+            name="M31", target_type=Target.TargetType.DSO, right_ascension=10.6847, declination=41.2690, owner=user,
+        )
+        today = timezone.localdate()
+        plans = []
+        for i in range(n):
+            location = Location.objects.create(
+                name=f"bench {i}", latitude=40 + (i % 20), longitude=(i * 7) % 180, owner=user,
+            )
+            plans.append(SessionRequest.objects.create(
+                user=user, location=location, target=target, date_from=today, date_to=today + dt.timedelta(days=1),
+            ))
+        return user, plans
+
+    def _wsgi(self, user: User, urls: list[str], workers: int) -> float:
+        def post(url: str) -> int:
+            client = Client()
+            client.force_login(user)
+            try:
+                return client.post(url).status_code
+            finally:
+                connection.close()
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            codes = list(pool.map(post, urls))
+        elapsed = time.perf_counter() - started
+        self._check(codes)
+        return elapsed
+
+    async def _asgi(self, user: User, urls: list[str], concurrency: int) -> float:
+        client = AsyncClient()
+        await client.aforce_login(user)
+        limit = asyncio.Semaphore(concurrency)
+
+        async def post(url: str) -> int:
+            async with limit:
+                return (await client.post(url)).status_code
+
+        started = time.perf_counter()
+        codes = await asyncio.gather(*(post(url) for url in urls))
+        elapsed = time.perf_counter() - started
+        self._check(codes)
+        return elapsed
+
+    def _check(self, codes: list[int]) -> None:
+        bad = [c for c in codes if c != 302]
+        if bad:
+            raise CommandError(f"Неожиданные ответы: {bad[:5]}")
+
+    def _report(self, label: str, n: int, seconds: float) -> None:
+        self.stdout.write(f"{label}: {n} запросов за {seconds:.2f} с ({n / seconds:.1f} запр/с)")
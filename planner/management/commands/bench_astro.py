@@ -0,0 +1,68 @@
+import datetime as dt
+import time
+
+import numpy as np
+from astropy.coordinates import AltAz
+from astropy.time import Time
+
+from django.core.management.base import BaseCommand
+
+from planner.models import Location, Target
+from planner.services import ephemeris
+from planner.services.astro_calc import compute_astro_series, compute_hour_astro, earth_location, sun_moon_series
+
+
+class Command(BaseCommand):
+    help = "Бенчмарк пакетного расчёта астрономии (по умолчанию — год почасово, 8760 часов)"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--hours", type=int, default=8760, help="Сколько часов считать пакетно")
+        parser.add_argument(
+            "--sample",
+            type=int,
+            default=24,
+            help="Сколько часов посчитать по одному для сравнения (0 — не сравнивать)",
+        )
+
+    def handle(self, *args, **options):
+        hours = options["hours"]
+        sample = options["sample"]
+
+        # Объекты не сохраняем — бенчмарку БД не нужна
+        location = Location(name="bench", latitude=55.75, longitude=37.62)
+        target = Target(name="M31", target_type=Target.TargetType.DSO, right_ascension=10.6847, declination=41.2690)
+
+        start = dt.datetime(dt.date.today().year, 1, 1, tzinfo=dt.timezone.utc)
+        grid = [start + dt.timedelta(hours=i) for i in range(hours)]
+
+        t0 = time.perf_counter()
+        series = compute_astro_series(location, target, grid)
+        batch_s = time.perf_counter() - t0
+        self.stdout.write(
+            f"batch: {len(series)} ч за {batch_s:.2f} с ({len(series) / batch_s:.0f} ч/с)"
+        )
+
+        if sample > 0:
+            t0 = time.perf_counter()
+            for ts in grid[:sample]:
+                compute_hour_astro(location, target, ts)
+            per_hour_s = (time.perf_counter() - t0) / sample
+            self.stdout.write(
+                f"по одному: {per_hour_s * 1000:.1f} мс/ч, оценка на {hours} ч: {per_hour_s * hours:.1f} с "
+                f"(ускорение ×{per_hour_s * hours / batch_s:.1f})"
+            )
+
+        if ephemeris.get_ephemeris() is None:
+            self.stdout.write("таблицы эфемерид нет (manage.py build_ephemeris) — Солнце и Луна считались через astropy")
+            return
+
+        t0 = time.perf_counter()
+        t = Time(grid)
+        sun_alt, moon_alt, moon_illum = sun_moon_series(t, AltAz(obstime=t, location=earth_location(location)))
+        astropy_s = time.perf_counter() - t0
+        self.stdout.write(
+            f"Солнце и Луна через astropy: {astropy_s:.2f} с; расхождение с таблицей: "
+            f"Солнце {np.abs(series.sun_alt_deg - sun_alt).max():.5f}°, "
+            f"Луна {np.abs(series.moon_alt_deg - moon_alt).max():.5f}°, "
+            f"освещённость {np.abs(series.moon_illumination - moon_illum).max():.2e}"
+        )
@@ -0,0 +1,61 @@
+import datetime as dt
+import os
+import time
+from pathlib import Path
+
+import numpy as np
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+import planner.services.astro_calc  # noqa: F401 — настройки IERS до первого Time
+from astropy.coordinates import TETE, get_body, get_sun
+from astropy.time import Time
+
+from planner.services import ephemeris
+
+
+def _sampler(body: str):
+    def sample(jd: np.ndarray):
+        t = Time(jd, format="jd", scale="tt")
+        coord = (get_sun(t) if body == "sun" else get_body(body, t)).transform_to(TETE(obstime=t))
+        return coord.ra.rad, coord.dec.rad, coord.distance.m
+
+    return sample
+
+
+class Command(BaseCommand):
+    help = (
+        "Строит таблицу Чебышёва для Солнца и Луны (PLANNER_EPHEMERIS_PATH). "
+        "Перезапускать раз в год — покрытие скользящее"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--output", type=Path, default=Path(settings.PLANNER_EPHEMERIS_PATH))
+        parser.add_argument("--years-before", type=int, default=1, help="Сколько лет до текущего покрыть")
+        parser.add_argument("--years-after", type=int, default=4, help="Сколько лет после текущего покрыть")
+
+    def handle(self, *args, **options):
+        if options["years_before"] < 0 or options["years_after"] < 1:
+            raise CommandError("Покрытие: --years-before >= 0, --years-after >= 1.")
+
+        year = dt.date.today().year
+        start = ephemeris.jd_tt([dt.datetime(year - options["years_before"], 1, 1, tzinfo=dt.timezone.utc)])[0]
+        end = ephemeris.jd_tt([dt.datetime(year + options["years_after"] + 1, 1, 1, tzinfo=dt.timezone.utc)])[0]
+
+        started = time.perf_counter()
+        coeffs = {}
+        for body, seg_days in (("sun", ephemeris.SUN_SEGMENT_DAYS), ("moon", ephemeris.MOON_SEGMENT_DAYS)):
+            n = int(np.ceil((end - start) / seg_days))
+            coeffs[body] = ephemeris.fit_segments(start, seg_days, n, _sampler(body))
+            self.stdout.write(f"{body}: {n} сегментов по {seg_days:g} сут")
+
+        # Пишем рядом и подменяем: процессы с открытым memmap дочитают старый файл
+        output = options["output"]
+        tmp = output.with_name(output.name + ".tmp")
+        ephemeris.write_table(tmp, start, coeffs["sun"], coeffs["moon"])
+        os.replace(tmp, output)
+
+        self.stdout.write(self.style.SUCCESS(
+            f"{output}: {year - options['years_before']}–{year + options['years_after']}, "
+            f"{output.stat().st_size // 1024} КБ за {time.perf_counter() - started:.1f} с"
+        ))
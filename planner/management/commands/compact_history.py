@@ -0,0 +1,73 @@
+from pathlib import Path
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from planner.services.archive import ARCHIVE_FORMATS
+from planner.services.history import (
+    FORECAST_FIELDS,
+    PLAN_SCORE_FIELDS,
+    compact,
+    expired_plan_scores,
+    stale_forecast_hours,
+)
+from planner.services.locks import purge_run_locks, stale_run_locks
+
+
+class Command(BaseCommand):
+    help = (
+        "Удаляет старые ForecastHour и PlanHourScore пачками (с необязательным архивом CSV/Parquet) "
+        "и отработавшие блокировки расчётов"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--forecast-days",
+            type=int,
+            default=settings.PLANNER_FORECAST_RETENTION_DAYS,
+            help="Хранить часы прогноза за последние N дней",
+        )
+        parser.add_argument(
+            "--plan-days",
+            type=int,
+            default=settings.PLANNER_PLAN_SCORES_RETENTION_DAYS,
+            help="Хранить почасовые score планов, закончившихся не раньше N дней назад",
+        )
+        parser.add_argument("--batch-size", type=int, default=5000, help="Строк на одну транзакцию удаления")
+        parser.add_argument("--archive-dir", type=Path, default=None, help="Куда сохранять удаляемые строки")
+        parser.add_argument("--archive-format", choices=ARCHIVE_FORMATS, default="csv")
+        parser.add_argument("--dry-run", action="store_true", help="Только посчитать строки")
+
+    def handle(self, *args, **options):
+        if options["batch_size"] <= 0:
+            raise CommandError("--batch-size должен быть больше 0.")
+
+        jobs = [
+            (stale_forecast_hours(options["forecast_days"]), FORECAST_FIELDS),
+            (expired_plan_scores(options["plan_days"]), PLAN_SCORE_FIELDS),
+        ]
+
+        for queryset, fields in jobs:
+            try:
+                result = compact(
+                    queryset,
+                    fields,
+                    batch_size=options["batch_size"],
+                    archive_dir=options["archive_dir"],
+                    archive_format=options["archive_format"],
+                    dry_run=options["dry_run"],
+                )
+            except RuntimeError as e:
+                raise CommandError(str(e)) from e
+
+            verb = "к удалению" if options["dry_run"] else "удалено"
+            line = f"{result.table}: {verb} {result.deleted} строк за {result.seconds:.2f} с"
+            if result.archived:
+                line += f", в архиве {result.archived}"
+            self.stdout.write(self.style.SUCCESS(line))
+
+        # Блокировки расчётов: строки завершённых и брошенных расчётов, без архива
+        if options["dry_run"]:
+            self.stdout.write(self.style.SUCCESS(f"planner_runlock: к удалению {stale_run_locks().count()} строк"))
+        else:
+            self.stdout.write(self.style.SUCCESS(f"planner_runlock: удалено {purge_run_locks()} строк"))
@@ -0,0 +1,49 @@
+import datetime as dt
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+
+from planner.models import SessionRequest
+from planner.services.export import EXPORT_CHUNK_SIZE, EXPORT_FORMATS, EXPORT_KINDS, export_queryset, export_stream
+
+
+class Command(BaseCommand):
+    help = "Потоковая выгрузка почасовых score или окон по всем (или выбранным) планам в CSV/Parquet"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--kind", choices=list(EXPORT_KINDS), default="hours")
+        parser.add_argument("--format", choices=EXPORT_FORMATS, default="csv")
+        parser.add_argument("--plan", type=int, action="append", dest="plans", help="ID плана (можно несколько раз)")
+        parser.add_argument("--user", help="Только планы этого пользователя (username)")
+        parser.add_argument("--from", dest="date_from", type=dt.date.fromisoformat, help="YYYY-MM-DD")
+        parser.add_argument("--to", dest="date_to", type=dt.date.fromisoformat, help="YYYY-MM-DD")
+        parser.add_argument("--chunk-size", type=int, default=EXPORT_CHUNK_SIZE)
+        parser.add_argument("-o", "--output", default="-", help="Файл (по умолчанию stdout, только для CSV)")
+
+    def handle(self, *args, **options):
+        fmt = options["format"]
+        if fmt == "parquet" and options["output"] == "-":
+            raise CommandError("Для Parquet укажите файл через --output.")
+
+        plans = SessionRequest.objects.all()
+        if options["plans"]:
+            plans = plans.filter(pk__in=options["plans"])
+        if options["user"]:
+            plans = plans.filter(user__username=options["user"])
+
+        queryset = export_queryset(options["kind"], plans, options["date_from"], options["date_to"])
+        try:
+            stream = export_stream(options["kind"], fmt, queryset, options["chunk_size"])
+        except RuntimeError as e:
+            raise CommandError(str(e)) from e
+
+        if options["output"] == "-":
+            for chunk in stream:
+                sys.stdout.write(chunk)
+            return
+
+        mode, encoding = ("w", "utf-8") if fmt == "csv" else ("wb", None)
+        with open(options["output"], mode, encoding=encoding, newline="" if fmt == "csv" else None) as f:
+            for chunk in stream:
+                f.write(chunk)
+        self.stderr.write(self.style.SUCCESS(f"Готово: {options['output']}"))
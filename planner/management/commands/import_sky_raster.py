@@ -0,0 +1,63 @@
+import os
+from pathlib import Path
+
+import numpy as np
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from planner.services import sky_quality
+
+ROWS_PER_BLOCK = 256
+
+
+class Command(BaseCommand):
+    help = (
+        "Конвертирует GeoTIFF атласа засветки (EPSG:4326) в растр PLANNER_SKY_RASTER_PATH "
+        "и пересчитывает яркость неба у всех локаций"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("source", type=Path, nargs="?", help="GeoTIFF (например, World Atlas 2015)")
+        parser.add_argument(
+            "--units",
+            choices=["mcd", "sqm"],
+            default="mcd",
+            help="Значения растра: искусственная яркость, мкд/м² (атлас Фальки) или готовые SQM",
+        )
+        parser.add_argument("--output", type=Path, default=Path(settings.PLANNER_SKY_RASTER_PATH))
+        parser.add_argument("--refresh-only", action="store_true", help="Только пересчитать локации")
+
+    def handle(self, *args, **options):
+        if not options["refresh_only"]:
+            if options["source"] is None:
+                raise CommandError("Укажите GeoTIFF или --refresh-only.")
+            self._convert(options["source"], options["output"], options["units"])
+
+        n = sky_quality.refresh_locations()
+        self.stdout.write(self.style.SUCCESS(f"Яркость неба обновлена у {n} локаций"))
+
+    def _convert(self, source: Path, output: Path, units: str) -> None:
+        try:
+            import rasterio
+            from rasterio.windows import Window
+        except ImportError as e:
+            raise CommandError("Для GeoTIFF нужен пакет rasterio (pip install rasterio).") from e
+
+        # Пишем рядом и подменяем: процессы с открытым memmap дочитают старый файл
+        tmp = output.with_name(output.name + ".tmp")
+        with rasterio.open(source) as src:
+            t = src.transform
+            if t.b or t.d or (src.crs is not None and not src.crs.is_geographic):
+                raise CommandError("Нужен растр в географических координатах (EPSG:4326) без поворота.")
+
+            with open(tmp, "wb") as f:
+                sky_quality.write_header(f, src.width, src.height, t.c, t.f, t.a, -t.e)
+                # По блокам строк: многогигабайтный атлас не загружается целиком
+                for row in range(0, src.height, ROWS_PER_BLOCK):
+                    window = Window(0, row, src.width, min(ROWS_PER_BLOCK, src.height - row))
+                    block = src.read(1, window=window, masked=True).astype(float).filled(np.nan)
+                    sqm = sky_quality.sqm_from_artificial(block) if units == "mcd" else block
+                    f.write(sky_quality.encode_sqm(sqm).tobytes())
+        os.replace(tmp, output)
+
+        self.stdout.write(f"{output}: {src.width}×{src.height}, {output.stat().st_size // (1024 * 1024)} МБ")
@@ -0,0 +1,46 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from planner.models import SessionRequest
+from planner.services.planning import BATCH_CHUNK_SIZE, HOUR_SCORES_BATCH_SIZE, plan_batch
+
+
+class Command(BaseCommand):
+    help = "Пакетный расчёт всех (или выбранных) планов потоком, кусками фиксированного размера"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--plan", type=int, action="append", dest="plans", help="ID плана (можно несколько раз)")
+        parser.add_argument("--user", help="Только планы этого пользователя (username)")
+        parser.add_argument("--chunk-size", type=int, default=BATCH_CHUNK_SIZE, help="Планов в куске")
+        parser.add_argument("--batch-size", type=int, default=HOUR_SCORES_BATCH_SIZE, help="Строк в одном INSERT")
+        parser.add_argument("--cached-forecast", action="store_true", help="Прогноз только из кэша, без запросов к провайдеру")
+
+    def handle(self, *args, **options):
+        if options["chunk_size"] <= 0 or options["batch_size"] <= 0:
+            raise CommandError("--chunk-size и --batch-size должны быть больше 0.")
+
+        plans = SessionRequest.objects.all()
+        if options["plans"]:
+            plans = plans.filter(pk__in=options["plans"])
+        if options["user"]:
+            plans = plans.filter(user__username=options["user"])
+
+        started = time.monotonic()
+        planned, failed, busy = 0, [], []
+        for progress in plan_batch(
+            plans,
+            chunk_size=options["chunk_size"],
+            batch_size=options["batch_size"],
+            cached_forecast=options["cached_forecast"],
+        ):
+            planned += progress.planned
+            failed += progress.failed
+            busy += progress.busy
+            self.stderr.write(f"Рассчитано планов: {planned}, с ошибками: {len(failed)}, занято: {len(busy)}")
+
+        self.stdout.write(self.style.SUCCESS(f"Готово: {planned} планов за {time.monotonic() - started:.1f} с"))
+        if failed:
+            self.stderr.write(f"Ошибки расчёта планов: {', '.join(map(str, failed))}")
+        if busy:
+            self.stderr.write(f"Пропущены (уже считаются в другом запросе): {', '.join(map(str, busy))}")
@@ -0,0 +1,33 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from planner.services.result_cache import cache_stats, evict
+
+
+class Command(BaseCommand):
+    help = "Статистика кэша результатов расчёта (PlanResult) и ручное вытеснение"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--evict",
+            type=int,
+            nargs="?",
+            const=settings.PLANNER_PLAN_CACHE_MAX_ENTRIES,
+            default=None,
+            metavar="MAX_ENTRIES",
+            help="Вытеснить неиспользуемые записи сверх MAX_ENTRIES (по умолчанию PLANNER_PLAN_CACHE_MAX_ENTRIES)",
+        )
+
+    def handle(self, *args, **options):
+        if options["evict"] is not None:
+            if options["evict"] < 0:
+                raise CommandError("MAX_ENTRIES не может быть отрицательным.")
+            deleted = evict(options["evict"])
+            self.stdout.write(self.style.SUCCESS(f"Вытеснено записей: {deleted}"))
+
+        stats = cache_stats()
+        self.stdout.write(
+            f"Записей: {stats.entries} (используются планами: {stats.referenced}), "
+            f"{stats.bytes / 1024:.0f} КБ\n"
+            f"Попаданий: {stats.hits}, промахов: {stats.misses}, hit rate: {stats.hit_rate:.1%}"
+        )
@@ -0,0 +1,37 @@
+import datetime as dt
+import json
+from pathlib import Path
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from planner.models import Location
+from planner.services.open_meteo import OpenMeteoProvider
+from planner.services.weather import FORECAST_HORIZON_DAYS
+
+
+class Command(BaseCommand):
+    help = "Записывает ответы Open-Meteo для локаций в NDJSON (для ReplayProvider)"
+
+    def add_arguments(self, parser):
+        parser.add_argument("-o", "--output", type=Path, required=True, help="Файл .ndjson (дописывается)")
+        parser.add_argument("--location", type=int, action="append", dest="locations", help="ID локации (можно несколько раз)")
+        parser.add_argument("--days", type=int, default=7, help=f"Дней прогноза от сегодня (до {FORECAST_HORIZON_DAYS})")
+
+    def handle(self, *args, **options):
+        locations = Location.objects.order_by("pk")
+        if options["locations"]:
+            locations = locations.filter(pk__in=options["locations"])
+
+        date_from = timezone.localdate()
+        date_to = date_from + dt.timedelta(days=min(options["days"], FORECAST_HORIZON_DAYS) - 1)
+        provider = OpenMeteoProvider()
+
+        written = 0
+        with open(options["output"], "a", encoding="utf-8") as f:
+            for location in locations.iterator():
+                data = provider.fetch(location, date_from, date_to)
+                f.write(json.dumps(data, separators=(",", ":")) + "\n")
+                written += 1
+
+        self.stdout.write(self.style.SUCCESS(f"Записано ответов: {written} → {options['output']}"))
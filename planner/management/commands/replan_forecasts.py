@@ -0,0 +1,62 @@
+import logging
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from planner.services.replanning import CLOUD_CHANGE_THRESHOLD, PRECIP_CHANGE_THRESHOLD, replan_changed
+
+logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    help = "Обновляет прогноз по расписанию и пересчитывает только планы, задетые изменениями"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--interval",
+            type=int,
+            default=settings.PLANNER_FORECAST_REFRESH_MINUTES,
+            help="Минут между циклами (≈ частота обновления моделей прогноза)",
+        )
+        parser.add_argument("--once", action="store_true", help="Один цикл и выход (для cron)")
+        parser.add_argument("--cloud-threshold", type=float, default=CLOUD_CHANGE_THRESHOLD, help="Порог изменения облачности, п.п.")
+        parser.add_argument("--precip-threshold", type=float, default=PRECIP_CHANGE_THRESHOLD, help="Порог изменения осадков, мм")
+        parser.add_argument("--dry-run", action="store_true", help="Только показать, какие планы были бы пересчитаны")
+
+    def handle(self, *args, **options):
+        if options["interval"] <= 0:
+            raise CommandError("--interval должен быть больше 0.")
+
+        while True:
+            started = time.monotonic()
+            try:
+                self._cycle(options, started)
+            except Exception as e:
+                # Упавший цикл (БД, неожиданный ответ провайдера) не останавливает демон — ждём следующего
+                if options["once"]:
+                    raise CommandError(f"Цикл обновления прогноза не удался: {e}") from e
+                logger.exception("Цикл обновления прогноза не удался")
+                self.stderr.write(f"Цикл не удался: {e}; следующий — через {options['interval']} мин")
+
+            if options["once"]:
+                return
+            time.sleep(max(0.0, options["interval"] * 60 - (time.monotonic() - started)))
+
+    def _cycle(self, options, started: float) -> None:
+        result = replan_changed(
+            cloud_threshold=options["cloud_threshold"],
+            precip_threshold=options["precip_threshold"],
+            dry_run=options["dry_run"],
+        )
+
+        verb = "к пересчёту" if options["dry_run"] else "пересчитано"
+        line = (
+            f"Локаций: {result.locations}, с изменениями: {result.changed_locations}; "
+            f"планов {verb}: {len(result.replanned)} за {time.monotonic() - started:.1f} с"
+        )
+        self.stdout.write(self.style.SUCCESS(line))
+        if result.failed_locations:
+            self.stderr.write(f"Прогноз не загрузился для локаций: {', '.join(map(str, result.failed_locations))}")
+        if result.failed:
+            self.stderr.write(f"Ошибки расчёта планов: {', '.join(map(str, result.failed))}")
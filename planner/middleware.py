@@ -0,0 +1,140 @@
+import logging
+import random
+import re
+import time
+from collections import Counter
+from dataclasses import dataclass, field
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.db import connections
+
+logger = logging.getLogger("planner.queries")
+
+# Списки параметров IN (%s, %s, ...) разной длины — одна и та же форма запроса
+_IN_LIST = re.compile(r"\((?:%s, )*%s\)")
+
+
+def query_shape(sql: str) -> str:
+    """
+    Форма запроса без параметров: одинаковые формы в одном запросе — признак N+1
+    """
+    return _IN_LIST.sub("(...)", sql)
+
+
+@dataclass
+class QueryStats:
+    view_name: str = ""
+    count: int = 0
+    seconds: float = 0.0
+    budget: int | None = None
+    shapes: Counter = field(default_factory=Counter)
+
+    def record(self, sql: str, seconds: float) -> None:
+        self.count += 1
+        self.seconds += seconds
+        self.shapes[query_shape(sql)] += 1
+
+    def wrapper(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.record(sql, time.perf_counter() - started)
+
+    def repeated(self, threshold: int) -> list[tuple[str, int]]:
+        return [(shape, n) for shape, n in self.shapes.most_common() if n >= threshold]
+
+    @property
+    def over_budget(self) -> bool:
+        return self.budget is not None and self.count > self.budget
+
+
+class QueryBudgetMiddleware:
+    """
+    Считает SQL-запросы и время БД на запрос, сверяет с бюджетом вьюхи
+    (PLANNER_QUERY_BUDGETS по имени URL) и пишет в лог planner.queries
+    превышения и повторяющиеся формы запросов.
+    В проде включается выборочно: PLANNER_QUERY_SAMPLE_RATE — доля проверяемых запросов.
+    Запросы, выполняемые при итерации StreamingHttpResponse, не учитываются
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        # Под ASGI не переключаемся в поток: sync-only middleware сериализует async-вьюхи
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+
+        stats = self._start(request)
+        if stats is None:
+            return self.get_response(request)
+        with _wrap_all(stats.wrapper):
+            response = self.get_response(request)
+        self._finish(request, stats)
+        return response
+
+    async def __acall__(self, request):
+        stats = self._start(request)
+        if stats is None:
+            return await self.get_response(request)
+        # Async ORM выполняет запросы в потоке sync_to_async, а у него свои подключения:
+        # обёртку ставим там же, а не в потоке event loop
+        wrap = _wrap_all(stats.wrapper)
+        await sync_to_async(wrap.__enter__)()
+        try:
+            response = await self.get_response(request)
+        finally:
+            await sync_to_async(wrap.__exit__)(None, None, None)
+        self._finish(request, stats)
+        return response
+
+    @staticmethod
+    def _start(request) -> QueryStats | None:
+        if random.random() >= getattr(settings, "PLANNER_QUERY_SAMPLE_RATE", 0.0):
+            return None
+        request.query_stats = QueryStats()
+        return request.query_stats
+
+    def _finish(self, request, stats: QueryStats) -> None:
+        match = request.resolver_match
+        stats.view_name = (match.view_name if match else "") or request.path
+        budgets = getattr(settings, "PLANNER_QUERY_BUDGETS", {})
+        stats.budget = budgets.get(stats.view_name, getattr(settings, "PLANNER_QUERY_BUDGET_DEFAULT", None))
+        self._report(stats)
+
+    @staticmethod
+    def _report(stats: QueryStats) -> None:
+        if stats.over_budget:
+            logger.warning(
+                "%s: %d SQL-запросов при бюджете %d (%.1f мс в БД)",
+                stats.view_name, stats.count, stats.budget, stats.seconds * 1000,
+            )
+        for shape, n in stats.repeated(getattr(settings, "PLANNER_QUERY_REPEAT_THRESHOLD", 5)):
+            logger.warning("%s: запрос повторён %d раз (N+1?): %s", stats.view_name, n, shape)
+        logger.debug("%s: %d SQL-запросов, %.1f мс в БД", stats.view_name, stats.count, stats.seconds * 1000)
+
+
+class _wrap_all:
+    """
+    execute_wrapper сразу на все подключения из DATABASES — подключения потока, вызвавшего __enter__
+    """
+
+    def __init__(self, wrapper):
+        self._wrapper = wrapper
+        self._contexts = []
+
+    def __enter__(self):
+        self._contexts = [connections[alias].execute_wrapper(self._wrapper) for alias in connections]
+        for ctx in self._contexts:
+            ctx.__enter__()
+
+    def __exit__(self, *exc):
+        for ctx in reversed(self._contexts):
+            ctx.__exit__(*exc)
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.10 on 2026-10-19 04:48
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('planner', '0002_planhourscore'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='astrowindow',
+            name='avg_cloud_cover',
+            field=models.PositiveSmallIntegerField(blank=True, default=0, help_text='Пусто — окно за горизонтом прогноза', null=True, verbose_name='Средняя облачность (%)'),
+        ),
+        migrations.AlterField(
+            model_name='planhourscore',
+            name='cloud_cover',
+            field=models.IntegerField(blank=True, null=True),
+        ),
+    ]
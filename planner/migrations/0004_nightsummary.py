@@ -0,0 +1,38 @@
+# Generated by Django 5.2.10 on 2026-10-19 04:49
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('planner', '0003_nullable_cloud_cover'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='NightSummary',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('night', models.DateField(verbose_name='Ночь (дата вечера)')),
+                ('best_score', models.FloatField(verbose_name='Лучший score')),
+                ('dark_hours', models.PositiveSmallIntegerField(default=0, verbose_name='Часов астрономической ночи')),
+                ('usable_hours', models.PositiveSmallIntegerField(default=0, verbose_name='Подходящих часов')),
+                ('moon_illumination', models.FloatField(default=0, verbose_name='Освещённость Луны (0..1)')),
+                ('has_forecast', models.BooleanField(default=True, verbose_name='Есть прогноз погоды')),
+                ('windows_count', models.PositiveSmallIntegerField(default=0, verbose_name='Окон')),
+                ('best_window_start', models.DateTimeField(blank=True, null=True, verbose_name='Начало лучшего окна')),
+                ('best_window_end', models.DateTimeField(blank=True, null=True, verbose_name='Конец лучшего окна')),
+                ('best_window_score', models.FloatField(blank=True, null=True, verbose_name='Score лучшего окна')),
+                ('plan', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='night_summaries', to='planner.sessionrequest', verbose_name='План')),
+            ],
+            options={
+                'verbose_name': 'Свод по ночи',
+                'verbose_name_plural': 'Своды по ночам',
+                'ordering': ['night'],
+                'indexes': [models.Index(fields=['night'], name='night_summary_night_idx')],
+                'constraints': [models.UniqueConstraint(fields=('plan', 'night'), name='uniq_night_summary_plan_night')],
+            },
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 5.2.10 on 2026-10-19 04:50
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('planner', '0004_nightsummary'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='forecasthour',
+            index=models.Index(fields=['timestamp'], name='forecast_timestamp_idx'),
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 5.2.10 on 2026-10-19 04:52
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('planner', '0005_forecast_timestamp_index'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='astrowindow',
+            index=models.Index(fields=['start_time'], name='astro_window_start_idx'),
+        ),
+    ]
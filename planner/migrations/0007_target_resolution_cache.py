@@ -0,0 +1,33 @@
+# Generated by Django 5.2.10 on 2026-10-19 04:56
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('planner', '0006_astrowindow_start_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='target',
+            name='body',
+            field=models.CharField(blank=True, default='', editable=False, max_length=16, verbose_name='Тело для эфемерид'),
+        ),
+        migrations.AddField(
+            model_name='target',
+            name='catalog_id',
+            field=models.CharField(blank=True, default='', editable=False, max_length=32, verbose_name='Объект каталога'),
+        ),
+        migrations.AddField(
+            model_name='target',
+            name='icrs_dec_deg',
+            field=models.FloatField(blank=True, editable=False, null=True, verbose_name='Dec ICRS (°)'),
+        ),
+        migrations.AddField(
+            model_name='target',
+            name='icrs_ra_deg',
+            field=models.FloatField(blank=True, editable=False, null=True, verbose_name='RA ICRS (°)'),
+        ),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 5.2.10 on 2026-10-19 05:03
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('planner', '0007_target_resolution_cache'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RunLock',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('key', models.CharField(max_length=200, unique=True, verbose_name='Ключ')),
+                ('token', models.CharField(blank=True, default='', max_length=32, verbose_name='Токен владельца')),
+                ('started_at', models.DateTimeField(blank=True, null=True, verbose_name='Начало')),
+                ('expires_at', models.DateTimeField(blank=True, null=True, verbose_name='Истекает')),
+                ('finished_at', models.DateTimeField(blank=True, null=True, verbose_name='Завершено')),
+                ('succeeded', models.BooleanField(default=False, verbose_name='Успешно')),
+            ],
+            options={
+                'verbose_name': 'Блокировка расчёта',
+                'verbose_name_plural': 'Блокировки расчётов',
+            },
+        ),
+    ]
@@ -0,0 +1,35 @@
+# Generated by Django 5.2.10 on 2026-10-19 05:11
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('planner', '0008_runlock'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PlanResult',
+            fields=[
+                ('key', models.CharField(max_length=64, primary_key=True, serialize=False, verbose_name='Ключ (sha256)')),
+                ('data', models.BinaryField(verbose_name='Почасовые ряды (npz)')),
+                ('hours', models.PositiveIntegerField(default=0, verbose_name='Часов')),
+                ('hits', models.PositiveIntegerField(default=0, verbose_name='Попаданий')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='Создано')),
+                ('last_used_at', models.DateTimeField(auto_now_add=True, verbose_name='Последнее использование')),
+            ],
+            options={
+                'verbose_name': 'Кэш результата расчёта',
+                'verbose_name_plural': 'Кэш результатов расчёта',
+                'indexes': [models.Index(fields=['last_used_at'], name='plan_result_last_used_idx')],
+            },
+        ),
+        migrations.AddField(
+            model_name='sessionrequest',
+            name='result',
+            field=models.ForeignKey(blank=True, editable=False, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='plans', to='planner.planresult', verbose_name='Результат расчёта'),
+        ),
+    ]
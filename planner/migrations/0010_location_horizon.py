@@ -0,0 +1,18 @@
+# Generated by Django 5.2.10 on 2026-10-19 05:19
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('planner', '0009_plan_result_cache'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='location',
+            name='horizon',
+            field=models.BinaryField(blank=True, null=True, verbose_name='Профиль горизонта'),
+        ),
+    ]
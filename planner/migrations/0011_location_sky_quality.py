@@ -0,0 +1,18 @@
+# Generated by Django 5.2.10 on 2026-10-19 05:21
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('planner', '0010_location_horizon'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='location',
+            name='sky_quality',
+            field=models.FloatField(blank=True, editable=False, null=True, verbose_name='Яркость неба, mag/arcsec²'),
+        ),
+    ]
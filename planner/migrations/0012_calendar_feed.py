@@ -0,0 +1,38 @@
+# Generated by Django 5.2.10 on 2026-10-19 05:26
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('planner', '0011_location_sky_quality'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CalendarFeed',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('token', models.CharField(max_length=64, unique=True, verbose_name='Токен')),
+                ('changed_at', models.DateTimeField(verbose_name='Окна изменены')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='Создано')),
+            ],
+            options={
+                'verbose_name': 'Лента календаря',
+                'verbose_name_plural': 'Ленты календаря',
+            },
+        ),
+        migrations.AddIndex(
+            model_name='astrowindow',
+            index=models.Index(fields=['plan', 'end_time'], name='astro_window_plan_end_idx'),
+        ),
+        migrations.AddField(
+            model_name='calendarfeed',
+            name='user',
+            field=models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='calendar_feed', to=settings.AUTH_USER_MODEL, verbose_name='Пользователь'),
+        ),
+    ]
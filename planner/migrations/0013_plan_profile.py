@@ -0,0 +1,37 @@
+# Generated by Django 5.2.10 on 2026-10-19 05:29
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('planner', '0012_calendar_feed'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='sessionrequest',
+            name='profile_next_run',
+            field=models.BooleanField(default=False, editable=False, verbose_name='Профилировать следующий расчёт'),
+        ),
+        migrations.CreateModel(
+            name='PlanProfile',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('mode', models.CharField(choices=[('cprofile', 'cProfile'), ('sample', 'Семплирование')], max_length=16, verbose_name='Профайлер')),
+                ('requested_by', models.CharField(blank=True, default='', max_length=150, verbose_name='Кто запросил')),
+                ('duration_ms', models.PositiveIntegerField(default=0, verbose_name='Длительность (мс)')),
+                ('data', models.BinaryField(verbose_name='Трасса')),
+                ('summary', models.TextField(blank=True, default='', verbose_name='Сводка')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='Создано')),
+                ('plan', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='profiles', to='planner.sessionrequest', verbose_name='План')),
+            ],
+            options={
+                'verbose_name': 'Профиль расчёта',
+                'verbose_name_plural': 'Профили расчётов',
+                'ordering': ['-created_at'],
+            },
+        ),
+    ]
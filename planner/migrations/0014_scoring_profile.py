@@ -0,0 +1,45 @@
+# Generated by Django 5.2.10 on 2026-10-19 05:32
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('planner', '0013_plan_profile'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ScoringProfile',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=120, verbose_name='Название')),
+                ('cloud_weight', models.FloatField(default=0.8, verbose_name='Штраф за 1% облачности')),
+                ('precipitation_penalty', models.FloatField(default=15.0, verbose_name='Штраф за осадки')),
+                ('dark_bonus', models.FloatField(default=10.0, verbose_name='Бонус за астрономическую ночь')),
+                ('twilight_penalty', models.FloatField(default=5.0, verbose_name='Штраф за сумерки и день')),
+                ('altitude_weight', models.FloatField(default=0.7, verbose_name='Бонус за 1° высоты над минимумом')),
+                ('altitude_bonus_max', models.FloatField(default=20.0, verbose_name='Максимальный бонус за высоту')),
+                ('low_altitude_penalty', models.FloatField(default=30.0, verbose_name='Штраф, если цель ниже минимума')),
+                ('moon_weight', models.FloatField(default=40.0, help_text='Умножается на фазу и высоту Луны (полная Луна в зените — весь штраф)', verbose_name='Штраф за Луну')),
+                ('light_pollution_weight', models.FloatField(default=1.0, verbose_name='Множитель штрафа за засветку')),
+                ('extra_term', models.TextField(blank=True, default='', help_text='Выражение над рядами часа, например: -20 * (moon_illum > 0.5) * (moon_alt > 0)', verbose_name='Дополнительное слагаемое')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='Создано')),
+                ('owner', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='scoring_profiles', to=settings.AUTH_USER_MODEL, verbose_name='Владелец')),
+            ],
+            options={
+                'verbose_name': 'Профиль оценки',
+                'verbose_name_plural': 'Профили оценки',
+                'ordering': ['name'],
+            },
+        ),
+        migrations.AddField(
+            model_name='sessionrequest',
+            name='scoring_profile',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='plans', to='planner.scoringprofile', verbose_name='Профиль оценки'),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.10 on 2026-10-19 05:36
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('planner', '0014_scoring_profile'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='forecasthour',
+            name='ensemble',
+            field=models.BinaryField(blank=True, null=True, verbose_name='Ансамбль моделей'),
+        ),
+        migrations.AddField(
+            model_name='scoringprofile',
+            name='clear_weight',
+            field=models.FloatField(default=10.0, help_text='Умножается на долю моделей, не обещающих ясное небо (только в режиме ансамбля)', verbose_name='Штраф за неуверенность ансамбля'),
+        ),
+    ]
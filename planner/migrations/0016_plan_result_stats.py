@@ -0,0 +1,37 @@
+# Generated by Django 5.2.10 on 2026-10-19 06:21
+
+from django.db import migrations, models
+from django.db.models import Count, Sum
+
+
+def seed_stats(apps, schema_editor):
+    # Начальные счётчики — по уцелевшим записям, как считался hit rate раньше
+    PlanResult = apps.get_model("planner", "PlanResult")
+    PlanResultStats = apps.get_model("planner", "PlanResultStats")
+    totals = PlanResult.objects.aggregate(entries=Count("key"), hits=Sum("hits"))
+    if totals["entries"]:
+        PlanResultStats.objects.create(pk=1, hits=totals["hits"] or 0, misses=totals["entries"])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('planner', '0015_weather_ensemble'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PlanResultStats',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('hits', models.PositiveBigIntegerField(default=0, verbose_name='Попаданий')),
+                ('misses', models.PositiveBigIntegerField(default=0, verbose_name='Промахов')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='Считается с')),
+            ],
+            options={
+                'verbose_name': 'Статистика кэша результатов',
+                'verbose_name_plural': 'Статистика кэша результатов',
+            },
+        ),
+        migrations.RunPython(seed_stats, migrations.RunPython.noop),
+    ]
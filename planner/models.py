@@ -1,6 +1,8 @@
 from django.conf import settings
 from django.db import models
 
+from planner.services.catalog import resolve_target
+
 
 class Location(models.Model):
     """
@@ -11,6 +13,10 @@ class Location(models.Model):
     latitude = models.DecimalField("Широта", max_digits=8, decimal_places=5)
     longitude = models.DecimalField("Долгота", max_digits=8, decimal_places=5)
     timezone = models.CharField("Часовой пояс", max_length=64, default="UTC")
+    # Профиль горизонта: 360 × uint8, высота препятствий на каждый градус азимута (services.horizon)
+    horizon = models.BinaryField("Профиль горизонта", null=True, blank=True, editable=False)
+    # Яркость неба по растру засветки (services.sky_quality), заполняет save() по координатам
+    sky_quality = models.FloatField("Яркость неба, mag/arcsec²", null=True, blank=True, editable=False)
     owner = models.ForeignKey(
         settings.AUTH_USER_MODEL,
         on_delete=models.CASCADE,
@@ -28,6 +34,26 @@ class Location(models.Model):
     def __str__(self) -> str:
         return f"{self.name} ({self.latitude}, {self.longitude})"
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._saved_coords = (instance.__dict__.get("latitude"), instance.__dict__.get("longitude"))
+        return instance
+
+    def save(self, *args, **kwargs):
+        # Яркость неба ищем заново, только если локация сдвинулась (или значения ещё нет):
+        # правка в админке и shell не оставит скорингу засветку старого места
+        coords = (self.latitude, self.longitude)
+        if self.sky_quality is None or coords != getattr(self, "_saved_coords", None):
+            # services.sky_quality сам импортирует модели — берём функцию при вызове
+            from planner.services.sky_quality import sky_quality
+
+            self.sky_quality = sky_quality(*coords)
+            if kwargs.get("update_fields") is not None:
+                kwargs["update_fields"] = {*kwargs["update_fields"], "sky_quality"}
+        super().save(*args, **kwargs)
+        self._saved_coords = coords
+
 
 class Target(models.Model):
     """
@@ -60,6 +86,13 @@ class Target(models.Model):
         blank=True,
     )
 
+    # Результат разрешения цели (заполняет save() по каталогу):
+    # планировщик берёт готовые ICRS-координаты или тело и не ищет имя заново
+    catalog_id = models.CharField("Объект каталога", max_length=32, blank=True, default="", editable=False)
+    body = models.CharField("Тело для эфемерид", max_length=16, blank=True, default="", editable=False)
+    icrs_ra_deg = models.FloatField("RA ICRS (°)", null=True, blank=True, editable=False)
+    icrs_dec_deg = models.FloatField("Dec ICRS (°)", null=True, blank=True, editable=False)
+
     owner = models.ForeignKey(
         settings.AUTH_USER_MODEL,
         on_delete=models.CASCADE,
@@ -74,14 +107,90 @@ class Target(models.Model):
         verbose_name_plural = "Цели"
         ordering = ["-created_at"]
 
+    RESOLUTION_FIELDS = ("catalog_id", "body", "icrs_ra_deg", "icrs_dec_deg")
+
     def __str__(self) -> str:
         return f"{self.name} ({self.target_type})"
 
+    def resolve(self) -> None:
+        """
+        Кэш разрешения по названию, типу и RA/Dec; цель не распознана — кэш пустой
+        """
+        try:
+            resolved = resolve_target(self.name, self.target_type, self.right_ascension, self.declination)
+        except ValueError:
+            resolved = None
+        self.catalog_id = resolved.catalog_id if resolved else ""
+        self.body = resolved.body if resolved else ""
+        self.icrs_ra_deg = resolved.ra_deg if resolved else None
+        self.icrs_dec_deg = resolved.dec_deg if resolved else None
+
+    def save(self, *args, **kwargs):
+        # Кэш пересчитывается при каждой записи: правка RA/Dec или типа в админке и shell
+        # не оставит планировщику старых координат
+        self.resolve()
+        if kwargs.get("update_fields") is not None:
+            kwargs["update_fields"] = {*kwargs["update_fields"], *self.RESOLUTION_FIELDS}
+        super().save(*args, **kwargs)
+
+
+class ScoringProfile(models.Model):
+    """
+    Веса слагаемых score (planner.services.scoring): стандартные значения — формула по умолчанию.
+    Узкополосной съёмке Луна почти не мешает — ей хватает moon_weight около нуля и т.п.
+    """
+    name = models.CharField("Название", max_length=120)
+
+    cloud_weight = models.FloatField("Штраф за 1% облачности", default=0.8)
+    precipitation_penalty = models.FloatField("Штраф за осадки", default=15.0)
+    dark_bonus = models.FloatField("Бонус за астрономическую ночь", default=10.0)
+    twilight_penalty = models.FloatField("Штраф за сумерки и день", default=5.0)
+    altitude_weight = models.FloatField("Бонус за 1° высоты над минимумом", default=0.7)
+    altitude_bonus_max = models.FloatField("Максимальный бонус за высоту", default=20.0)
+    low_altitude_penalty = models.FloatField("Штраф, если цель ниже минимума", default=30.0)
+    moon_weight = models.FloatField(
+        "Штраф за Луну",
+        default=40.0,
+        help_text="Умножается на фазу и высоту Луны (полная Луна в зените — весь штраф)",
+    )
+    light_pollution_weight = models.FloatField("Множитель штрафа за засветку", default=1.0)
+    clear_weight = models.FloatField(
+        "Штраф за неуверенность ансамбля",
+        default=10.0,
+        help_text="Умножается на долю моделей, не обещающих ясное небо (только в режиме ансамбля)",
+    )
+    extra_term = models.TextField(
+        "Дополнительное слагаемое",
+        blank=True,
+        default="",
+        help_text="Выражение над рядами часа, например: -20 * (moon_illum > 0.5) * (moon_alt > 0)",
+    )
+
+    owner = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        related_name="scoring_profiles",
+        verbose_name="Владелец",
+    )
+
+    created_at = models.DateTimeField("Создано", auto_now_add=True)
+
+    class Meta:
+        verbose_name = "Профиль оценки"
+        verbose_name_plural = "Профили оценки"
+        ordering = ["name"]
+
+    def __str__(self) -> str:
+        return self.name
+
 
 class SessionRequest(models.Model):
     """
     План съёмки: пользователь выбирает локацию + цель и ограничения для расчёта
     """
+    # Дальше горизонта прогноза план считается только по астрономии
+    MAX_PERIOD_DAYS = 366
+
     user = models.ForeignKey(
         settings.AUTH_USER_MODEL,
         on_delete=models.CASCADE,
@@ -119,6 +228,30 @@ class SessionRequest(models.Model):
         default=True,
     )
 
+    # Пусто — стандартная формула score
+    scoring_profile = models.ForeignKey(
+        ScoringProfile,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name="plans",
+        verbose_name="Профиль оценки",
+    )
+
+    # Из какого кэшированного результата взяты текущие часы плана (см. PlanResult)
+    result = models.ForeignKey(
+        "PlanResult",
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        editable=False,
+        related_name="plans",
+        verbose_name="Результат расчёта",
+    )
+
+    # Отладка медленных планов: следующий расчёт (с кнопки, фоновый пересчёт) пишет PlanProfile
+    profile_next_run = models.BooleanField("Профилировать следующий расчёт", default=False, editable=False)
+
     created_at = models.DateTimeField("Создано", auto_now_add=True)
 
     class Meta:
@@ -155,6 +288,9 @@ class ForecastHour(models.Model):
         default=0,
         help_text="Единицы зависят от API (обычно метры)",
     )
+    # Ансамбль моделей (planner.services.weather.pack_ensemble): облачность uint8 на модель,
+    # затем осадки uint16 в 0.01 мм; пусто — прогноз одной модели
+    ensemble = models.BinaryField("Ансамбль моделей", null=True, blank=True, editable=False)
 
     source = models.CharField("Источник", max_length=64, default="open-meteo")
     created_at = models.DateTimeField("Создано", auto_now_add=True)
@@ -169,6 +305,10 @@ class ForecastHour(models.Model):
                 name="uniq_forecast_location_timestamp",
             )
         ]
+        indexes = [
+            # Срез по времени без локации: compact_history и date_hierarchy в админке
+            models.Index(fields=["timestamp"], name="forecast_timestamp_idx"),
+        ]
 
     def __str__(self) -> str:
         return f"{self.location.name} — {self.timestamp}"
@@ -190,7 +330,13 @@ class AstroWindow(models.Model):
 
     score = models.DecimalField("Оценка", max_digits=6, decimal_places=2)
 
-    avg_cloud_cover = models.PositiveSmallIntegerField("Средняя облачность (%)", default=0)
+    avg_cloud_cover = models.PositiveSmallIntegerField(
+        "Средняя облачность (%)",
+        null=True,
+        blank=True,
+        default=0,
+        help_text="Пусто — окно за горизонтом прогноза",
+    )
     moon_illumination = models.DecimalField(
         "Освещённость Луны (0..1)",
         max_digits=4,
@@ -211,6 +357,11 @@ class AstroWindow(models.Model):
         verbose_name = "Окно съёмки"
         verbose_name_plural = "Окна съёмки"
         ordering = ["-score", "start_time"]
+        indexes = [
+            models.Index(fields=["start_time"], name="astro_window_start_idx"),
+            # Лента календаря: ближайшие окна по планам пользователя
+            models.Index(fields=["plan", "end_time"], name="astro_window_plan_end_idx"),
+        ]
 
     def __str__(self) -> str:
         return f"Окно {self.start_time} — {self.end_time} (score={self.score})"
@@ -223,7 +374,7 @@ class PlanHourScore(models.Model):
     )
     timestamp = models.DateTimeField(db_index=True)
     score = models.FloatField()
-    cloud_cover = models.IntegerField()
+    cloud_cover = models.IntegerField(null=True, blank=True)  # None — нет прогноза на этот час
     moon_illumination = models.FloatField()
     target_altitude = models.FloatField()
     is_astronomical_dark = models.BooleanField(default=False)
@@ -234,3 +385,167 @@ class PlanHourScore(models.Model):
 
     def __str__(self):
         return f"{self.plan_id} {self.timestamp} score={self.score:.1f}"
+
+
+class NightSummary(models.Model):
+    """
+    Свод по одной ночи плана (материализуется в run_planning).
+    Ночь — с полудня до полудня по часовому поясу локации, датой вечера.
+    Список планов и календарь читают только эту таблицу, без PlanHourScore
+    """
+    plan = models.ForeignKey(
+        SessionRequest,
+        on_delete=models.CASCADE,
+        related_name="night_summaries",
+        verbose_name="План",
+    )
+    night = models.DateField("Ночь (дата вечера)")
+
+    best_score = models.FloatField("Лучший score")
+    dark_hours = models.PositiveSmallIntegerField("Часов астрономической ночи", default=0)
+    usable_hours = models.PositiveSmallIntegerField("Подходящих часов", default=0)
+    moon_illumination = models.FloatField("Освещённость Луны (0..1)", default=0)
+    has_forecast = models.BooleanField("Есть прогноз погоды", default=True)
+
+    windows_count = models.PositiveSmallIntegerField("Окон", default=0)
+    best_window_start = models.DateTimeField("Начало лучшего окна", null=True, blank=True)
+    best_window_end = models.DateTimeField("Конец лучшего окна", null=True, blank=True)
+    best_window_score = models.FloatField("Score лучшего окна", null=True, blank=True)
+
+    class Meta:
+        verbose_name = "Свод по ночи"
+        verbose_name_plural = "Своды по ночам"
+        ordering = ["night"]
+        constraints = [
+            models.UniqueConstraint(
+                fields=["plan", "night"],
+                name="uniq_night_summary_plan_night",
+            )
+        ]
+        indexes = [
+            models.Index(fields=["night"], name="night_summary_night_idx"),
+        ]
+
+    def __str__(self) -> str:
+        return f"{self.plan_id} {self.night} best={self.best_score:.1f}"
+
+
+class RunLock(models.Model):
+    """
+    Межпроцессная блокировка «один расчёт на ключ» (planner.services.locks.single_flight).
+    token непустой — расчёт идёт, после завершения остаются время и итог последнего прогона,
+    по ним ожидающие забирают результат. Отработавшие строки удаляет compact_history (locks.purge_run_locks)
+    """
+    key = models.CharField("Ключ", max_length=200, unique=True)
+    token = models.CharField("Токен владельца", max_length=32, blank=True, default="")
+    started_at = models.DateTimeField("Начало", null=True, blank=True)
+    expires_at = models.DateTimeField("Истекает", null=True, blank=True)
+    finished_at = models.DateTimeField("Завершено", null=True, blank=True)
+    succeeded = models.BooleanField("Успешно", default=False)
+
+    class Meta:
+        verbose_name = "Блокировка расчёта"
+        verbose_name_plural = "Блокировки расчётов"
+
+    def __str__(self) -> str:
+        return f"{self.key} {'занят' if self.token else 'свободен'}"
+
+
+class PlanResult(models.Model):
+    """
+    Кэш результатов расчёта по содержимому входа: ключ — хэш нормализованных координат,
+    цели, периода, порогов и прогноза. Одинаковые планы (у разных пользователей,
+    пересозданные) берут готовые часы отсюда вместо расчёта эфемерид.
+    Записи без ссылающихся планов вытесняются по давности использования
+    """
+    key = models.CharField("Ключ (sha256)", max_length=64, primary_key=True)
+    data = models.BinaryField("Почасовые ряды (npz)")
+    hours = models.PositiveIntegerField("Часов", default=0)
+    hits = models.PositiveIntegerField("Попаданий", default=0)
+    created_at = models.DateTimeField("Создано", auto_now_add=True)
+    last_used_at = models.DateTimeField("Последнее использование", auto_now_add=True)
+
+    class Meta:
+        verbose_name = "Кэш результата расчёта"
+        verbose_name_plural = "Кэш результатов расчёта"
+        indexes = [
+            models.Index(fields=["last_used_at"], name="plan_result_last_used_idx"),
+        ]
+
+    def __str__(self) -> str:
+        return f"{self.key[:12]} hits={self.hits}"
+
+
+class PlanResultStats(models.Model):
+    """
+    Счётчики кэша PlanResult за всё время (одна строка): записи вытесняются вместе
+    со своими hits, а эти счётчики — нет, поэтому hit rate не завышается после вытеснения
+    """
+    hits = models.PositiveBigIntegerField("Попаданий", default=0)
+    misses = models.PositiveBigIntegerField("Промахов", default=0)
+    created_at = models.DateTimeField("Считается с", auto_now_add=True)
+
+    class Meta:
+        verbose_name = "Статистика кэша результатов"
+        verbose_name_plural = "Статистика кэша результатов"
+
+    def __str__(self) -> str:
+        return f"hits={self.hits} misses={self.misses}"
+
+
+class CalendarFeed(models.Model):
+    """
+    Подписка на окна съёмки в календаре (iCalendar) по секретной ссылке.
+    changed_at сдвигается при каждом пересчёте планов пользователя —
+    по нему строятся ETag/Last-Modified, между пересчётами лента отдаётся из кэша или 304
+    """
+    user = models.OneToOneField(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        related_name="calendar_feed",
+        verbose_name="Пользователь",
+    )
+    token = models.CharField("Токен", max_length=64, unique=True)
+    changed_at = models.DateTimeField("Окна изменены")
+    created_at = models.DateTimeField("Создано", auto_now_add=True)
+
+    class Meta:
+        verbose_name = "Лента календаря"
+        verbose_name_plural = "Ленты календаря"
+
+    def __str__(self) -> str:
+        return f"Лента {self.user}"
+
+
+class PlanProfile(models.Model):
+    """
+    Профиль одного расчёта плана (planner.services.profiling): трасса cProfile (pstats)
+    или свёрнутые стеки семплирующего профайлера (формат flamegraph.pl / speedscope)
+    """
+    MODE_CPROFILE = "cprofile"
+    MODE_SAMPLE = "sample"
+    MODE_CHOICES = [
+        (MODE_CPROFILE, "cProfile"),
+        (MODE_SAMPLE, "Семплирование"),
+    ]
+
+    plan = models.ForeignKey(
+        SessionRequest,
+        on_delete=models.CASCADE,
+        related_name="profiles",
+        verbose_name="План",
+    )
+    mode = models.CharField("Профайлер", max_length=16, choices=MODE_CHOICES)
+    requested_by = models.CharField("Кто запросил", max_length=150, blank=True, default="")
+    duration_ms = models.PositiveIntegerField("Длительность (мс)", default=0)
+    data = models.BinaryField("Трасса")
+    summary = models.TextField("Сводка", blank=True, default="")
+    created_at = models.DateTimeField("Создано", auto_now_add=True)
+
+    class Meta:
+        verbose_name = "Профиль расчёта"
+        verbose_name_plural = "Профили расчётов"
+        ordering = ["-created_at"]
+
+    def __str__(self) -> str:
+        return f"Профиль плана #{self.plan_id} ({self.mode}, {self.duration_ms} мс)"
@@ -0,0 +1,104 @@
+import csv
+import decimal
+import gzip
+from pathlib import Path
+from typing import BinaryIO, Iterable
+
+from django.db import models
+
+ARCHIVE_FORMATS = ("csv", "parquet")
+
+
+def archive_suffix(fmt: str) -> str:
+    return ".csv.gz" if fmt == "csv" else ".parquet"
+
+
+def _arrow_type(field: models.Field):
+    import pyarrow as pa
+
+    if isinstance(field, models.DateTimeField):
+        return pa.timestamp("us", tz="UTC")
+    if isinstance(field, models.DateField):
+        return pa.date32()
+    if isinstance(field, (models.FloatField, models.DecimalField)):
+        return pa.float64()
+    if isinstance(field, models.BooleanField):
+        return pa.bool_()
+    if isinstance(field, (models.IntegerField, models.AutoField, models.ForeignKey)):
+        return pa.int64()
+    if isinstance(field, models.BinaryField):
+        return pa.binary()
+    return pa.string()
+
+
+def _csv_value(value):
+    # BinaryField (ансамбль прогноза и т.п.) — hex; драйверы отдают bytes или memoryview
+    if isinstance(value, (bytes, memoryview)):
+        return bytes(value).hex()
+    return value
+
+
+class CsvArchive:
+    """
+    Построчная запись в gzip-CSV: в памяти держим только текущую пачку
+    """
+
+    def __init__(self, path: Path, model: type[models.Model], fields: list[str]):
+        self.path = path
+        self._file = gzip.open(path, "wt", newline="", encoding="utf-8")
+        self._writer = csv.writer(self._file)
+        self._writer.writerow(fields)
+        self.fields = fields
+
+    def write(self, rows: Iterable[dict]) -> None:
+        self._writer.writerows([_csv_value(row[f]) for f in self.fields] for row in rows)
+
+    def close(self) -> None:
+        self._file.close()
+
+
+class ParquetArchive:
+    """
+    Parquet по row group на пачку. Схема берётся из полей модели,
+    чтобы пачки с NULL/Decimal не расходились по типам.
+    path может быть и файловым объектом (см. export.StreamSink)
+    """
+
+    def __init__(self, path: Path | BinaryIO, model: type[models.Model], fields: list[str]):
+        try:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+        except ImportError as e:
+            raise RuntimeError("Для Parquet нужен пакет pyarrow (pip install pyarrow).") from e
+
+        self.path = path
+        self.fields = fields
+        self._pa = pa
+        self._schema = pa.schema([(f, _arrow_type(model._meta.get_field(f))) for f in fields])
+        self._writer = pq.ParquetWriter(path, self._schema, compression="zstd")
+
+    def write(self, rows: Iterable[dict]) -> None:
+        rows = list(rows)
+        if not rows:
+            return
+        columns = {f: [_arrow_value(r[f]) for r in rows] for f in self.fields}
+        self._writer.write_table(self._pa.Table.from_pydict(columns, schema=self._schema))
+
+    def close(self) -> None:
+        self._writer.close()
+
+
+def _arrow_value(value):
+    if isinstance(value, decimal.Decimal):
+        return float(value)
+    if isinstance(value, memoryview):
+        return bytes(value)
+    return value
+
+
+def open_archive(path: Path, model: type[models.Model], fields: list[str], fmt: str) -> CsvArchive | ParquetArchive:
+    if fmt == "csv":
+        return CsvArchive(path, model, fields)
+    if fmt == "parquet":
+        return ParquetArchive(path, model, fields)
+    raise ValueError(f"Неизвестный формат архива: {fmt}")
@@ -1,14 +1,28 @@
 from astropy.utils import iers
 iers.conf.auto_download = False
 iers.conf.use_network = False
+# Планы бывают на год вперёд — дальше горизонта IERS-предсказаний
+# деградируем точность до угловых секунд вместо исключения
+iers.conf.iers_degraded_accuracy = "warn"
+iers.conf.auto_max_age = None
 import datetime as dt
 from dataclasses import dataclass
+from functools import lru_cache
+from typing import Sequence
 
-from astropy.coordinates import AltAz, EarthLocation, SkyCoord, get_body, get_sun
+import numpy as np
+from astropy.coordinates import TETE, AltAz, EarthLocation, SkyCoord, get_body, get_sun
 from astropy.time import Time
 import astropy.units as u
 
 from planner.models import Location, Target
+from planner.services import ephemeris
+from planner.services.catalog import ResolvedTarget, resolve_target
+from planner.services.horizon import horizon_altitude, horizon_profile
+
+# Видимое место неподвижной точки (прецессия, нутация, аберрация) меняется медленно:
+# считаем его astropy раз в столько суток и интерполируем
+APPARENT_STEP_DAYS = 5.0
 
 
 @dataclass(frozen=True)
@@ -19,69 +33,189 @@ class HourAstro:
     target_alt_deg: float
 
 
-def _earth_location(location: Location) -> EarthLocation:
+@dataclass(frozen=True)
+class AstroSeries:
+    """
+    Астрономия для ряда часов: те же величины, что в HourAstro, но массивами numpy
+    """
+    sun_alt_deg: np.ndarray
+    moon_alt_deg: np.ndarray
+    moon_illumination: np.ndarray  # 0..1
+    target_alt_deg: np.ndarray
+    horizon_alt_deg: np.ndarray  # высота горизонта локации на азимуте цели (0 — без профиля)
+
+    def __len__(self) -> int:
+        return len(self.sun_alt_deg)
+
+    def hour(self, i: int) -> HourAstro:
+        return HourAstro(
+            sun_alt_deg=float(self.sun_alt_deg[i]),
+            moon_alt_deg=float(self.moon_alt_deg[i]),
+            moon_illumination=float(self.moon_illumination[i]),
+            target_alt_deg=float(self.target_alt_deg[i]),
+        )
+
+
+def earth_location(location: Location) -> EarthLocation:
     return EarthLocation(lat=float(location.latitude) * u.deg, lon=float(location.longitude) * u.deg)
 
 
-def _moon_illumination_fraction(time: Time) -> float:
+@lru_cache(maxsize=1024)
+def icrs_coord(ra_deg: float, dec_deg: float) -> SkyCoord:
+    return SkyCoord(ra=ra_deg * u.deg, dec=dec_deg * u.deg)
+
+
+def target_resolution(target: Target) -> ResolvedTarget | None:
+    """
+    Координаты/тело цели: из кэша, сохранённого Target.save(), а для старых целей без кэша —
+    разрешаем по каталогу один раз на расчёт. None — цель не распознана (высота 0)
+    """
+    if target.body or target.icrs_ra_deg is not None:
+        return ResolvedTarget(target.catalog_id, target.icrs_ra_deg, target.icrs_dec_deg, target.body)
+    try:
+        return resolve_target(target.name, target.target_type, target.right_ascension, target.declination)
+    except ValueError:
+        return None
+
+
+def moon_illumination_fraction(sun: SkyCoord, moon: SkyCoord) -> np.ndarray:
     """
     Приближение: освещённость Луны через угловое расстояние (элонгацию) между Солнцем и Луной
     new moon ~ 0, full moon ~ 1
     """
-    sun = get_sun(time)
-    moon = get_body("moon", time)
     elong = sun.separation(moon).rad  # 0..pi
     # 0 -> 0, pi -> 1
-    frac = (1.0 - __import__("math").cos(elong)) / 2.0
-    return max(0.0, min(1.0, float(frac)))
+    frac = (1.0 - np.cos(elong)) / 2.0
+    return np.clip(frac, 0.0, 1.0)
 
 
-def compute_hour_astro(location: Location, target: Target, timestamp_utc: dt.datetime) -> HourAstro:
+def sun_moon_series(t: Time, altaz: AltAz) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
     """
-    timestamp_utc должен быть aware (UTC)
-    Возвращает высоты Солнца, Луны, цели и освещённость Луны
+    Высоты Солнца и Луны и освещённость Луны на сетке времени t
     """
-    loc = _earth_location(location)
+    sun = get_sun(t)
+    moon = get_body("moon", t)
+    return (
+        np.asarray(sun.transform_to(altaz).alt.degree, dtype=float),
+        np.asarray(moon.transform_to(altaz).alt.degree, dtype=float),
+        np.asarray(moon_illumination_fraction(sun, moon), dtype=float),
+    )
 
-    t = Time(timestamp_utc)
 
-    altaz = AltAz(obstime=t, location=loc)
+def sun_moon_at(lat_deg, lon_deg, timestamps_utc: Sequence[dt.datetime]) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Высоты Солнца и Луны и освещённость Луны. lat/lon — скаляры или столбцы (L, 1):
+    высоты тогда (L, T), освещённость всегда (T,).
+    По таблице эфемерид (build_ephemeris), вне её покрытия или без файла — через astropy
+    """
+    table = ephemeris.get_ephemeris()
+    if table is not None:
+        jd = ephemeris.jd_tt(timestamps_utc)
+        if table.covers(jd):
+            return ephemeris.sun_moon(table, jd, lat_deg, lon_deg)
 
-    sun_alt = get_sun(t).transform_to(altaz).alt.degree
+    t = Time(list(timestamps_utc))
+    loc = EarthLocation(lat=np.asarray(lat_deg, dtype=float) * u.deg, lon=np.asarray(lon_deg, dtype=float) * u.deg)
+    altaz = AltAz(obstime=t if loc.isscalar else t[None, :], location=loc)
+    return sun_moon_series(t, altaz)
 
-    moon = get_body("moon", t).transform_to(altaz)
-    moon_alt = moon.alt.degree
-    moon_illum = _moon_illumination_fraction(t)
+
+def _apparent_place(ra_deg, dec_deg, jd: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Видимые RA/Dec (рад, TETE) точек ICRS на моменты jd (TT): astropy в узлах
+    через APPARENT_STEP_DAYS, между ними — линейно. ra/dec — скаляры или (N,) -> (T,) / (N, T)
+    """
+    lo, hi = float(jd.min()), float(jd.max())
+    xs = np.linspace(lo, hi, max(2, int(np.ceil((hi - lo) / APPARENT_STEP_DAYS)) + 1))
+    coords = SkyCoord(
+        ra=np.atleast_1d(ra_deg)[:, None] * u.deg,
+        dec=np.atleast_1d(dec_deg)[:, None] * u.deg,
+    ).transform_to(TETE(obstime=Time(xs, format="jd", scale="tt")))
+    ra = np.unwrap(coords.ra.rad, axis=-1)
+    dec = coords.dec.rad
+
+    i = np.clip(np.searchsorted(xs, jd, side="right") - 1, 0, len(xs) - 2)
+    span = xs[i + 1] - xs[i]
+    w = np.divide(jd - xs[i], span, out=np.zeros_like(jd), where=span > 0)
+    ra_t = ra[:, i] * (1 - w) + ra[:, i + 1] * w
+    dec_t = dec[:, i] * (1 - w) + dec[:, i + 1] * w
+    if np.ndim(ra_deg) == 0:
+        return ra_t[0], dec_t[0]
+    return ra_t, dec_t
+
+
+def fixed_alt_az(ra_deg, dec_deg, lat_deg, lon_deg, timestamps_utc: Sequence[dt.datetime]) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Высота и азимут неподвижных целей (ICRS, °) через звёздное время — без AltAz-преобразования
+    на каждый час. ra/dec — скаляр или (N,) при одной локации; скаляр при столбце локаций (L, 1)
+    """
+    jd = ephemeris.jd_tt(timestamps_utc)
+    ra, dec = _apparent_place(ra_deg, dec_deg, jd)
+    return ephemeris.alt_az(ra, dec, None, ephemeris.greenwich_sidereal(jd), lat_deg, lon_deg)
+
+
+def body_alt_az(body: str, lat_deg, lon_deg, timestamps_utc: Sequence[dt.datetime]) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Высота и азимут тела Солнечной системы: Луна — по таблице эфемерид, если она покрывает даты,
+    остальное — через astropy. lat/lon — скаляры или столбцы (L, 1)
+    """
+    table = ephemeris.get_ephemeris() if body == "moon" else None
+    if table is not None:
+        jd = ephemeris.jd_tt(timestamps_utc)
+        if table.covers(jd):
+            return ephemeris.alt_az(*table.moon.evaluate(jd), ephemeris.greenwich_sidereal(jd), lat_deg, lon_deg)
+
+    t = Time(list(timestamps_utc))
+    loc = EarthLocation(lat=np.asarray(lat_deg, dtype=float) * u.deg, lon=np.asarray(lon_deg, dtype=float) * u.deg)
+    coord = get_body(body, t).transform_to(AltAz(obstime=t if loc.isscalar else t[None, :], location=loc))
+    return np.asarray(coord.alt.degree, dtype=float), np.asarray(coord.az.degree, dtype=float)
+
+
+def compute_astro_series(location: Location, target: Target, timestamps_utc: Sequence[dt.datetime]) -> AstroSeries:
+    """
+    Пакетный расчёт для всех часов сразу: Солнце и Луна — по таблице эфемерид
+    (или одним преобразованием astropy), неподвижная цель — через звёздное время.
+    С профилем горизонта у локации — ещё азимут цели и высота горизонта на нём.
+    timestamps_utc должны быть aware (UTC)
+    """
+    n = len(timestamps_utc)
+    if n == 0:
+        empty = np.zeros(0)
+        return AstroSeries(empty, empty, empty, empty, empty)
+
+    lat, lon = float(location.latitude), float(location.longitude)
+    sun_alt, moon_alt, moon_illum = sun_moon_at(lat, lon, timestamps_utc)
+    profile = horizon_profile(location.horizon)
 
     # Высота цели:
-    # - DSO: используем RA/Dec
-    # - MilkyWay: упростим (как первая версия) — берем центр Галактики (примерно)
-    # - Moon: цель = Луна
-    # - Planet: пытаемся интерпретировать name как тело (mars/jupiter/venus...), иначе target_alt = 0
-    target_alt = 0.0
-
-    if target.target_type == Target.TargetType.DSO and target.right_ascension is not None and target.declination is not None:
-        coord = SkyCoord(ra=float(target.right_ascension) * u.deg, dec=float(target.declination) * u.deg)
-        target_alt = coord.transform_to(altaz).alt.degree
-
-    elif target.target_type == Target.TargetType.MILKY_WAY:
-        # Центр Галактики (приближение): RA=266.4168°, Dec=-29.0078°
-        coord = SkyCoord(ra=266.4168 * u.deg, dec=-29.0078 * u.deg)
-        target_alt = coord.transform_to(altaz).alt.degree
-
-    elif target.target_type == Target.TargetType.MOON:
+    # - DSO/MilkyWay: готовые ICRS-координаты (центр Галактики — из каталога)
+    # - Moon: цель = Луна (азимут нужен только для профиля горизонта)
+    # - Planet: тело для get_body, проверенное при сохранении цели
+    resolved = target_resolution(target)
+    target_az = None
+    if resolved is None:
+        target_alt = np.zeros(n)
+    elif resolved.body == "moon" and profile is None:
         target_alt = moon_alt
-
-    elif target.target_type == Target.TargetType.PLANET:
-        try:
-            body = get_body(target.name.strip().lower(), t).transform_to(altaz)
-            target_alt = body.alt.degree
-        except Exception:
-            target_alt = 0.0
-
-    return HourAstro(
-        sun_alt_deg=float(sun_alt),
-        moon_alt_deg=float(moon_alt),
-        moon_illumination=float(moon_illum),
-        target_alt_deg=float(target_alt),
+    elif resolved.body:
+        target_alt, target_az = body_alt_az(resolved.body, lat, lon, timestamps_utc)
+    else:
+        target_alt, target_az = fixed_alt_az(resolved.ra_deg, resolved.dec_deg, lat, lon, timestamps_utc)
+
+    return AstroSeries(
+        sun_alt_deg=np.asarray(sun_alt, dtype=float),
+        moon_alt_deg=np.asarray(moon_alt, dtype=float),
+        moon_illumination=np.asarray(moon_illum, dtype=float),
+        target_alt_deg=np.asarray(target_alt, dtype=float),
+        horizon_alt_deg=(
+            horizon_altitude(profile, target_az) if profile is not None and target_az is not None else np.zeros(n)
+        ),
     )
+
+
+def compute_hour_astro(location: Location, target: Target, timestamp_utc: dt.datetime) -> HourAstro:
+    """
+    timestamp_utc должен быть aware (UTC)
+    Возвращает высоты Солнца, Луны, цели и освещённость Луны
+    """
+    return compute_astro_series(location, target, [timestamp_utc]).hour(0)
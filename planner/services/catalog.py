@@ -0,0 +1,111 @@
+import csv
+import re
+from dataclasses import dataclass
+from functools import lru_cache
+from pathlib import Path
+
+CATALOG_PATH = Path(__file__).resolve().parent.parent / "data" / "catalog.csv"
+
+# Тела, которые astropy считает по встроенным эфемеридам (get_body)
+SOLAR_SYSTEM_BODIES = ("mercury", "venus", "mars", "jupiter", "saturn", "uranus", "neptune", "moon")
+
+
+@dataclass(frozen=True)
+class CatalogEntry:
+    id: str
+    target_type: str  # значение Target.TargetType
+    ra_deg: float | None
+    dec_deg: float | None
+    body: str  # имя для get_body или ""
+
+
+def normalize_name(name: str) -> str:
+    """
+    Ключ поиска: регистр, пробелы, дефисы и «Messier» не важны
+    ("M 31", "messier-31", "m31" -> "m31"; "NGC 7000" -> "ngc7000")
+    """
+    key = re.sub(r"[\s\-_.'’]+", "", name.strip().lower())
+    return re.sub(r"^messier(?=\d)", "m", key)
+
+
+class Catalog:
+    """
+    Встроенный каталог (Messier, избранные NGC/IC, планеты, Луна, центр Галактики).
+    Загружается один раз на процесс, поиск — по словарю нормализованных имён
+    """
+
+    def __init__(self, entries: list[tuple[CatalogEntry, list[str]]]):
+        self.entries: list[CatalogEntry] = []
+        self._index: dict[str, CatalogEntry] = {}
+        for entry, aliases in entries:
+            self.entries.append(entry)
+            for name in [entry.id, *aliases]:
+                self._index.setdefault(normalize_name(name), entry)
+
+    @classmethod
+    def load(cls, path: Path = CATALOG_PATH) -> "Catalog":
+        entries = []
+        with open(path, encoding="utf-8", newline="") as f:
+            for row in csv.DictReader(f):
+                entry = CatalogEntry(
+                    id=row["id"],
+                    target_type=row["target_type"],
+                    ra_deg=float(row["ra_deg"]) if row["ra_deg"] else None,
+                    dec_deg=float(row["dec_deg"]) if row["dec_deg"] else None,
+                    body=row["body"],
+                )
+                aliases = [a for a in row["aliases"].split(";") if a.strip()]
+                entries.append((entry, aliases))
+        return cls(entries)
+
+    def resolve(self, name: str) -> CatalogEntry | None:
+        return self._index.get(normalize_name(name))
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+
+@lru_cache(maxsize=1)
+def get_catalog() -> Catalog:
+    return Catalog.load()
+
+
+@dataclass(frozen=True)
+class ResolvedTarget:
+    """
+    Что нужно планировщику: либо ICRS-координаты, либо тело для get_body
+    """
+    catalog_id: str
+    ra_deg: float | None
+    dec_deg: float | None
+    body: str
+
+
+def resolve_target(name: str, target_type: str, ra=None, dec=None) -> ResolvedTarget:
+    """
+    Проверяет цель и возвращает её координаты/тело. ValueError — цель не распознана.
+    Для DSO явные RA/Dec важнее каталога; без них имя ищется в каталоге
+    """
+    entry = get_catalog().resolve(name or "")
+
+    if target_type == "DSO":
+        if ra is not None and dec is not None:
+            catalog_id = entry.id if entry is not None and entry.target_type == "DSO" else ""
+            return ResolvedTarget(catalog_id, float(ra), float(dec), "")
+        if entry is None or entry.target_type != "DSO":
+            raise ValueError(f"Объект «{name}» не найден в каталоге — укажите RA и Dec.")
+        return ResolvedTarget(entry.id, entry.ra_deg, entry.dec_deg, "")
+
+    if target_type == "Planet":
+        if entry is None or entry.target_type != "Planet":
+            raise ValueError(f"Неизвестная планета «{name}». Доступны: Mercury, Venus, Mars, Jupiter, Saturn, Uranus, Neptune.")
+        return ResolvedTarget(entry.id, None, None, entry.body)
+
+    if target_type == "Moon":
+        return ResolvedTarget("Moon", None, None, "moon")
+
+    if target_type == "MilkyWay":
+        core = get_catalog().resolve("MilkyWay")
+        return ResolvedTarget(core.id, core.ra_deg, core.dec_deg, "")
+
+    raise ValueError(f"Неизвестный тип цели: {target_type}")
@@ -0,0 +1,54 @@
+import numpy as np
+
+# Больше точек на графике не различимо глазом и тормозит Chart.js на телефонах
+CHART_MAX_POINTS = 500
+
+
+def lttb_indices(y: np.ndarray, n_out: int) -> np.ndarray:
+    """
+    Largest-Triangle-Three-Buckets по равномерной оси x: индексы n_out точек,
+    сохраняющих форму ряда (пики и провалы). Первая и последняя точки остаются всегда
+    """
+    n = len(y)
+    if n_out >= n or n_out < 3:
+        return np.arange(n)
+
+    y = np.nan_to_num(np.asarray(y, dtype=float))
+    edges = np.linspace(1, n - 1, n_out - 1).astype(int)  # границы n_out-2 внутренних корзин
+    out = np.empty(n_out, dtype=int)
+    out[0], out[-1] = 0, n - 1
+
+    a = 0
+    for b in range(n_out - 2):
+        lo, hi = edges[b], edges[b + 1]
+        # Третья вершина — среднее следующей корзины (для последней — последняя точка)
+        nlo, nhi = edges[b + 1], edges[b + 2] if b + 2 < len(edges) else n
+        cx, cy = (nlo + nhi - 1) / 2.0, y[nlo:nhi].mean()
+
+        xs = np.arange(lo, hi)
+        area = np.abs((a - cx) * (y[lo:hi] - y[a]) - (a - xs) * (cy - y[a]))
+        a = lo + int(np.argmax(area))
+        out[b + 1] = a
+    return out
+
+
+def chart_payload(rows, max_points: int | None = CHART_MAX_POINTS) -> dict:
+    """
+    Ряды графика плана из кортежей, начинающихся с (timestamp, score, cloud_cover):
+    подписи, score и облачность (None — нет прогноза).
+    Если точек больше max_points — прореживаем по LTTB на score,
+    облачность берём в тех же часах
+    """
+    rows = list(rows)
+    scores = np.array([r[1] for r in rows], dtype=float)
+
+    idx = np.arange(len(rows)) if max_points is None else lttb_indices(scores, max_points)
+    picked = [rows[i] for i in idx]
+
+    return {
+        "labels": [r[0].strftime("%Y-%m-%d %H:%M") for r in picked],
+        "scores": [round(r[1], 2) for r in picked],
+        "clouds": [r[2] for r in picked],
+        "total": len(rows),
+        "downsampled": len(picked) < len(rows),
+    }
@@ -0,0 +1,167 @@
+"""
+Демо-планировщик для гостей: тот же расчёт, что у плана, но без записи в БД.
+Ответы кэшируются по округлённым координатам, цели, датам и порогам
+(соседние гости в пределах ~DEMO_COORD_STEP попадают в один кэш), прогноз — отдельно
+по точке и датам. Кэш и счётчики лимита — в Django cache (PLANNER_DEMO_CACHE)
+"""
+import datetime as dt
+import threading
+import time
+from dataclasses import dataclass
+from decimal import Decimal
+
+from django.conf import settings
+from django.core.cache import caches
+from django.utils import timezone
+
+from planner.models import AstroWindow, Location, SessionRequest, Target
+from planner.services.catalog import ResolvedTarget
+from planner.services.charts import chart_payload
+from planner.services.planning import HourScore, forecast_range, plan_in_memory
+from planner.services.weather import ForecastArrays, get_weather_provider, parse_hourly
+
+# Шаг округления координат, ° (~11 км по широте)
+DEMO_COORD_STEP = 0.1
+
+# Сколько ночей можно посчитать в демо
+DEMO_MAX_NIGHTS = 3
+
+DEMO_CACHE_VERSION = 1
+
+_BUSY_MESSAGE = "Демо-планировщик сейчас перегружен. Попробуйте через минуту."
+
+
+class DemoBusy(Exception):
+    pass
+
+
+@dataclass(frozen=True)
+class DemoQuery:
+    latitude: float  # уже округлены до DEMO_COORD_STEP
+    longitude: float
+    timezone: str
+    target_name: str
+    target_type: str
+    resolved: ResolvedTarget
+    date_from: dt.date
+    date_to: dt.date
+    min_target_altitude: int
+    max_cloud_cover: int
+    avoid_moon: bool
+
+    def cache_key(self) -> str:
+        return ":".join(str(part) for part in (
+            "demo", DEMO_CACHE_VERSION, self.latitude, self.longitude, self.timezone,
+            self.target_type, self.resolved.catalog_id or self.target_name.lower(),
+            self.date_from, self.date_to, self.min_target_altitude, self.max_cloud_cover, int(self.avoid_moon),
+        ))
+
+
+@dataclass(frozen=True)
+class DemoResult:
+    hours: list[HourScore]
+    windows: list[AstroWindow]
+    chart: dict
+    has_forecast: bool
+    computed_at: dt.datetime
+
+
+def bucket(value: float, step: float = DEMO_COORD_STEP) -> float:
+    return round(round(float(value) / step) * step, 6)
+
+
+def _cache():
+    return caches[settings.PLANNER_DEMO_CACHE]
+
+
+def allow_request(client_ip: str) -> bool:
+    """
+    Лимит запросов с одного IP: не больше PLANNER_DEMO_RATE_LIMIT за окно
+    PLANNER_DEMO_RATE_WINDOW_SECONDS (фиксированное окно, счётчик в кэше)
+    """
+    window = settings.PLANNER_DEMO_RATE_WINDOW_SECONDS
+    key = f"demo-rate:{client_ip}:{int(time.time() // window)}"
+    cache = _cache()
+    cache.add(key, 0, timeout=window)
+    try:
+        count = cache.incr(key)
+    except ValueError:  # ключ истёк между add и incr
+        cache.set(key, 1, timeout=window)
+        count = 1
+    return count <= settings.PLANNER_DEMO_RATE_LIMIT
+
+
+# Одновременных расчётов на процесс: всплеск гостей не отнимает CPU у зарегистрированных
+_slots = threading.BoundedSemaphore(settings.PLANNER_DEMO_MAX_CONCURRENT)
+
+
+def demo_plan(query: DemoQuery) -> DemoResult:
+    """
+    Расчёт из кэша или (если есть свободный слот) заново. DemoBusy — все слоты заняты
+    """
+    cache = _cache()
+    key = query.cache_key()
+    result = cache.get(key)
+    if result is not None:
+        return result
+
+    if not _slots.acquire(blocking=False):
+        raise DemoBusy(_BUSY_MESSAGE)
+    try:
+        result = _compute(query)
+    finally:
+        _slots.release()
+
+    cache.set(key, result, timeout=settings.PLANNER_DEMO_CACHE_SECONDS)
+    return result
+
+
+def _compute(query: DemoQuery) -> DemoResult:
+    location = Location(
+        name="Демо",
+        latitude=Decimal(str(query.latitude)),
+        longitude=Decimal(str(query.longitude)),
+        timezone=query.timezone,
+    )
+    target = Target(
+        name=query.target_name,
+        target_type=query.target_type,
+        catalog_id=query.resolved.catalog_id,
+        body=query.resolved.body,
+        icrs_ra_deg=query.resolved.ra_deg,
+        icrs_dec_deg=query.resolved.dec_deg,
+    )
+    plan = SessionRequest(
+        location=location,
+        target=target,
+        date_from=query.date_from,
+        date_to=query.date_to,
+        min_target_altitude=query.min_target_altitude,
+        max_cloud_cover=query.max_cloud_cover,
+        avoid_moon=query.avoid_moon,
+    )
+
+    fc_range = forecast_range(query.date_from, query.date_to, timezone.localdate())
+    forecast = _forecast(location, *fc_range) if fc_range is not None else None
+    hours, windows = plan_in_memory(plan, forecast)
+
+    return DemoResult(
+        hours=hours,
+        windows=windows,
+        chart=chart_payload(((h.timestamp, h.score, h.cloud_cover) for h in hours), max_points=None),
+        has_forecast=forecast is not None and len(forecast) > 0,
+        computed_at=timezone.now(),
+    )
+
+
+def _forecast(location: Location, date_from: dt.date, date_to: dt.date) -> ForecastArrays:
+    """
+    Прогноз точки без ForecastHour: один запрос к провайдеру на точку и даты за время жизни кэша
+    """
+    cache = _cache()
+    key = f"demo-forecast:{DEMO_CACHE_VERSION}:{location.latitude}:{location.longitude}:{location.timezone}:{date_from}:{date_to}"
+    forecast = cache.get(key)
+    if forecast is None:
+        forecast = parse_hourly(get_weather_provider().fetch(location, date_from, date_to))
+        cache.set(key, forecast, timeout=settings.PLANNER_DEMO_CACHE_SECONDS)
+    return forecast
@@ -0,0 +1,227 @@
+"""
+Таблица Чебышёва для Солнца и Луны: видимые геоцентрические RA/Dec/расстояние
+(истинный экватор и равноденствие даты, TETE), общие для всех локаций.
+Высота над горизонтом для конкретного места — через звёздное время и поворот
+топоцентрического вектора, без цепочки преобразований astropy на каждый час.
+
+Файл строится командой build_ephemeris и читается через np.memmap один раз на процесс.
+Формат: заголовок _HEADER, затем коэффициенты Солнца и Луны (float64, little-endian),
+форма (сегментов, 3 [ra, dec, dist], порядок + 1)
+"""
+import datetime as dt
+import struct
+from dataclasses import dataclass
+from functools import lru_cache
+from pathlib import Path
+
+import erfa
+import numpy as np
+from django.conf import settings
+
+_MAGIC = b"PLEPHEM1"
+# magic, порядок, сегментов Солнца, сегментов Луны, начало (JD TT), длина сегмента Солнца и Луны (сут)
+_HEADER = struct.Struct("<8sIII3d")
+
+SUN_SEGMENT_DAYS = 16.0
+MOON_SEGMENT_DAYS = 2.0
+CHEB_DEGREE = 13
+
+# TT − UTC: 32.184 с + TAI−UTC (37 с с 2017 г.). Секунда погрешности сдвигает Луну на ~0.0005° —
+# таблице не нужны ни новые високосные секунды, ни UT1−UTC (< 0.9 с)
+TT_MINUS_UTC_DAYS = 69.184 / 86400.0
+
+_UNIX_EPOCH_JD = 2440587.5
+
+
+@dataclass(frozen=True)
+class _Table:
+    start_jd: float
+    seg_days: float
+    coeffs: np.ndarray  # (сегментов, 3, порядок + 1)
+
+    @property
+    def end_jd(self) -> float:
+        return self.start_jd + self.seg_days * len(self.coeffs)
+
+    def evaluate(self, jd_tt: np.ndarray) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        RA, Dec (рад) и расстояние (м) на моменты jd_tt — векторно, по Кленшоу
+        """
+        pos = (jd_tt - self.start_jd) / self.seg_days
+        seg = np.clip(pos.astype(np.int64), 0, len(self.coeffs) - 1)
+        x = 2.0 * (pos - seg) - 1.0
+        c = self.coeffs[seg]  # (n, 3, k)
+
+        b1 = np.zeros(c.shape[:2])
+        b2 = np.zeros(c.shape[:2])
+        x2 = (2.0 * x)[:, None]
+        for k in range(c.shape[2] - 1, 0, -1):
+            b1, b2 = x2 * b1 - b2 + c[:, :, k], b1
+        values = x[:, None] * b1 - b2 + c[:, :, 0]
+        return np.mod(values[:, 0], 2 * np.pi), values[:, 1], values[:, 2]
+
+
+@dataclass(frozen=True)
+class EphemerisTable:
+    sun: _Table
+    moon: _Table
+
+    def covers(self, jd_tt: np.ndarray) -> bool:
+        lo, hi = jd_tt.min(), jd_tt.max()
+        return all(t.start_jd <= lo and hi < t.end_jd for t in (self.sun, self.moon))
+
+
+def jd_tt(timestamps_utc) -> np.ndarray:
+    """
+    aware-datetime (UTC) или datetime64 -> юлианские даты TT
+    """
+    if isinstance(timestamps_utc, np.ndarray) and np.issubdtype(timestamps_utc.dtype, np.datetime64):
+        ts = timestamps_utc.astype("datetime64[s]")
+    else:
+        ts = np.array([t.astimezone(dt.timezone.utc).replace(tzinfo=None) for t in timestamps_utc], dtype="datetime64[s]")
+    seconds = ts.astype(np.int64).astype(np.float64)
+    return _UNIX_EPOCH_JD + seconds / 86400.0 + TT_MINUS_UTC_DAYS
+
+
+def write_table(path: Path, start_jd: float, sun: np.ndarray, moon: np.ndarray) -> None:
+    with open(path, "wb") as f:
+        f.write(_HEADER.pack(_MAGIC, sun.shape[2] - 1, len(sun), len(moon), start_jd, SUN_SEGMENT_DAYS, MOON_SEGMENT_DAYS))
+        f.write(np.ascontiguousarray(sun, dtype="<f8").tobytes())
+        f.write(np.ascontiguousarray(moon, dtype="<f8").tobytes())
+
+
+def read_table(path: Path) -> EphemerisTable:
+    with open(path, "rb") as f:
+        magic, degree, n_sun, n_moon, start_jd, sun_days, moon_days = _HEADER.unpack(f.read(_HEADER.size))
+    if magic != _MAGIC:
+        raise ValueError(f"{path}: не файл эфемерид")
+
+    k = degree + 1
+    data = np.memmap(path, dtype="<f8", mode="r", offset=_HEADER.size, shape=((n_sun + n_moon) * 3 * k,))
+    sun = data[: n_sun * 3 * k].reshape(n_sun, 3, k)
+    moon = data[n_sun * 3 * k:].reshape(n_moon, 3, k)
+    return EphemerisTable(_Table(start_jd, sun_days, sun), _Table(start_jd, moon_days, moon))
+
+
+@lru_cache(maxsize=4)
+def _load(path: str, mtime: float) -> EphemerisTable | None:
+    try:
+        return read_table(Path(path))
+    except (OSError, ValueError, struct.error):
+        return None
+
+
+def get_ephemeris() -> EphemerisTable | None:
+    """
+    Таблица из PLANNER_EPHEMERIS_PATH (один раз на процесс, перечитывается после пересборки).
+    None — файла нет, считаем через astropy
+    """
+    path = Path(settings.PLANNER_EPHEMERIS_PATH)
+    try:
+        mtime = path.stat().st_mtime
+    except OSError:
+        return None
+    return _load(str(path), mtime)
+
+
+def fit_segments(start_jd: float, seg_days: float, n_segments: int, sample, degree: int = CHEB_DEGREE) -> np.ndarray:
+    """
+    Коэффициенты Чебышёва по сегментам. sample(jd_tt) -> (ra, dec, dist) массивами
+    вызывается один раз на все узлы всех сегментов
+    """
+    nodes = np.cos(np.pi * (np.arange(2 * (degree + 1)) + 0.5) / (2 * (degree + 1)))  # узлы на [-1, 1]
+    starts = start_jd + seg_days * np.arange(n_segments)
+    jd = (starts[:, None] + (nodes[None, :] + 1.0) / 2.0 * seg_days).ravel()
+
+    ra, dec, dist = (np.asarray(v, dtype=float).reshape(n_segments, -1) for v in sample(jd))
+    ra = np.unwrap(ra, axis=1)  # внутри сегмента RA без скачка 2π
+
+    coeffs = np.empty((n_segments, 3, degree + 1))
+    for i in range(n_segments):
+        coeffs[i] = np.polynomial.chebyshev.chebfit(nodes, np.stack([ra[i], dec[i], dist[i]], axis=1), degree).T
+    return coeffs
+
+
+def _observer(lat_deg: np.ndarray, lon_deg: np.ndarray) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Геоцентрическое положение наблюдателя (WGS84, h=0), м: радиус в плоскости экватора и z
+    """
+    lat = np.radians(lat_deg)
+    a, f = 6378137.0, 1 / 298.257223563
+    e2 = f * (2 - f)
+    n = a / np.sqrt(1 - e2 * np.sin(lat) ** 2)
+    return n * np.cos(lat), n * (1 - e2) * np.sin(lat), np.radians(lon_deg)
+
+
+def greenwich_sidereal(jd: np.ndarray) -> np.ndarray:
+    """
+    Гринвичское истинное звёздное время (рад); UT1 ≈ UTC
+    """
+    jd_utc = jd - TT_MINUS_UTC_DAYS
+    return erfa.gst00b(jd_utc, 0.0)
+
+
+def _local(ra, dec, dist_m, gast, lat_deg, lon_deg):
+    """
+    Топоцентрический вектор на объект в осях горизонта: (север, восток, вверх), не нормирован
+    """
+    rho, z, lon = _observer(np.asarray(lat_deg, dtype=float), np.asarray(lon_deg, dtype=float))
+    lst = gast + lon  # местное звёздное время
+    lat = np.radians(lat_deg)
+
+    cos_dec = np.cos(dec)
+    if dist_m is None:
+        vx, vy, vz = cos_dec * np.cos(ra), cos_dec * np.sin(ra), np.sin(dec)
+    else:
+        vx = dist_m * cos_dec * np.cos(ra) - rho * np.cos(lst)
+        vy = dist_m * cos_dec * np.sin(ra) - rho * np.sin(lst)
+        vz = dist_m * np.sin(dec) - z
+
+    radial = np.cos(lst) * vx + np.sin(lst) * vy  # к меридиану наблюдателя в плоскости экватора
+    north = -np.sin(lat) * radial + np.cos(lat) * vz
+    east = -np.sin(lst) * vx + np.cos(lst) * vy
+    up = np.cos(lat) * radial + np.sin(lat) * vz
+    return north, east, up
+
+
+def altitude(
+    ra: np.ndarray,
+    dec: np.ndarray,
+    dist_m: np.ndarray | None,
+    gast: np.ndarray,
+    lat_deg,
+    lon_deg,
+) -> np.ndarray:
+    """
+    Высота (°) по видимым геоцентрическим RA/Dec даты. dist_m — для топоцентрической
+    поправки (параллакс Луны ~1°); None — бесконечно далёкий объект.
+    lat/lon broadcast'ятся с временами: (L, 1) × (T,) -> (L, T)
+    """
+    north, east, up = _local(ra, dec, dist_m, gast, lat_deg, lon_deg)
+    return np.degrees(np.arctan2(up, np.hypot(north, east)))
+
+
+def alt_az(ra, dec, dist_m, gast, lat_deg, lon_deg) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Как altitude, плюс азимут (°, 0 — север, 90 — восток)
+    """
+    north, east, up = _local(ra, dec, dist_m, gast, lat_deg, lon_deg)
+    return np.degrees(np.arctan2(up, np.hypot(north, east))), np.mod(np.degrees(np.arctan2(east, north)), 360.0)
+
+
+def sun_moon(table: EphemerisTable, jd: np.ndarray, lat_deg, lon_deg) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Высоты Солнца и Луны и освещённость Луны (как moon_illumination_fraction: по элонгации)
+    """
+    gast = greenwich_sidereal(jd)
+    s_ra, s_dec, s_dist = table.sun.evaluate(jd)
+    m_ra, m_dec, m_dist = table.moon.evaluate(jd)
+
+    cos_elong = np.sin(s_dec) * np.sin(m_dec) + np.cos(s_dec) * np.cos(m_dec) * np.cos(s_ra - m_ra)
+    illum = np.clip((1.0 - cos_elong) / 2.0, 0.0, 1.0)
+
+    return (
+        altitude(s_ra, s_dec, s_dist, gast, lat_deg, lon_deg),
+        altitude(m_ra, m_dec, m_dist, gast, lat_deg, lon_deg),
+        illum,
+    )
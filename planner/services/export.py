@@ -0,0 +1,123 @@
+import csv
+import datetime as dt
+import itertools
+from typing import Iterable, Iterator
+
+from django.db import models
+from django.utils import timezone
+
+from planner.models import AstroWindow, PlanHourScore
+from planner.services.archive import ParquetArchive
+
+EXPORT_FORMATS = ("csv", "parquet")
+
+# kind -> (модель, поля, поле времени для фильтра по датам)
+EXPORT_KINDS = {
+    "hours": (
+        PlanHourScore,
+        ["plan_id", "timestamp", "score", "cloud_cover", "moon_illumination", "target_altitude", "is_astronomical_dark"],
+        "timestamp",
+    ),
+    "windows": (
+        AstroWindow,
+        ["plan_id", "start_time", "end_time", "score", "avg_cloud_cover", "moon_illumination", "max_target_altitude", "is_astronomical_dark"],
+        "start_time",
+    ),
+}
+
+CONTENT_TYPES = {
+    "csv": "text/csv; charset=utf-8",
+    "parquet": "application/vnd.apache.parquet",
+}
+
+EXPORT_CHUNK_SIZE = 5000
+
+
+class StreamSink:
+    """
+    Пишущий «файл» для pyarrow: копит байты до очередного drain(),
+    так что Parquet уходит клиенту по row group, а не целиком из памяти
+    """
+    closed = False
+
+    def __init__(self):
+        self._chunks: list[bytes] = []
+        self._pos = 0
+
+    def write(self, data) -> int:
+        self._chunks.append(bytes(data))
+        self._pos += len(data)
+        return len(data)
+
+    def tell(self) -> int:
+        return self._pos
+
+    def flush(self) -> None:
+        pass
+
+    def drain(self) -> bytes:
+        data = b"".join(self._chunks)
+        self._chunks = []
+        return data
+
+
+class _Echo:
+    def write(self, value: str) -> str:
+        return value
+
+
+def export_queryset(
+    kind: str,
+    plans: models.QuerySet,
+    date_from: dt.date | None = None,
+    date_to: dt.date | None = None,
+) -> models.QuerySet:
+    """
+    Строки выгрузки для набора планов с фильтром по датам (включительно, UTC)
+    """
+    model, fields, time_field = EXPORT_KINDS[kind]
+    qs = model.objects.filter(plan__in=plans)
+    if date_from is not None:
+        qs = qs.filter(**{f"{time_field}__gte": timezone.make_aware(dt.datetime.combine(date_from, dt.time.min), dt.timezone.utc)})
+    if date_to is not None:
+        qs = qs.filter(**{f"{time_field}__lte": timezone.make_aware(dt.datetime.combine(date_to, dt.time.max), dt.timezone.utc)})
+    return qs.order_by("plan_id", time_field).values(*fields)
+
+
+def _chunks(rows: Iterable[dict], size: int) -> Iterator[list[dict]]:
+    it = iter(rows)
+    while chunk := list(itertools.islice(it, size)):
+        yield chunk
+
+
+def csv_stream(queryset: models.QuerySet, fields: list[str], chunk_size: int = EXPORT_CHUNK_SIZE) -> Iterator[str]:
+    writer = csv.writer(_Echo())
+    yield writer.writerow(fields)
+    for chunk in _chunks(queryset.iterator(chunk_size=chunk_size), chunk_size):
+        yield "".join(writer.writerow([row[f] for f in fields]) for row in chunk)
+
+
+def parquet_stream(queryset: models.QuerySet, fields: list[str], chunk_size: int = EXPORT_CHUNK_SIZE) -> Iterator[bytes]:
+    """
+    pyarrow импортируется сразу (RuntimeError, если его нет), а не при первой итерации
+    """
+    sink = StreamSink()
+    archive = ParquetArchive(sink, queryset.model, fields)
+
+    def gen() -> Iterator[bytes]:
+        try:
+            for chunk in _chunks(queryset.iterator(chunk_size=chunk_size), chunk_size):
+                archive.write(chunk)
+                yield sink.drain()
+        finally:
+            archive.close()
+        yield sink.drain()
+
+    return gen()
+
+
+def export_stream(kind: str, fmt: str, queryset: models.QuerySet, chunk_size: int = EXPORT_CHUNK_SIZE):
+    _, fields, _ = EXPORT_KINDS[kind]
+    if fmt == "parquet":
+        return parquet_stream(queryset, fields, chunk_size)
+    return csv_stream(queryset, fields, chunk_size)
@@ -0,0 +1,84 @@
+import datetime as dt
+import time
+from dataclasses import dataclass
+from pathlib import Path
+
+from django.db import models, transaction
+from django.utils import timezone
+
+from planner.models import ForecastHour, PlanHourScore
+from planner.services.archive import archive_suffix, open_archive
+
+FORECAST_FIELDS = [
+    "id", "location_id", "timestamp", "cloud_cover", "precipitation", "visibility", "ensemble", "source", "created_at",
+]
+PLAN_SCORE_FIELDS = ["id", "plan_id", "timestamp", "score", "cloud_cover", "moon_illumination", "target_altitude", "is_astronomical_dark"]
+
+
+@dataclass(frozen=True)
+class CompactionResult:
+    table: str
+    deleted: int
+    archived: int
+    seconds: float
+
+
+def stale_forecast_hours(forecast_days: int, now: dt.datetime | None = None) -> models.QuerySet:
+    """
+    Часы прогноза старше forecast_days дней (прошлое уже не нужно планировщику)
+    """
+    now = now or timezone.now()
+    return ForecastHour.objects.filter(timestamp__lt=now - dt.timedelta(days=forecast_days))
+
+
+def expired_plan_scores(plan_days: int, today: dt.date | None = None) -> models.QuerySet:
+    """
+    Почасовые score планов, чей период закончился больше plan_days дней назад.
+    Сами планы, окна и свод по ночам остаются
+    """
+    today = today or timezone.localdate()
+    return PlanHourScore.objects.filter(plan__date_to__lt=today - dt.timedelta(days=plan_days))
+
+
+def compact(
+    queryset: models.QuerySet,
+    fields: list[str],
+    batch_size: int = 5000,
+    archive_dir: Path | None = None,
+    archive_format: str = "csv",
+    dry_run: bool = False,
+) -> CompactionResult:
+    """
+    Удаляет строки queryset пачками по batch_size (короткие транзакции — без долгих блокировок).
+    Если задан archive_dir — перед удалением каждая пачка дописывается в архивный файл
+    """
+    model = queryset.model
+    table = model._meta.db_table
+    started = time.perf_counter()
+
+    if dry_run:
+        return CompactionResult(table, queryset.count(), 0, time.perf_counter() - started)
+
+    archive = None
+    if archive_dir is not None:
+        archive_dir.mkdir(parents=True, exist_ok=True)
+        stamp = timezone.now().strftime("%Y%m%dT%H%M%S")
+        archive = open_archive(archive_dir / f"{table}-{stamp}{archive_suffix(archive_format)}", model, fields, archive_format)
+
+    deleted = archived = 0
+    try:
+        while True:
+            rows = list(queryset.order_by("pk").values(*fields)[:batch_size])
+            if not rows:
+                break
+            with transaction.atomic():
+                if archive is not None:
+                    archive.write(rows)
+                    archived += len(rows)
+                n, _ = model.objects.filter(pk__in=[r["id"] for r in rows]).delete()
+                deleted += n
+    finally:
+        if archive is not None:
+            archive.close()
+
+    return CompactionResult(table, deleted, archived, time.perf_counter() - started)
@@ -0,0 +1,78 @@
+"""
+Профиль горизонта локации: высота препятствий (деревья, горы, дома) по азимуту.
+Хранится в Location.horizon — 360 байт uint8, высота в целых градусах на каждый градус азимута
+(0 — север, 90 — восток)
+"""
+import re
+
+import numpy as np
+
+HORIZON_POINTS = 360
+
+_SEPARATORS = re.compile(r"[\s,;]+")
+
+
+def parse_horizon(text: str) -> np.ndarray:
+    """
+    Файл горизонта -> 360 высот (uint8). Понимает распространённые текстовые форматы:
+    пары «азимут высота» по строке (Stellarium polygonal, N.I.N.A./APT .hrz, Cartes du Ciel, CSV)
+    или просто ряд высот через равные шаги азимута, начиная с севера.
+    Комментарии (#, //) и строки-заголовки пропускаются
+    """
+    pairs: list[tuple[float, float]] = []
+    values: list[float] = []
+    for line in text.splitlines():
+        line = line.split("#", 1)[0].split("//", 1)[0].strip()
+        if not line:
+            continue
+        try:
+            numbers = [float(x) for x in _SEPARATORS.split(line) if x]
+        except ValueError:
+            continue  # заголовок CSV и т.п.
+        if len(numbers) == 2:
+            pairs.append((numbers[0], numbers[1]))
+        elif numbers:
+            values.extend(numbers)
+
+    if pairs and values:
+        raise ValueError("Файл горизонта: смешаны пары «азимут высота» и отдельные высоты.")
+    if pairs:
+        az, alt = np.array(pairs).T
+        if len(pairs) < 2:
+            raise ValueError("Файл горизонта: нужно хотя бы две точки.")
+    elif values:
+        alt = np.array(values)
+        az = np.arange(len(alt)) * (HORIZON_POINTS / len(alt))
+    else:
+        raise ValueError("Файл горизонта: не найдено ни одной точки.")
+
+    if not np.all(np.isfinite(alt)) or np.any(alt < -90) or np.any(alt > 90):
+        raise ValueError("Файл горизонта: высоты должны быть в диапазоне от -90 до 90.")
+
+    profile = np.interp(np.arange(HORIZON_POINTS), np.mod(az, 360.0), alt, period=360.0)
+    return np.clip(np.rint(profile), 0, 90).astype(np.uint8)
+
+
+def horizon_profile(data: bytes | memoryview | None) -> np.ndarray | None:
+    """
+    Location.horizon -> массив 360 uint8; None — профиля нет (плоский горизонт)
+    """
+    if not data:
+        return None
+    profile = np.frombuffer(bytes(data), dtype=np.uint8)
+    return profile if len(profile) == HORIZON_POINTS else None
+
+
+def horizon_altitude(profile: np.ndarray, az_deg: np.ndarray) -> np.ndarray:
+    """
+    Высота горизонта (°) на азимутах az_deg, линейно между целыми градусами.
+    profile — (360,) или (L, 360) при az_deg формы (L, T)
+    """
+    profile = np.asarray(profile, dtype=float)
+    pos = np.mod(az_deg, 360.0)
+    i0 = pos.astype(np.int64) % HORIZON_POINTS
+    i1 = (i0 + 1) % HORIZON_POINTS
+    w = pos - np.floor(pos)
+    if profile.ndim == 1:
+        return profile[i0] * (1 - w) + profile[i1] * w
+    return np.take_along_axis(profile, i0, axis=-1) * (1 - w) + np.take_along_axis(profile, i1, axis=-1) * w
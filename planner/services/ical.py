@@ -0,0 +1,190 @@
+"""
+Лента окон съёмки в формате iCalendar (RFC 5545) для подписки из календарей.
+Календари опрашивают ленту каждые несколько минут, поэтому запрос стоит одного поиска
+по уникальному токену: ETag/Last-Modified строятся из CalendarFeed.changed_at
+(сдвигается при пересчёте планов пользователя) и даты отсечки прошедших окон,
+тело ленты лежит в Django cache под ключом ETag и пересобирается только после пересчёта
+"""
+import datetime as dt
+import hashlib
+import secrets
+from dataclasses import dataclass
+
+from django.conf import settings
+from django.core.cache import caches
+from django.utils import timezone
+
+from planner.models import AstroWindow, CalendarFeed
+
+# Окна, закончившиеся раньше начала вчерашнего дня (UTC), в ленту не попадают
+FEED_PAST_DAYS = 1
+FEED_MAX_EVENTS = 500
+
+# Подсказка клиентам, как часто опрашивать ленту
+FEED_REFRESH_INTERVAL = "PT1H"
+
+_PRODID = "-//Astro Photo Planner//Окна съёмки//RU"
+_UID_DOMAIN = "astro-photo-planner"
+_LINE_OCTETS = 75
+
+
+@dataclass(frozen=True)
+class FeedState:
+    user_id: int
+    etag: str
+    last_modified: dt.datetime
+    cutoff: dt.datetime
+
+
+def new_token() -> str:
+    return secrets.token_urlsafe(24)
+
+
+def reset_feed(user) -> CalendarFeed:
+    """
+    Создать ленту пользователя или выдать ей новый токен (старая ссылка перестаёт работать)
+    """
+    feed, _ = CalendarFeed.objects.update_or_create(
+        user=user,
+        defaults={"token": new_token(), "changed_at": timezone.now()},
+    )
+    return feed
+
+
+def touch_feeds(user_id: int) -> None:
+    """
+    Окна пользователя изменились: новый ETag, тело ленты соберётся заново при следующем опросе
+    """
+    CalendarFeed.objects.filter(user_id=user_id).update(changed_at=timezone.now())
+
+
+def feed_cutoff(now: dt.datetime | None = None) -> dt.datetime:
+    now = now or timezone.now()
+    day = now.astimezone(dt.timezone.utc).date() - dt.timedelta(days=FEED_PAST_DAYS)
+    return dt.datetime.combine(day, dt.time.min, tzinfo=dt.timezone.utc)
+
+
+def feed_state(token: str) -> FeedState | None:
+    """
+    Состояние ленты по токену — один запрос по уникальному индексу; None — токена нет
+    """
+    row = CalendarFeed.objects.filter(token=token).values_list("user_id", "changed_at").first()
+    if row is None:
+        return None
+    user_id, changed_at = row
+    cutoff = feed_cutoff()
+    digest = hashlib.sha256(f"{token}:{changed_at.isoformat()}:{cutoff:%Y%m%d}".encode()).hexdigest()
+    return FeedState(
+        user_id=user_id,
+        etag=f'"{digest[:32]}"',
+        last_modified=max(changed_at, cutoff),
+        cutoff=cutoff,
+    )
+
+
+def _cache():
+    return caches[settings.PLANNER_CALENDAR_FEED_CACHE]
+
+
+def feed_body(state: FeedState, base_url: str) -> bytes:
+    """
+    Тело ленты из кэша или (после пересчёта планов) заново одним индексированным запросом
+    """
+    cache = _cache()
+    key = f"ical:{state.etag}:{base_url}"
+    body = cache.get(key)
+    if body is None:
+        body = render_feed(upcoming_windows(state.user_id, state.cutoff), base_url, state.last_modified)
+        cache.set(key, body, timeout=settings.PLANNER_CALENDAR_FEED_CACHE_SECONDS)
+    return body
+
+
+def upcoming_windows(user_id: int, cutoff: dt.datetime):
+    return (
+        AstroWindow.objects.filter(plan__user_id=user_id, end_time__gte=cutoff)
+        .select_related("plan__location", "plan__target")
+        .only(
+            "plan_id", "start_time", "end_time", "score", "avg_cloud_cover",
+            "moon_illumination", "max_target_altitude",
+            "plan__location__name", "plan__target__name",
+        )
+        .order_by("start_time")[:FEED_MAX_EVENTS]
+    )
+
+
+def render_feed(windows, base_url: str, stamp: dt.datetime) -> bytes:
+    lines = [
+        "BEGIN:VCALENDAR",
+        "VERSION:2.0",
+        f"PRODID:{_PRODID}",
+        "CALSCALE:GREGORIAN",
+        "METHOD:PUBLISH",
+        "X-WR-CALNAME:Окна съёмки",
+        f"REFRESH-INTERVAL;VALUE=DURATION:{FEED_REFRESH_INTERVAL}",
+        f"X-PUBLISHED-TTL:{FEED_REFRESH_INTERVAL}",
+    ]
+    for w in windows:
+        lines.extend(_event(w, base_url, stamp))
+    lines.append("END:VCALENDAR")
+    return "".join(_fold(line) + "\r\n" for line in lines).encode("utf-8")
+
+
+def _event(w: AstroWindow, base_url: str, stamp: dt.datetime) -> list[str]:
+    plan = w.plan
+    details = [
+        f"Оценка: {float(w.score):.0f}",
+        f"Облачность: {w.avg_cloud_cover}%" if w.avg_cloud_cover is not None else "Облачность: нет прогноза",
+        f"Луна: {float(w.moon_illumination) * 100:.0f}%",
+        f"Макс. высота цели: {float(w.max_target_altitude):.0f}°",
+    ]
+    url = f"{base_url.rstrip('/')}/plans/{w.plan_id}/"
+    return [
+        "BEGIN:VEVENT",
+        # UID не зависит от id строки: окна пересоздаются при каждом пересчёте
+        f"UID:plan-{w.plan_id}-{_utc(w.start_time)}@{_UID_DOMAIN}",
+        f"DTSTAMP:{_utc(stamp)}",
+        f"DTSTART:{_utc(w.start_time)}",
+        f"DTEND:{_utc(w.end_time)}",
+        f"SUMMARY:{_text(f'{plan.target.name} — {plan.location.name} ({float(w.score):.0f})')}",
+        f"LOCATION:{_text(plan.location.name)}",
+        f"DESCRIPTION:{_text(chr(10).join(details))}",
+        f"URL:{url}",
+        "TRANSP:TRANSPARENT",
+        "END:VEVENT",
+    ]
+
+
+def _utc(value: dt.datetime) -> str:
+    return value.astimezone(dt.timezone.utc).strftime("%Y%m%dT%H%M%SZ")
+
+
+def _text(value: str) -> str:
+    """
+    Экранирование значения TEXT (RFC 5545, 3.3.11)
+    """
+    return (
+        value.replace("\\", "\\\\")
+        .replace(";", "\\;")
+        .replace(",", "\\,")
+        .replace("\r\n", "\\n")
+        .replace("\n", "\\n")
+    )
+
+
+def _fold(line: str) -> str:
+    """
+    Перенос строк длиннее 75 октетов (RFC 5545, 3.1), не разрывая символы UTF-8
+    """
+    if len(line.encode("utf-8")) <= _LINE_OCTETS:
+        return line
+    parts: list[str] = []
+    current, size, limit = [], 0, _LINE_OCTETS
+    for ch in line:
+        n = len(ch.encode("utf-8"))
+        if size + n > limit:
+            parts.append("".join(current))
+            current, size, limit = [], 0, _LINE_OCTETS - 1  # продолжение начинается с пробела
+        current.append(ch)
+        size += n
+    parts.append("".join(current))
+    return "\r\n ".join(parts)
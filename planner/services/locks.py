@@ -0,0 +1,164 @@
+import asyncio
+import datetime as dt
+import time
+import uuid
+from typing import Awaitable, Callable, TypeVar
+
+from asgiref.sync import sync_to_async
+from django.db import IntegrityError
+from django.db.models import Q
+from django.utils import timezone
+
+from planner.models import RunLock
+
+T = TypeVar("T")
+
+# Через сколько блокировка считается брошенной (процесс упал посреди расчёта)
+RUN_LOCK_TTL = dt.timedelta(minutes=10)
+
+# Сколько ждём чужой расчёт и как часто проверяем
+RUN_LOCK_WAIT_SECONDS = 300.0
+RUN_LOCK_POLL_SECONDS = 0.25
+
+# Сколько хранить строки RunLock после завершения (ожидающие читают по ним итог) — заметно дольше ожидания
+RUN_LOCK_KEEP = dt.timedelta(days=1)
+
+_BUSY_MESSAGE = "Этот расчёт уже выполняется в другом запросе. Попробуйте позже."
+
+
+def _try_acquire(key: str, ttl: dt.timedelta) -> str | None:
+    """
+    Атомарный захват одним UPDATE: свободна или истекла -> наш токен. None — занята
+    """
+    try:
+        RunLock.objects.get_or_create(key=key)
+    except IntegrityError:  # строку только что создал соседний процесс
+        pass
+
+    token = uuid.uuid4().hex
+    now = timezone.now()
+    taken = (
+        RunLock.objects.filter(key=key)
+        .filter(Q(token="") | Q(expires_at__lt=now))
+        .update(token=token, started_at=now, expires_at=now + ttl)
+    )
+    return token if taken else None
+
+
+def _release(key: str, token: str, succeeded: bool) -> None:
+    RunLock.objects.filter(key=key, token=token).update(
+        token="", finished_at=timezone.now(), succeeded=succeeded,
+    )
+
+
+def _finished_ok(key: str, awaited: dt.datetime) -> bool:
+    lock = RunLock.objects.filter(key=key).only("token", "finished_at", "succeeded").first()
+    return bool(lock and not lock.token and lock.finished_at and lock.finished_at >= awaited and lock.succeeded)
+
+
+def _started_at(key: str) -> dt.datetime:
+    return RunLock.objects.filter(key=key).values_list("started_at", flat=True).first() or timezone.now()
+
+
+def try_lock(key: str, ttl: dt.timedelta = RUN_LOCK_TTL) -> str | None:
+    """
+    Захват без ожидания (пакетный расчёт): токен владельца или None, если ключ занят.
+    Освобождать через unlock — ожидающие single_flight получат итог по succeeded
+    """
+    return _try_acquire(key, ttl)
+
+
+def unlock(key: str, token: str, succeeded: bool) -> None:
+    _release(key, token, succeeded)
+
+
+def stale_run_locks(keep: dt.timedelta = RUN_LOCK_KEEP, now: dt.datetime | None = None):
+    """
+    Строки RunLock, которые уже никому не нужны: расчёт завершён давно или брошен
+    (процесс упал) и блокировка истекла давно. Ключи прогноза содержат даты,
+    поэтому без чистки таблица растёт на строку в день на локацию
+    """
+    cutoff = (now or timezone.now()) - keep
+    return RunLock.objects.filter(
+        Q(token="", finished_at__lt=cutoff) | Q(expires_at__lt=cutoff)
+    )
+
+
+def purge_run_locks(keep: dt.timedelta = RUN_LOCK_KEEP) -> int:
+    deleted, _ = stale_run_locks(keep).delete()
+    return deleted
+
+
+def single_flight(
+    key: str,
+    compute: Callable[[], T],
+    shared: Callable[[], T],
+    ttl: dt.timedelta = RUN_LOCK_TTL,
+    wait_seconds: float = RUN_LOCK_WAIT_SECONDS,
+    poll_seconds: float = RUN_LOCK_POLL_SECONDS,
+) -> T:
+    """
+    Один расчёт на ключ между всеми процессами (блокировка в БД, таблица RunLock).
+    Первый вызвавший выполняет compute(); остальные ждут его завершения и получают
+    shared() — результат, уже сохранённый лидером. Если лидер упал, расчёт
+    подхватывает один из ожидающих.
+    Вызывать вне transaction.atomic, иначе состояние блокировки не видно другим процессам
+    """
+    deadline = time.monotonic() + wait_seconds
+    awaited: dt.datetime | None = None  # начало чужого расчёта, которого ждём
+
+    while True:
+        if awaited is not None and _finished_ok(key, awaited):
+            return shared()
+
+        token = _try_acquire(key, ttl)
+        if token is not None:
+            succeeded = False
+            try:
+                result = compute()
+                succeeded = True
+                return result
+            finally:
+                _release(key, token, succeeded)
+
+        if awaited is None:
+            awaited = _started_at(key)
+        if time.monotonic() >= deadline:
+            raise TimeoutError(_BUSY_MESSAGE)
+        time.sleep(poll_seconds)
+
+
+async def asingle_flight(
+    key: str,
+    compute: Callable[[], Awaitable[T]],
+    shared: Callable[[], Awaitable[T]],
+    ttl: dt.timedelta = RUN_LOCK_TTL,
+    wait_seconds: float = RUN_LOCK_WAIT_SECONDS,
+    poll_seconds: float = RUN_LOCK_POLL_SECONDS,
+) -> T:
+    """
+    single_flight для async-кода: та же блокировка RunLock (sync- и async-вызовы
+    одного ключа ждут друг друга), ожидание — asyncio.sleep вместо потока
+    """
+    deadline = time.monotonic() + wait_seconds
+    awaited: dt.datetime | None = None
+
+    while True:
+        if awaited is not None and await sync_to_async(_finished_ok)(key, awaited):
+            return await shared()
+
+        token = await sync_to_async(_try_acquire)(key, ttl)
+        if token is not None:
+            succeeded = False
+            try:
+                result = await compute()
+                succeeded = True
+                return result
+            finally:
+                await sync_to_async(_release)(key, token, succeeded)
+
+        if awaited is None:
+            awaited = await sync_to_async(_started_at)(key)
+        if time.monotonic() >= deadline:
+            raise TimeoutError(_BUSY_MESSAGE)
+        await asyncio.sleep(poll_seconds)
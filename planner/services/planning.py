@@ -1,73 +1,191 @@
+import asyncio
 import datetime as dt
-from dataclasses import dataclass
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from itertools import islice
+from typing import Iterable, Iterator
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
 
-from django.db import transaction
+import numpy as np
+from asgiref.sync import sync_to_async
+from django.db import reset_queries, transaction
 from django.utils import timezone
 
-from planner.models import AstroWindow, ForecastHour, SessionRequest, PlanHourScore
-from planner.services.astro_calc import compute_hour_astro
-from planner.services.open_meteo import fetch_and_cache_forecast
+from planner.models import AstroWindow, Location, NightSummary, SessionRequest, PlanHourScore, PlanProfile, Target
+from planner.services.astro_calc import AstroSeries, compute_astro_series
+from planner.services.ical import touch_feeds
+from planner.services.locks import asingle_flight, single_flight, try_lock, unlock
+from planner.services.profiling import profile_run
+from planner.services.result_cache import load_result, result_key, store_result
+from planner.services.scoring import ScoreExpression, profile_expression, score_features
+from planner.services.sky_quality import location_sky_quality
+from planner.services.weather import (
+    FORECAST_HORIZON_DAYS,
+    ForecastArrays,
+    afetch_forecast_arrays,
+    cached_forecast_arrays,
+    ensemble_stats,
+    fetch_forecast_arrays,
+    fetch_forecast_arrays_many,
+)
+
+logger = logging.getLogger(__name__)
+
+# Почасовые строки пишем пачками — на годовом плане их ~8760
+HOUR_SCORES_BATCH_SIZE = 1000
+
+# Пакетный расчёт (plan_batch): планов в куске — столько держим в памяти и пишем одной транзакцией
+BATCH_CHUNK_SIZE = 200
+
+# Минимальный score «хорошего» часа
+GOOD_SCORE = 60.0
+
+# Засветка: небо темнее DARK_SKY_SQM (mag/arcsec²) не штрафуем, дальше — LIGHT_POLLUTION_PER_MAG
+# за каждую звёздную величину, не больше LIGHT_POLLUTION_MAX_PENALTY
+DARK_SKY_SQM = 21.5
+LIGHT_POLLUTION_PER_MAG = 10.0
+LIGHT_POLLUTION_MAX_PENALTY = 30.0
+
+# Пул для эфемерид из async-вьюх: numpy/ERFA большую часть времени отпускают GIL
+ASTRO_EXECUTOR = ThreadPoolExecutor(max_workers=4, thread_name_prefix="astro")
 
 
 @dataclass(frozen=True)
 class HourScore:
     timestamp: dt.datetime
     score: float
-    cloud_cover: int
+    cloud_cover: int | None  # None — час за горизонтом прогноза (только астрономия)
     moon_illumination: float
     target_alt: float
     is_dark: bool
 
 
-def _compute_score(plan: SessionRequest, fh: ForecastHour, astro) -> HourScore:
-    cloud = int(fh.cloud_cover)
-    target_alt = float(astro.target_alt_deg)
-    moon_illum = float(astro.moon_illumination)
-    moon_alt = float(astro.moon_alt_deg)
-    sun_alt = float(astro.sun_alt_deg)
+def hour_grid(date_from: dt.date, date_to: dt.date) -> list[dt.datetime]:
+    """
+    Все часы периода [date_from, date_to] (UTC), как их размечает кэш прогноза
+    """
+    start = timezone.make_aware(dt.datetime.combine(date_from, dt.time.min), dt.timezone.utc)
+    hours = ((date_to - date_from).days + 1) * 24
+    return [start + dt.timedelta(hours=i) for i in range(hours)]
+
+
+def forecast_range(date_from: dt.date, date_to: dt.date, today: dt.date) -> tuple[dt.date, dt.date] | None:
+    """
+    Часть периода, для которой есть смысл запрашивать прогноз:
+    не дальше горизонта от сегодняшнего дня и не длиннее FORECAST_HORIZON_DAYS.
+    None — весь период за горизонтом, считаем только астрономию
+    """
+    horizon = dt.timedelta(days=FORECAST_HORIZON_DAYS - 1)
+    last = min(date_to, today + horizon)
+    first = max(date_from, last - horizon)
+    if first > last:
+        return None
+    return first, last
+
 
-    is_dark = sun_alt < -18.0  # астрономическая ночь
+def _grid_slots(grid: list[dt.datetime], forecast: ForecastArrays) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Часы прогноза, попадающие в сетку: маска по прогнозу и индексы в сетке
+    """
+    start = np.datetime64(grid[0].replace(tzinfo=None), "s")
+    offset = (forecast.timestamps - start) // np.timedelta64(1, "h")
+    on_hour = (forecast.timestamps - start) % np.timedelta64(1, "h") == np.timedelta64(0, "s")
+    ok = on_hour & (offset >= 0) & (offset < len(grid))
+    return ok, offset[ok]
 
-    score = 100.0
 
-    # Облачность
-    score -= 0.8 * cloud
+def align_forecast(grid: list[dt.datetime], forecast: ForecastArrays) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Раскладывает прогноз по сетке часов плана: облачность и осадки, NaN там, где прогноза нет
+    """
+    cloud = np.full(len(grid), np.nan)
+    precip = np.full(len(grid), np.nan)
+    if not grid or not len(forecast):
+        return cloud, precip
 
-    # Штраф за осадки (простейший, можно уточнять)
-    if float(fh.precipitation) > 0:
-        score -= 15.0
+    ok, slots = _grid_slots(grid, forecast)
+    cloud[slots] = forecast.cloud_cover[ok]
+    precip[slots] = forecast.precipitation[ok]
+    return cloud, precip
 
-    # Бонус за темноту
-    if is_dark:
-        score += 10.0
-    else:
-        # если сумерки - штраф
-        score -= 5.0
 
-    # Бонус за высоту цели
-    if target_alt > plan.min_target_altitude:
-        score += min(20.0, (target_alt - plan.min_target_altitude) * 0.7)
-    else:
-        # если цель ниже минимума - сильный штраф
-        score -= 30.0
+def align_ensemble(grid: list[dt.datetime], forecast: ForecastArrays) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Вероятность ясного неба и разброс облачности по ансамблю (ensemble_stats) на сетке плана;
+    NaN там, где прогноза нет, и везде, если прогноз одной модели
+    """
+    clear_prob = np.full(len(grid), np.nan)
+    cloud_spread = np.full(len(grid), np.nan)
+    if not grid or not len(forecast) or forecast.ensemble_cloud is None:
+        return clear_prob, cloud_spread
 
-    # Штраф за Луну (если план просит учитывать Луну)
-    if plan.avoid_moon:
-        # Чем выше луна и чем ярче — тем хуже
-        moon_factor = max(0.0, moon_alt / 90.0)
-        score -= 40.0 * moon_illum * moon_factor
+    ok, slots = _grid_slots(grid, forecast)
+    probability, spread = ensemble_stats(forecast)
+    clear_prob[slots] = probability[ok]
+    cloud_spread[slots] = spread[ok]
+    return clear_prob, cloud_spread
 
-    # Ограничим score
-    score = max(0.0, min(100.0, score))
-
-    return HourScore(
-        timestamp=fh.timestamp,
-        score=float(score),
-        cloud_cover=cloud,
-        moon_illumination=moon_illum,
-        target_alt=target_alt,
-        is_dark=is_dark,
+
+def score_hours(
+    cloud: np.ndarray,
+    precip: np.ndarray,
+    sun_alt: np.ndarray,
+    moon_alt: np.ndarray,
+    moon_illum: np.ndarray,
+    target_alt: np.ndarray,
+    min_target_altitude: float | np.ndarray,
+    avoid_moon: bool,
+    sky_penalty: float | np.ndarray = 0.0,
+    expression: ScoreExpression | None = None,
+    clear_prob: float | np.ndarray = np.nan,
+    cloud_spread: float | np.ndarray = np.nan,
+) -> np.ndarray:
+    """
+    Score для всех часов сразу (массивы любой совместимой формы, например цели × часы).
+    cloud/precip — NaN там, где прогноза нет: погодные штрафы не применяются.
+    min_target_altitude — число или почасовой массив (с учётом профиля горизонта, см. min_altitude),
+    sky_penalty — штраф за засветку неба локации (light_pollution_penalty),
+    clear_prob/cloud_spread — по ансамблю моделей (align_ensemble), NaN — ансамбля нет,
+    expression — формула профиля оценки (profile_expression), по умолчанию стандартная:
+    облачность, осадки, темнота, высота цели над минимумом, Луна (если avoid_moon), засветка
+    """
+    expression = expression or profile_expression(None)
+    features = score_features(
+        cloud, precip, sun_alt, moon_alt, moon_illum, target_alt, min_target_altitude, avoid_moon, sky_penalty,
+        clear_prob, cloud_spread,
     )
+    shape = np.broadcast(cloud, target_alt).shape
+    # Ограничим score
+    return np.clip(np.broadcast_to(expression.evaluate(features), shape), 0.0, 100.0)
+
+
+def light_pollution_penalty(sqm: float | None, target_type: str) -> float:
+    """
+    Штраф за засветку: только для DSO и Млечного пути — Луне и планетам городское небо не мешает.
+    sqm=None — яркость неба неизвестна
+    """
+    if sqm is None or target_type not in (Target.TargetType.DSO, Target.TargetType.MILKY_WAY):
+        return 0.0
+    return float(np.clip((DARK_SKY_SQM - sqm) * LIGHT_POLLUTION_PER_MAG, 0.0, LIGHT_POLLUTION_MAX_PENALTY))
+
+
+def min_altitude(plan: SessionRequest, horizon_alt: np.ndarray) -> np.ndarray:
+    """
+    Почасовая минимальная высота цели: порог плана или горизонт локации на азимуте цели, что выше
+    """
+    return np.maximum(float(plan.min_target_altitude), horizon_alt)
+
+
+def plan_expression(plan: SessionRequest) -> ScoreExpression:
+    return profile_expression(plan.scoring_profile if plan.scoring_profile_id else None)
+
+
+def _avg_cloud(clouds: list[int | None]) -> int | None:
+    known = [c for c in clouds if c is not None]
+    if not known:
+        return None
+    return int(round(sum(known) / len(known)))
 
 
 def _merge_to_windows(plan: SessionRequest, good_hours: list[HourScore]) -> list[AstroWindow]:
@@ -104,7 +222,7 @@ def _merge_to_windows(plan: SessionRequest, good_hours: list[HourScore]) -> list
                     start_time=cur_start,
                     end_time=cur_end + dt.timedelta(hours=1),
                     score=sum(scores) / len(scores),
-                    avg_cloud_cover=int(round(sum(clouds) / len(clouds))),
+                    avg_cloud_cover=_avg_cloud(clouds),
                     moon_illumination=sum(moon_ills) / len(moon_ills),
                     max_target_altitude=max_alt,
                     is_astronomical_dark=dark_flag,
@@ -124,7 +242,7 @@ def _merge_to_windows(plan: SessionRequest, good_hours: list[HourScore]) -> list
             start_time=cur_start,
             end_time=cur_end + dt.timedelta(hours=1),
             score=sum(scores) / len(scores),
-            avg_cloud_cover=int(round(sum(clouds) / len(clouds))),
+            avg_cloud_cover=_avg_cloud(clouds),
             moon_illumination=sum(moon_ills) / len(moon_ills),
             max_target_altitude=max_alt,
             is_astronomical_dark=dark_flag,
@@ -134,52 +252,549 @@ def _merge_to_windows(plan: SessionRequest, good_hours: list[HourScore]) -> list
     return windows
 
 
-@transaction.atomic
-def run_planning(plan: SessionRequest) -> list[HourScore]:
+def location_tz(location: Location) -> dt.tzinfo:
+    try:
+        return ZoneInfo((location.timezone or "").strip() or "UTC")
+    except (ZoneInfoNotFoundError, ValueError):
+        return dt.timezone.utc
+
+
+def _night_of(ts: dt.datetime, tz: dt.tzinfo) -> dt.date:
     """
-    1) Загружает/кэширует прогноз
-    2) Считает астрономию на каждый час
+    Ночь — с полудня до полудня по местному времени, датой вечера
+    """
+    return (ts.astimezone(tz) - dt.timedelta(hours=12)).date()
+
+
+def _summarize_nights(
+    plan: SessionRequest,
+    hour_scores: list[HourScore],
+    good: list[HourScore],
+    windows: list[AstroWindow],
+) -> list[NightSummary]:
+    """
+    Сворачиваем почасовые результаты и окна в одну строку на ночь
+    """
+    tz = location_tz(plan.location)
+    good_ts = {h.timestamp for h in good}
+
+    nights: dict[dt.date, NightSummary] = {}
+    moon_ills: dict[dt.date, list[float]] = {}
+    for h in hour_scores:
+        night = _night_of(h.timestamp, tz)
+        summary = nights.get(night)
+        if summary is None:
+            summary = nights[night] = NightSummary(plan=plan, night=night, best_score=h.score, has_forecast=False)
+            moon_ills[night] = []
+
+        summary.best_score = max(summary.best_score, h.score)
+        summary.dark_hours += int(h.is_dark)
+        summary.usable_hours += int(h.timestamp in good_ts)
+        summary.has_forecast = summary.has_forecast or h.cloud_cover is not None
+        moon_ills[night].append(h.moon_illumination)
+
+    for night, summary in nights.items():
+        summary.moon_illumination = sum(moon_ills[night]) / len(moon_ills[night])
+
+    for w in windows:
+        summary = nights.get(_night_of(w.start_time, tz))
+        if summary is None:
+            continue
+        summary.windows_count += 1
+        if summary.best_window_score is None or w.score > summary.best_window_score:
+            summary.best_window_start = w.start_time
+            summary.best_window_end = w.end_time
+            summary.best_window_score = float(w.score)
+
+    return [nights[night] for night in sorted(nights)]
+
+
+def run_planning(
+    plan: SessionRequest,
+    forecast: ForecastArrays | None = None,
+    profile: str | None = None,
+    requested_by: str = "",
+) -> list[HourScore]:
+    """
+    1) Загружает/кэширует прогноз (в пределах горизонта прогноза)
+    2) Считает астрономию сразу на все часы периода
     3) Считает score
-    4) Сохраняет окна AstroWindow (перезаписывая старые)
+    4) Сохраняет окна AstroWindow и свод по ночам NightSummary (перезаписывая старые)
     Возвращает массив почасовых HourScore (для графиков)
+    Часы за горизонтом прогноза считаются только по астрономии (cloud_cover=None)
+
+    Параллельные запуски одного плана (двойной клик, несколько вкладок, воркеров)
+    не считают заново: ждут идущий расчёт и получают сохранённый им результат.
+    forecast — уже загруженный прогноз локации (см. replanning), тогда без запроса к провайдеру.
+    profile — режим профайлера (см. profiling) или флаг plan.profile_next_run: трасса прогона пишется в PlanProfile
     """
+    mode = profile or (PlanProfile.MODE_CPROFILE if plan.profile_next_run else None)
+    if mode is None:
+        compute = lambda: _run_planning(plan, forecast)
+    else:
+        compute = lambda: profile_run(plan, mode, lambda: _run_planning(plan, forecast), requested_by)
+    return single_flight(f"plan:{plan.pk}", compute, lambda: stored_hour_scores(plan))
+
+
+def stored_hour_scores(plan: SessionRequest) -> list[HourScore]:
+    return [
+        HourScore(
+            timestamp=row.timestamp,
+            score=row.score,
+            cloud_cover=row.cloud_cover,
+            moon_illumination=row.moon_illumination,
+            target_alt=row.target_altitude,
+            is_dark=row.is_astronomical_dark,
+        )
+        for row in plan.hour_scores.order_by("timestamp")
+    ]
+
+
+def _plan_grid(plan: SessionRequest) -> tuple[list[dt.datetime], tuple[dt.date, dt.date] | None]:
+    days = (plan.date_to - plan.date_from).days + 1
+    if days > SessionRequest.MAX_PERIOD_DAYS:
+        raise ValueError(f"Период слишком большой. Выберите диапазон до {SessionRequest.MAX_PERIOD_DAYS} дней.")
+
+    grid = hour_grid(plan.date_from, plan.date_to)
+    return grid, forecast_range(plan.date_from, plan.date_to, timezone.localdate())
+
+
+def _run_planning(plan: SessionRequest, forecast: ForecastArrays | None = None) -> list[HourScore]:
+    grid, fc_range = _plan_grid(plan)
+
     # 1) forecast
-    forecast = fetch_and_cache_forecast(plan.location, plan.date_from, plan.date_to)
+    if fc_range is not None and forecast is None:
+        forecast = fetch_forecast_arrays(plan.location, *fc_range)
+    weather = _aligned(grid, forecast if fc_range is not None else None)
+
+    # 2) ряды до оценки — из кэша PlanResult или астрономия
+    key = result_key(plan, plan.date_from, plan.date_to, *weather)
+    features = _plan_features(plan, grid, weather, key)
+
+    # 3-4) score по профилю плана и запись
+    return _save(plan, grid, features, key)
+
+
+def _plan_features(
+    plan: SessionRequest, grid: list[dt.datetime], weather: tuple[np.ndarray, ...], key: str,
+) -> dict[str, np.ndarray]:
+    """
+    Тот же вход уже считали (другой пользователь, пересозданный план) — берём готовые ряды,
+    иначе считаем астрономию и кладём ряды в кэш под ключом result_key
+    """
+    features = load_result(key)
+    if features is None:
+        astro = compute_astro_series(plan.location, plan.target, grid)
+        features = _features(weather, astro)
+        store_result(key, features)
+    return features
+
+
+def rescore_plan(plan: SessionRequest) -> list[HourScore] | None:
+    """
+    Пересчитать score плана (другой профиль оценки, пороги) по рядам последнего расчёта из PlanResult:
+    без эфемерид и запроса погоды. None — рядов в кэше уже нет, нужен run_planning
+    """
+    if not plan.result_id:
+        return None
+    features = load_result(plan.result_id)
+    if features is None:
+        return None
+    grid, _ = _plan_grid(plan)
+    if len(grid) != len(features["target_alt"]):
+        return None
+    return single_flight(
+        f"plan:{plan.pk}",
+        lambda: _save(plan, grid, features, plan.result_id),
+        lambda: stored_hour_scores(plan),
+    )
+
+
+async def arun_planning(plan: SessionRequest, profile: str | None = None, requested_by: str = "") -> list[HourScore]:
+    """
+    run_planning для async-вьюх: прогноз — async HTTP, эфемериды — в пуле потоков
+    ASTRO_EXECUTOR, запись — через sync_to_async. Event loop свободен, пока ждём сеть и CPU.
+    plan должен быть загружен с select_related("location", "target")
+    """
+    if profile or plan.profile_next_run:
+        # Профилируемый прогон — синхронно в одном потоке: трасса видит все этапы расчёта
+        return await sync_to_async(run_planning)(plan, profile=profile, requested_by=requested_by)
+    return await asingle_flight(
+        f"plan:{plan.pk}",
+        lambda: _arun_planning(plan),
+        sync_to_async(lambda: stored_hour_scores(plan)),
+    )
+
+
+async def _arun_planning(plan: SessionRequest) -> list[HourScore]:
+    grid, fc_range = _plan_grid(plan)
+    forecast = await afetch_forecast_arrays(plan.location, *fc_range) if fc_range is not None else None
+    weather = _aligned(grid, forecast)
+
+    key = result_key(plan, plan.date_from, plan.date_to, *weather)
+    features = await sync_to_async(load_result)(key)
+    if features is None:
+        loop = asyncio.get_running_loop()
+        astro = await loop.run_in_executor(ASTRO_EXECUTOR, compute_astro_series, plan.location, plan.target, grid)
+        features = _features(weather, astro)
+        await sync_to_async(store_result)(key, features)
 
-    # 2-3) compute scores
-    hour_scores: list[HourScore] = []
-    for fh in forecast:
-        astro = compute_hour_astro(plan.location, plan.target, fh.timestamp)
-        hs = _compute_score(plan, fh, astro)
-        hour_scores.append(hs)
+    return await sync_to_async(_save)(plan, grid, features, key)
+
+
+def _aligned(grid: list[dt.datetime], forecast: ForecastArrays | None) -> tuple[np.ndarray, ...]:
+    """
+    Погода на сетке плана: облачность, осадки, вероятность ясного неба и разброс облачности
+    """
+    if forecast is None:
+        return tuple(np.full(len(grid), np.nan) for _ in range(4))
+    return (*align_forecast(grid, forecast), *align_ensemble(grid, forecast))
+
+
+def _features(weather: tuple[np.ndarray, ...], astro: AstroSeries) -> dict[str, np.ndarray]:
+    """
+    Почасовые ряды до оценки — в том виде, в каком они лежат в кэше PlanResult
+    """
+    cloud, precip, clear_prob, cloud_spread = weather
+    return {
+        "cloud": np.asarray(cloud, dtype=float),
+        "precip": np.asarray(precip, dtype=float),
+        "clear_prob": np.asarray(clear_prob, dtype=float),
+        "cloud_spread": np.asarray(cloud_spread, dtype=float),
+        "sun_alt": np.asarray(astro.sun_alt_deg, dtype=float),
+        "moon_alt": np.asarray(astro.moon_alt_deg, dtype=float),
+        "moon_illumination": np.asarray(astro.moon_illumination, dtype=float),
+        "target_alt": np.asarray(astro.target_alt_deg, dtype=float),
+        "horizon_alt": np.asarray(astro.horizon_alt_deg, dtype=float),
+    }
+
+
+def _score_arrays(plan: SessionRequest, features: dict[str, np.ndarray]) -> dict[str, np.ndarray]:
+    """
+    Score по профилю оценки и порогам плана — дёшево, ряды уже посчитаны
+    """
+    cloud, target_alt = features["cloud"], features["target_alt"]
+    min_alt = min_altitude(plan, features["horizon_alt"])
+    score = score_hours(
+        cloud,
+        features["precip"],
+        features["sun_alt"],
+        features["moon_alt"],
+        features["moon_illumination"],
+        target_alt,
+        min_alt,
+        plan.avoid_moon,
+        light_pollution_penalty(location_sky_quality(plan.location), plan.target.target_type),
+        plan_expression(plan),
+        features["clear_prob"],
+        features["cloud_spread"],
+    )
+    return {
+        "score": score,
+        "cloud_cover": np.where(np.isnan(cloud), -1, cloud).astype(np.int16),  # -1 — нет прогноза
+        "moon_illumination": features["moon_illumination"],
+        "target_alt": target_alt,
+        "is_dark": features["sun_alt"] < -18.0,
+        "visible": target_alt >= min_alt,  # выше порога и профиля горизонта
+    }
+
+
+def _hour_scores(plan: SessionRequest, grid: list[dt.datetime], features: dict[str, np.ndarray]) -> tuple[list[HourScore], list[HourScore]]:
+    """
+    HourScore по рядам результата и хорошие часы по порогам плана
+    """
+    return _to_hour_scores(plan, grid, _score_arrays(plan, features))
+
+
+def _to_hour_scores(plan: SessionRequest, grid: list[dt.datetime], arrays: dict[str, np.ndarray]) -> tuple[list[HourScore], list[HourScore]]:
+    score, cloud = arrays["score"].tolist(), arrays["cloud_cover"].tolist()
+    moon, alt, dark = arrays["moon_illumination"].tolist(), arrays["target_alt"].tolist(), arrays["is_dark"].tolist()
+    visible = arrays["visible"].tolist()
+
+    hour_scores: list[HourScore] = [
+        HourScore(
+            timestamp=ts,
+            score=score[i],
+            cloud_cover=cloud[i] if cloud[i] >= 0 else None,
+            moon_illumination=moon[i],
+            target_alt=alt[i],
+            is_dark=dark[i],
+        )
+        for i, ts in enumerate(grid)
+    ]
 
     # хорошие часы (по порогам плана)
     good = [
-        h for h in hour_scores
-        if h.cloud_cover <= plan.max_cloud_cover
-        and h.target_alt >= plan.min_target_altitude
-        and h.score >= 60.0
+        h for h, v in zip(hour_scores, visible)
+        if (h.cloud_cover is None or h.cloud_cover <= plan.max_cloud_cover)
+        and v
+        and h.score >= GOOD_SCORE
     ]
+    return hour_scores, good
 
-    # 4) windows
-    AstroWindow.objects.filter(plan=plan).delete()
+
+def plan_in_memory(plan: SessionRequest, forecast: ForecastArrays | None) -> tuple[list[HourScore], list[AstroWindow]]:
+    """
+    Конвейер run_planning без единой записи в БД (демо для гостей): прогноз -> астрономия ->
+    score -> окна. plan, его location и target могут быть несохранёнными; прогноз передаётся
+    готовым, кэш PlanResult и блокировки не используются. Окна — несохранённые AstroWindow
+    """
+    grid, fc_range = _plan_grid(plan)
+    weather = _aligned(grid, forecast if fc_range is not None else None)
+    astro = compute_astro_series(plan.location, plan.target, grid)
+    hour_scores, good = _hour_scores(plan, grid, _features(weather, astro))
+    return hour_scores, _merge_to_windows(plan, good)
+
+
+def _save(plan: SessionRequest, grid: list[dt.datetime], features: dict[str, np.ndarray], key: str) -> list[HourScore]:
+    hour_scores, good = _hour_scores(plan, grid, features)
+
+    # 4) windows — запись одной короткой транзакцией, сеть и расчёты остались до неё
     windows = _merge_to_windows(plan, good)
+    _save_results(plan, hour_scores, good, windows, key)
+    return hour_scores
+
+
+@transaction.atomic
+def _save_results(
+    plan: SessionRequest,
+    hour_scores: list[HourScore],
+    good: list[HourScore],
+    windows: list[AstroWindow],
+    result_key: str | None = None,
+) -> None:
+    SessionRequest.objects.filter(pk=plan.pk).update(result_id=result_key)
+    plan.result_id = result_key
+
+    AstroWindow.objects.filter(plan=plan).delete()
     if windows:
         AstroWindow.objects.bulk_create(windows)
 
+    # Свод по ночам — для списка планов и календаря
+    NightSummary.objects.filter(plan=plan).delete()
+    NightSummary.objects.bulk_create(_summarize_nights(plan, hour_scores, good, windows))
+
     # Сохраняем почасовые score
     PlanHourScore.objects.filter(plan=plan).delete()
-    PlanHourScore.objects.bulk_create([
-        PlanHourScore(
-            plan=plan,
-            timestamp=hs.timestamp,
-            score=hs.score,
-            cloud_cover=hs.cloud_cover,
-            moon_illumination=hs.moon_illumination,
-            target_altitude=hs.target_alt,
-            is_astronomical_dark=hs.is_dark,
+    PlanHourScore.objects.bulk_create(
+        (
+            PlanHourScore(
+                plan=plan,
+                timestamp=hs.timestamp,
+                score=hs.score,
+                cloud_cover=hs.cloud_cover,
+                moon_illumination=hs.moon_illumination,
+                target_altitude=hs.target_alt,
+                is_astronomical_dark=hs.is_dark,
+            )
+            for hs in hour_scores
+        ),
+        batch_size=HOUR_SCORES_BATCH_SIZE,
+    )
+
+    # Окна изменились — лента календаря пользователя получит новый ETag
+    touch_feeds(plan.user_id)
+
+
+@dataclass(frozen=True)
+class BatchItem:
+    """
+    Посчитанный план куска: почасовые ряды — массивами, окна и свод по ночам — готовыми строками
+    """
+    plan: SessionRequest
+    result_key: str
+    start: dt.datetime
+    arrays: dict[str, np.ndarray]
+    windows: list[AstroWindow]
+    nights: list[NightSummary]
+
+
+@dataclass
+class BatchProgress:
+    planned: int = 0
+    failed: list[int] = field(default_factory=list)
+    busy: list[int] = field(default_factory=list)  # план уже считается в другом запросе — пропущен
+
+
+def plan_batch(
+    plans,
+    chunk_size: int = BATCH_CHUNK_SIZE,
+    batch_size: int = HOUR_SCORES_BATCH_SIZE,
+    cached_forecast: bool = False,
+    today: dt.date | None = None,
+) -> Iterator[BatchProgress]:
+    """
+    Пакетный расчёт тысяч планов с памятью, не зависящей от размера пакета.
+    Планы читаются потоком (iterator) и считаются кусками по chunk_size: прогноз куска —
+    одним пакетным запросом на локации, запись куска — одной транзакцией пачками по batch_size,
+    почасовые строки создаются генератором прямо при записи. После каждого куска — его итог.
+    Планы куска захватываются той же блокировкой plan:{pk}, что и run_planning; план, который
+    сейчас считается в другом месте, пропускается (busy) — его результат запишет тот расчёт.
+    cached_forecast — прогноз только из кэша ForecastHour, без запросов к провайдеру
+    """
+    today = today or timezone.localdate()
+    stream = (
+        plans.select_related("location", "target", "scoring_profile")
+        .order_by("pk")
+        .iterator(chunk_size=chunk_size)
+    )
+    for chunk in _batched(stream, chunk_size):
+        # Журнал запросов при DEBUG растёт на каждый запрос — между кусками он не нужен
+        reset_queries()
+        progress = BatchProgress()
+        tokens: dict[int, str] = {}
+        for plan in chunk:
+            token = try_lock(f"plan:{plan.pk}")
+            if token is None:
+                progress.busy.append(plan.pk)
+            else:
+                tokens[plan.pk] = token
+        chunk = [plan for plan in chunk if plan.pk in tokens]
+
+        items: list[BatchItem] = []
+        saved = False
+        try:
+            items = _compute_chunk(chunk, today, cached_forecast, progress)
+            _save_batch(items, batch_size)
+            saved = True
+        finally:
+            # Блокировки отпускаем до yield: потребитель генератора может надолго задержаться
+            written = {item.plan.pk for item in items} if saved else set()
+            for pk, token in tokens.items():
+                unlock(f"plan:{pk}", token, pk in written)
+
+        progress.planned = len(items)
+        yield progress
+
+
+def _compute_chunk(
+    chunk: list[SessionRequest], today: dt.date, cached_forecast: bool, progress: BatchProgress,
+) -> list[BatchItem]:
+    forecasts = _chunk_forecasts(chunk, today, cached_forecast, progress)
+
+    # Одинаковые планы куска (та же точка, цель, период и прогноз) берут ряды из PlanResult один раз
+    features_by_key: dict[str, dict[str, np.ndarray]] = {}
+    items: list[BatchItem] = []
+    for plan in chunk:
+        if plan.pk in progress.failed:
+            continue
+        try:
+            items.append(_batch_item(plan, forecasts.get(_forecast_key(plan, today)), features_by_key))
+        except Exception:
+            logger.exception("Не удалось рассчитать план %s", plan.pk)
+            progress.failed.append(plan.pk)
+    return items
+
+
+def _batched(iterable: Iterable, size: int) -> Iterator[list]:
+    it = iter(iterable)
+    while batch := list(islice(it, size)):
+        yield batch
+
+
+def _forecast_key(plan: SessionRequest, today: dt.date) -> tuple | None:
+    fc_range = forecast_range(plan.date_from, plan.date_to, today)
+    return None if fc_range is None else (plan.location_id, *fc_range)
+
+
+def _chunk_forecasts(
+    chunk: list[SessionRequest], today: dt.date, cached: bool, progress: BatchProgress,
+) -> dict[tuple, ForecastArrays]:
+    """
+    Прогнозы куска: по одному на локацию и диапазон дат, локации одного диапазона — одним пакетом.
+    Планы, для которых прогноз не загрузился, попадают в failed
+    """
+    by_range: dict[tuple[dt.date, dt.date], dict[int, Location]] = {}
+    for plan in chunk:
+        key = _forecast_key(plan, today)
+        if key is not None:
+            by_range.setdefault(key[1:], {})[plan.location_id] = plan.location
+
+    forecasts: dict[tuple, ForecastArrays] = {}
+    for fc_range, locations in by_range.items():
+        try:
+            if cached:
+                loaded = [cached_forecast_arrays(location, *fc_range) for location in locations.values()]
+            else:
+                loaded = fetch_forecast_arrays_many(list(locations.values()), *fc_range)
+        except Exception:
+            logger.exception("Не удалось загрузить прогноз на %s — %s", *fc_range)
+            missing = {(location_id, *fc_range) for location_id in locations}
+            progress.failed.extend(p.pk for p in chunk if _forecast_key(p, today) in missing)
+            continue
+        for location_id, forecast in zip(locations, loaded):
+            forecasts[(location_id, *fc_range)] = forecast
+    return forecasts
+
+
+def _batch_item(
+    plan: SessionRequest, forecast: ForecastArrays | None, features_by_key: dict[str, dict[str, np.ndarray]],
+) -> BatchItem:
+    grid, _ = _plan_grid(plan)
+    weather = _aligned(grid, forecast)
+    key = result_key(plan, plan.date_from, plan.date_to, *weather)
+    features = features_by_key.get(key)
+    if features is None:
+        features = features_by_key[key] = _plan_features(plan, grid, weather, key)
+    arrays = _score_arrays(plan, features)
+
+    # HourScore нужны только на окна и свод по ночам; почасовые строки потом строятся из массивов
+    hour_scores, good = _to_hour_scores(plan, grid, arrays)
+    windows = _merge_to_windows(plan, good)
+    return BatchItem(
+        plan=plan,
+        result_key=key,
+        start=grid[0],
+        arrays={name: arrays[name] for name in ("score", "cloud_cover", "moon_illumination", "target_alt", "is_dark")},
+        windows=windows,
+        nights=_summarize_nights(plan, hour_scores, good, windows),
+    )
+
+
+def _hour_rows(item: BatchItem) -> Iterator[PlanHourScore]:
+    a = item.arrays
+    columns = zip(
+        a["score"].tolist(), a["cloud_cover"].tolist(), a["moon_illumination"].tolist(),
+        a["target_alt"].tolist(), a["is_dark"].tolist(),
+    )
+    for i, (score, cloud, moon, alt, dark) in enumerate(columns):
+        yield PlanHourScore(
+            plan_id=item.plan.pk,
+            timestamp=item.start + dt.timedelta(hours=i),
+            score=score,
+            cloud_cover=cloud if cloud >= 0 else None,
+            moon_illumination=moon,
+            target_altitude=alt,
+            is_astronomical_dark=dark,
         )
-        for hs in hour_scores
-    ])
 
-    return hour_scores
+
+def _bulk_create(model, rows: Iterable, batch_size: int) -> None:
+    # bulk_create сам превращает вход в список — поток режем на пачки до него
+    for batch in _batched(rows, batch_size):
+        model.objects.bulk_create(batch)
+
+
+@transaction.atomic
+def _save_batch(items: list[BatchItem], batch_size: int) -> None:
+    """
+    Запись куска планов: то же, что _save_results, но удаление и вставка — на весь кусок сразу
+    """
+    if not items:
+        return
+    plans = [item.plan for item in items]
+    for item in items:
+        item.plan.result_id = item.result_key
+    SessionRequest.objects.bulk_update(plans, ["result_id"], batch_size=batch_size)
+
+    ids = [plan.pk for plan in plans]
+    AstroWindow.objects.filter(plan_id__in=ids).delete()
+    NightSummary.objects.filter(plan_id__in=ids).delete()
+    PlanHourScore.objects.filter(plan_id__in=ids).delete()
+
+    _bulk_create(AstroWindow, (w for item in items for w in item.windows), batch_size)
+    _bulk_create(NightSummary, (n for item in items for n in item.nights), batch_size)
+    _bulk_create(PlanHourScore, (row for item in items for row in _hour_rows(item)), batch_size)
+
+    for user_id in {plan.user_id for plan in plans}:
+        touch_feeds(user_id)
@@ -0,0 +1,177 @@
+"""
+Профилирование расчёта плана по запросу (staff или флаг плана).
+Без запроса код расчёта не меняется: профайлер создаётся только вокруг профилируемого прогона.
+cProfile — точные счётчики вызовов, трасса в формате pstats (snakeviz, flameprof).
+Семплирование — стеки потока расчёта раз в SAMPLE_INTERVAL, свёрнутые в строки
+«кадр;кадр;кадр N» (flamegraph.pl, speedscope), дешевле на горячих циклах
+"""
+import cProfile
+import io
+import marshal
+import os
+import pstats
+import sys
+import threading
+import time
+from collections import Counter
+from dataclasses import dataclass
+from typing import Callable, TypeVar
+
+from planner.models import PlanProfile, SessionRequest
+
+T = TypeVar("T")
+
+PROFILE_MODES = (PlanProfile.MODE_CPROFILE, PlanProfile.MODE_SAMPLE)
+PROFILE_PARAM = "profile"
+PROFILE_HEADER = "HTTP_X_PLANNER_PROFILE"
+
+SAMPLE_INTERVAL = 0.002  # с
+MAX_STACK_DEPTH = 128
+SUMMARY_ROWS = 30
+
+DOWNLOAD_NAMES = {
+    PlanProfile.MODE_CPROFILE: ("prof", "application/octet-stream"),
+    PlanProfile.MODE_SAMPLE: ("folded.txt", "text/plain; charset=utf-8"),
+}
+
+
+@dataclass(frozen=True)
+class Trace:
+    mode: str
+    seconds: float
+    data: bytes
+    summary: str
+
+
+def requested_mode(request) -> str | None:
+    """
+    Режим профилирования из ?profile= / POST profile / заголовка X-Planner-Profile.
+    Только для staff; «1» — cProfile
+    """
+    user = getattr(request, "user", None)
+    if user is None or not user.is_staff:
+        return None
+    raw = request.POST.get(PROFILE_PARAM) or request.GET.get(PROFILE_PARAM) or request.META.get(PROFILE_HEADER)
+    if not raw:
+        return None
+    raw = raw.strip().lower()
+    if raw in ("1", "true", "yes"):
+        return PlanProfile.MODE_CPROFILE
+    return raw if raw in PROFILE_MODES else None
+
+
+def profile_call(mode: str, func: Callable[[], T]) -> tuple[T, Trace]:
+    """
+    Выполнить func под профайлером в текущем потоке
+    """
+    if mode == PlanProfile.MODE_SAMPLE:
+        sampler = StackSampler(threading.get_ident(), root=sys._getframe())
+        started = time.perf_counter()
+        sampler.start()
+        try:
+            result = func()
+        finally:
+            sampler.stop()
+            seconds = time.perf_counter() - started
+        return result, Trace(mode, seconds, sampler.folded().encode("utf-8"), sampler.summary())
+
+    profiler = cProfile.Profile()
+    started = time.perf_counter()
+    profiler.enable()
+    try:
+        result = func()
+    finally:
+        profiler.disable()
+        seconds = time.perf_counter() - started
+    stats = pstats.Stats(profiler)
+    return result, Trace(mode, seconds, marshal.dumps(stats.stats), _pstats_summary(stats))
+
+
+def profile_run(plan: SessionRequest, mode: str, func: Callable[[], T], requested_by: str = "") -> T:
+    """
+    Профилируемый расчёт плана: трасса сохраняется в PlanProfile, флаг плана снимается.
+    Если расчёт упал, флаг остаётся — профилируется следующий прогон
+    """
+    result, trace = profile_call(mode, func)
+    save_trace(plan, trace, requested_by)
+    return result
+
+
+def save_trace(plan: SessionRequest, trace: Trace, requested_by: str = "") -> PlanProfile:
+    if plan.profile_next_run:
+        SessionRequest.objects.filter(pk=plan.pk).update(profile_next_run=False)
+        plan.profile_next_run = False
+    return PlanProfile.objects.create(
+        plan=plan,
+        mode=trace.mode,
+        requested_by=requested_by or "флаг плана",
+        duration_ms=round(trace.seconds * 1000),
+        data=trace.data,
+        summary=trace.summary,
+    )
+
+
+def _pstats_summary(stats: pstats.Stats) -> str:
+    out = io.StringIO()
+    stats.stream = out
+    stats.sort_stats(pstats.SortKey.CUMULATIVE).print_stats(SUMMARY_ROWS)
+    return out.getvalue()
+
+
+def _frame_label(code) -> str:
+    # Два последних компонента пути: planner/planning.py, astropy/…/sky_coordinate.py и т.п.
+    path = os.path.normpath(code.co_filename).split(os.sep)
+    return f"{code.co_qualname} ({'/'.join(path[-2:])}:{code.co_firstlineno})"
+
+
+class StackSampler:
+    """
+    Семплирующий профайлер одного потока: фоновый поток раз в interval читает
+    его текущий стек (sys._current_frames) и считает одинаковые стеки.
+    Кадры от root и выше (вьюха, middleware, сервер) в стеки не попадают
+    """
+
+    def __init__(self, thread_id: int, interval: float = SAMPLE_INTERVAL, root=None):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.root = root
+        self.stacks: Counter = Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="plan-profiler", daemon=True)
+
+    def start(self) -> None:
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None and frame is not self.root and len(stack) < MAX_STACK_DEPTH:
+                stack.append(_frame_label(frame.f_code))
+                frame = frame.f_back
+            if stack:
+                self.stacks[";".join(reversed(stack))] += 1
+
+    def folded(self) -> str:
+        return "".join(f"{stack} {n}\n" for stack, n in self.stacks.most_common())
+
+    def summary(self) -> str:
+        total = sum(self.stacks.values())
+        if not total:
+            return "Нет семплов: расчёт короче интервала семплирования."
+        own: Counter = Counter()
+        inclusive: Counter = Counter()
+        for stack, n in self.stacks.items():
+            frames = stack.split(";")
+            own[frames[-1]] += n
+            for frame in set(frames):
+                inclusive[frame] += n
+        lines = [f"Семплов: {total} (раз в {self.interval * 1000:.0f} мс)", "", "Собственное время:"]
+        lines += [f"{n / total:7.1%}  {frame}" for frame, n in own.most_common(SUMMARY_ROWS)]
+        lines += ["", "С вложенными вызовами:"]
+        lines += [f"{n / total:7.1%}  {frame}" for frame, n in inclusive.most_common(SUMMARY_ROWS)]
+        return "\n".join(lines)
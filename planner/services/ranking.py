@@ -0,0 +1,278 @@
+import datetime as dt
+from dataclasses import dataclass
+
+import numpy as np
+from django.utils import timezone
+
+from planner.models import Location, Target
+from planner.services.astro_calc import body_alt_az, fixed_alt_az, sun_moon_at, target_resolution
+from planner.services.catalog import ResolvedTarget, get_catalog
+from planner.services.horizon import HORIZON_POINTS, horizon_altitude, horizon_profile
+from planner.services.planning import (
+    GOOD_SCORE,
+    align_ensemble,
+    align_forecast,
+    forecast_range,
+    hour_grid,
+    light_pollution_penalty,
+    location_tz,
+    score_hours,
+)
+from planner.services.sky_quality import location_sky_quality
+from planner.services.weather import fetch_forecast_arrays, fetch_forecast_arrays_many
+
+
+@dataclass(frozen=True)
+class TargetRank:
+    name: str
+    target_type: str
+    target: Target | None  # None — объект из встроенного каталога
+    catalog_id: str
+    best_score: float
+    max_altitude: float
+    window_start: dt.datetime | None
+    window_end: dt.datetime | None
+    window_score: float | None
+
+
+@dataclass(frozen=True)
+class NightRanking:
+    night: dt.date
+    ranks: list[TargetRank]
+    candidates: int
+    has_forecast: bool
+
+
+@dataclass(frozen=True)
+class SiteRank:
+    location: Location
+    best_score: float
+    dark_usable_hours: int
+    window_start: dt.datetime | None
+    window_end: dt.datetime | None
+    window_score: float | None
+    has_forecast: bool
+
+
+@dataclass(frozen=True)
+class _Candidate:
+    name: str
+    target_type: str
+    target: Target | None
+    resolved: ResolvedTarget
+
+
+def night_grid(location: Location, night: dt.date) -> list[dt.datetime]:
+    """
+    24 часа (UTC) с местного полудня дня night — та же ночь, что в NightSummary
+    """
+    start = dt.datetime.combine(night, dt.time(12), tzinfo=location_tz(location)).astimezone(dt.timezone.utc)
+    start = start.replace(minute=0, second=0, microsecond=0)
+    return [start + dt.timedelta(hours=i) for i in range(24)]
+
+
+def _candidates(targets, include_catalog: bool) -> list[_Candidate]:
+    out: list[_Candidate] = []
+    seen: set[str] = set()
+    for target in targets:
+        resolved = target_resolution(target)
+        if resolved is None:
+            continue
+        out.append(_Candidate(target.name, target.target_type, target, resolved))
+        if resolved.catalog_id:
+            seen.add(resolved.catalog_id)
+
+    if include_catalog:
+        for entry in get_catalog().entries:
+            if entry.target_type != Target.TargetType.DSO or entry.id in seen:
+                continue
+            out.append(_Candidate(entry.id, entry.target_type, None, ResolvedTarget(entry.id, entry.ra_deg, entry.dec_deg, "")))
+    return out
+
+
+def _best_window(good: np.ndarray, scores: np.ndarray) -> tuple[int, int, float] | None:
+    """
+    Лучший непрерывный отрезок хороших часов: (начало, конец не включая, средний score)
+    """
+    edges = np.flatnonzero(np.diff(np.concatenate(([0], good.astype(np.int8), [0]))))
+    if not len(edges):
+        return None
+    starts, ends = edges[::2], edges[1::2]
+    csum = np.concatenate(([0.0], np.cumsum(scores)))
+    means = (csum[ends] - csum[starts]) / (ends - starts)
+    k = np.lexsort((ends - starts, means))[-1]
+    return int(starts[k]), int(ends[k]), round(float(means[k]), 2)
+
+
+def rank_targets(
+    location: Location,
+    night: dt.date,
+    targets,
+    include_catalog: bool = False,
+    min_target_altitude: float = 20,
+    max_cloud_cover: float = 40,
+    avoid_moon: bool = True,
+    top: int = 10,
+) -> NightRanking:
+    """
+    «Что лучше снимать сегодня»: все цели за один проход по общей сетке часов ночи.
+    Прогноз загружается один раз, Солнце и Луна считаются один раз,
+    фиксированные координаты — одним преобразованием массива (цели × часы)
+    """
+    grid = night_grid(location, night)
+    candidates = _candidates(targets, include_catalog)
+
+    cloud = np.full(len(grid), np.nan)
+    precip = np.full(len(grid), np.nan)
+    clear_prob = np.full(len(grid), np.nan)
+    cloud_spread = np.full(len(grid), np.nan)
+    fc_range = forecast_range(grid[0].date(), grid[-1].date(), timezone.localdate())
+    if fc_range is not None:
+        forecast = fetch_forecast_arrays(location, *fc_range)
+        cloud, precip = align_forecast(grid, forecast)
+        clear_prob, cloud_spread = align_ensemble(grid, forecast)
+
+    if not candidates:
+        return NightRanking(night, [], 0, bool(np.any(~np.isnan(cloud))))
+
+    lat, lon = float(location.latitude), float(location.longitude)
+    sun_alt, moon_alt, moon_illum = sun_moon_at(lat, lon, grid)
+    profile = horizon_profile(location.horizon)
+
+    alt = np.zeros((len(candidates), len(grid)))
+    az = np.zeros_like(alt)
+
+    fixed = [i for i, c in enumerate(candidates) if not c.resolved.body]
+    if fixed:
+        ra = np.array([candidates[i].resolved.ra_deg for i in fixed])
+        dec = np.array([candidates[i].resolved.dec_deg for i in fixed])
+        alt[fixed], az[fixed] = fixed_alt_az(ra, dec, lat, lon, grid)
+
+    bodies = {c.resolved.body for c in candidates if c.resolved.body}
+    for body in bodies:
+        rows = [i for i, c in enumerate(candidates) if c.resolved.body == body]
+        if body == "moon" and profile is None:
+            alt[rows] = moon_alt
+        else:
+            alt[rows], az[rows] = body_alt_az(body, lat, lon, grid)
+
+    # Цель за деревьями/горами локации — как ниже минимальной высоты
+    min_alt = min_target_altitude if profile is None else np.maximum(min_target_altitude, horizon_altitude(profile, az))
+
+    sqm = location_sky_quality(location)
+    sky_penalty = np.array([light_pollution_penalty(sqm, c.target_type) for c in candidates])[:, None]
+
+    scores = score_hours(
+        cloud[None, :], precip[None, :], sun_alt[None, :], moon_alt[None, :], moon_illum[None, :],
+        alt, min_alt, avoid_moon, sky_penalty,
+        clear_prob=clear_prob[None, :], cloud_spread=cloud_spread[None, :],
+    )
+    # «Сегодня ночью» — окна только в астрономическую ночь, дневные часы не предлагаем
+    night_ok = (np.isnan(cloud) | (cloud <= max_cloud_cover)) & (sun_alt < -18.0)
+    good = night_ok[None, :] & (alt >= min_alt) & (scores >= GOOD_SCORE)
+
+    ranks: list[TargetRank] = []
+    for i, c in enumerate(candidates):
+        window = _best_window(good[i], scores[i])
+        ranks.append(TargetRank(
+            name=c.name,
+            target_type=c.target_type,
+            target=c.target,
+            catalog_id=c.resolved.catalog_id,
+            best_score=float(scores[i].max()),
+            max_altitude=float(alt[i].max()),
+            window_start=grid[window[0]] if window else None,
+            window_end=grid[window[1] - 1] + dt.timedelta(hours=1) if window else None,
+            window_score=window[2] if window else None,
+        ))
+
+    def order(r: TargetRank):
+        if r.window_score is None:
+            return (False, 0.0, dt.timedelta(0), r.best_score)
+        return (True, r.window_score, r.window_end - r.window_start, r.best_score)
+
+    ranks.sort(key=order, reverse=True)
+    return NightRanking(night, ranks[:top], len(candidates), bool(np.any(~np.isnan(cloud))))
+
+
+def compare_locations(
+    target: Target,
+    locations: list[Location],
+    date_from: dt.date,
+    date_to: dt.date,
+    min_target_altitude: float = 20,
+    max_cloud_cover: float = 40,
+    avoid_moon: bool = True,
+) -> list[SiteRank]:
+    """
+    Сравнение локаций для одной цели: прогнозы — одним пакетом/параллельно,
+    эфемериды — одним преобразованием массива (локации × часы)
+    """
+    locations = list(locations)
+    grid = hour_grid(date_from, date_to)
+    if not locations:
+        return []
+
+    cloud = np.full((len(locations), len(grid)), np.nan)
+    precip = np.full((len(locations), len(grid)), np.nan)
+    clear_prob = np.full((len(locations), len(grid)), np.nan)
+    cloud_spread = np.full((len(locations), len(grid)), np.nan)
+    fc_range = forecast_range(date_from, date_to, timezone.localdate())
+    if fc_range is not None:
+        for i, forecast in enumerate(fetch_forecast_arrays_many(locations, *fc_range)):
+            cloud[i], precip[i] = align_forecast(grid, forecast)
+            clear_prob[i], cloud_spread[i] = align_ensemble(grid, forecast)
+
+    lats = np.array([float(loc.latitude) for loc in locations])[:, None]
+    lons = np.array([float(loc.longitude) for loc in locations])[:, None]
+    sun_alt, moon_alt, moon_illum = sun_moon_at(lats, lons, grid)
+    moon_illum = moon_illum[None, :]
+    profiles = [horizon_profile(loc.horizon) for loc in locations]
+    with_horizon = any(p is not None for p in profiles)
+
+    resolved = target_resolution(target)
+    az = None
+    if resolved is None:
+        alt = np.zeros_like(sun_alt)
+    elif resolved.body == "moon" and not with_horizon:
+        alt = moon_alt
+    elif resolved.body:
+        alt, az = body_alt_az(resolved.body, lats, lons, grid)
+    else:
+        alt, az = fixed_alt_az(resolved.ra_deg, resolved.dec_deg, lats, lons, grid)
+
+    min_alt = min_target_altitude
+    if with_horizon and az is not None:
+        flat = np.zeros(HORIZON_POINTS, dtype=np.uint8)
+        stacked = np.stack([flat if p is None else p for p in profiles])
+        min_alt = np.maximum(min_target_altitude, horizon_altitude(stacked, az))
+
+    # Сравнение локаций — как раз тот случай, где засветка решает
+    sky_penalty = np.array([light_pollution_penalty(location_sky_quality(loc), target.target_type) for loc in locations])[:, None]
+
+    scores = score_hours(
+        cloud, precip, sun_alt, moon_alt, moon_illum, alt, min_alt, avoid_moon, sky_penalty,
+        clear_prob=clear_prob, cloud_spread=cloud_spread,
+    )
+    good = (
+        (np.isnan(cloud) | (cloud <= max_cloud_cover))
+        & (sun_alt < -18.0)
+        & (alt >= min_alt)
+        & (scores >= GOOD_SCORE)
+    )
+
+    ranks: list[SiteRank] = []
+    for i, location in enumerate(locations):
+        window = _best_window(good[i], scores[i])
+        ranks.append(SiteRank(
+            location=location,
+            best_score=float(scores[i].max()),
+            dark_usable_hours=int(good[i].sum()),
+            window_start=grid[window[0]] if window else None,
+            window_end=grid[window[1] - 1] + dt.timedelta(hours=1) if window else None,
+            window_score=window[2] if window else None,
+            has_forecast=bool(np.any(~np.isnan(cloud[i]))),
+        ))
+
+    ranks.sort(key=lambda r: (r.window_score is not None, r.window_score or 0.0, r.dark_usable_hours, r.best_score), reverse=True)
+    return ranks
@@ -0,0 +1,167 @@
+import datetime as dt
+import logging
+from dataclasses import dataclass, field
+
+import numpy as np
+from django.db.models import Exists, OuterRef, Q
+from django.utils import timezone
+
+from planner.models import Location, NightSummary, SessionRequest
+from planner.services.planning import forecast_range, run_planning
+from planner.services.weather import (
+    FORECAST_HORIZON_DAYS,
+    ForecastArrays,
+    WeatherProvider,
+    cache_forecast,
+    cached_forecast_arrays,
+    get_weather_provider,
+    parse_hourly,
+)
+
+logger = logging.getLogger(__name__)
+
+# Изменения меньше порогов не двигают score настолько, чтобы пересчитывать план
+CLOUD_CHANGE_THRESHOLD = 10  # п.п. облачности
+PRECIP_CHANGE_THRESHOLD = 0.2  # мм
+
+
+@dataclass(frozen=True)
+class ForecastChange:
+    location: Location
+    hours: int  # часов в новом прогнозе
+    changed_dates: frozenset[dt.date]  # даты (в разметке кэша), где прогноз заметно изменился
+    failed: bool = False  # прогноз не загрузился — кэш и планы локации не трогаем до следующего цикла
+
+
+@dataclass
+class ReplanResult:
+    locations: int = 0
+    changed_locations: int = 0
+    replanned: list[int] = field(default_factory=list)
+    failed: list[int] = field(default_factory=list)
+    failed_locations: list[int] = field(default_factory=list)
+
+
+def changed_hours(
+    stored: ForecastArrays,
+    fresh: ForecastArrays,
+    cloud_threshold: float = CLOUD_CHANGE_THRESHOLD,
+    precip_threshold: float = PRECIP_CHANGE_THRESHOLD,
+) -> np.ndarray:
+    """
+    Маска часов fresh, которые заметно отличаются от кэша (или которых в кэше не было)
+    """
+    changed = np.ones(len(fresh), dtype=bool)
+    if not len(stored) or not len(fresh):
+        return changed
+
+    idx = np.clip(np.searchsorted(stored.timestamps, fresh.timestamps), 0, len(stored) - 1)
+    found = stored.timestamps[idx] == fresh.timestamps
+
+    # uint8 при вычитании переполнится — сравниваем в int16/float
+    cloud_delta = np.abs(fresh.cloud_cover.astype(np.int16) - stored.cloud_cover[idx].astype(np.int16))
+    precip_delta = np.abs(fresh.precipitation - stored.precipitation[idx])
+    changed[found] = ((cloud_delta > cloud_threshold) | (precip_delta > precip_threshold))[found]
+    return changed
+
+
+def active_plans(today: dt.date):
+    """
+    Уже рассчитанные планы, чей период пересекается с горизонтом прогноза
+    """
+    horizon_end = today + dt.timedelta(days=FORECAST_HORIZON_DAYS - 1)
+    return SessionRequest.objects.filter(
+        Exists(NightSummary.objects.filter(plan=OuterRef("pk"))),
+        date_to__gte=today,
+        date_from__lte=horizon_end,
+    )
+
+
+def refresh_forecasts(
+    locations: list[Location],
+    date_from: dt.date,
+    date_to: dt.date,
+    provider: WeatherProvider | None = None,
+    cloud_threshold: float = CLOUD_CHANGE_THRESHOLD,
+    precip_threshold: float = PRECIP_CHANGE_THRESHOLD,
+    save: bool = True,
+) -> list[ForecastChange]:
+    """
+    Загружает свежий прогноз для локаций (пакетом), сравнивает с кэшем ForecastHour
+    и обновляет кэш. Возвращает, какие даты у каждой локации заметно изменились.
+    Таймаут или 5xx провайдера помечает failed только задетые локации, остальные обновляются
+    """
+    provider = provider or get_weather_provider()
+    changes: list[ForecastChange] = []
+    responses = provider.fetch_many(locations, date_from, date_to, return_exceptions=True)
+    for location, data in zip(locations, responses):
+        if isinstance(data, Exception):
+            logger.error("Не удалось загрузить прогноз локации %s", location.pk, exc_info=data)
+            changes.append(ForecastChange(location, 0, frozenset(), failed=True))
+            continue
+        fresh = parse_hourly(data)
+        stored = cached_forecast_arrays(location, date_from, date_to)
+        mask = changed_hours(stored, fresh, cloud_threshold, precip_threshold)
+        dates = frozenset(fresh.timestamps[mask].astype("datetime64[D]").tolist())
+        if save and len(fresh):
+            cache_forecast(location, fresh, provider.source)
+        changes.append(ForecastChange(location, len(fresh), dates))
+    return changes
+
+
+def affected_plans(plans, location: Location, dates: frozenset[dt.date]):
+    """
+    Планы локации, в период которых попадает хотя бы одна изменившаяся дата
+    """
+    if not dates:
+        return plans.none()
+    in_range = Q()
+    for day in dates:
+        in_range |= Q(date_from__lte=day, date_to__gte=day)
+    return plans.filter(in_range, location=location)
+
+
+def replan_changed(
+    provider: WeatherProvider | None = None,
+    cloud_threshold: float = CLOUD_CHANGE_THRESHOLD,
+    precip_threshold: float = PRECIP_CHANGE_THRESHOLD,
+    dry_run: bool = False,
+    today: dt.date | None = None,
+) -> ReplanResult:
+    """
+    Один цикл планировщика: обновить прогноз локаций с активными планами
+    и пересчитать только планы, задетые изменениями. Прогноз для пересчёта
+    берётся из только что обновлённого кэша — без повторных запросов к провайдеру
+    """
+    today = today or timezone.localdate()
+    date_to = today + dt.timedelta(days=FORECAST_HORIZON_DAYS - 1)
+    plans = active_plans(today)
+
+    locations = list(Location.objects.filter(Exists(plans.filter(location=OuterRef("pk")))).order_by("pk"))
+    result = ReplanResult(locations=len(locations))
+    if not locations:
+        return result
+
+    changes = refresh_forecasts(
+        locations, today, date_to, provider, cloud_threshold, precip_threshold, save=not dry_run,
+    )
+    for change in changes:
+        if change.failed:
+            result.failed_locations.append(change.location.pk)
+            continue
+        if not change.changed_dates:
+            continue
+        result.changed_locations += 1
+        for plan in affected_plans(plans, change.location, change.changed_dates).select_related("location", "target"):
+            if dry_run:
+                result.replanned.append(plan.pk)
+                continue
+            try:
+                fc_range = forecast_range(plan.date_from, plan.date_to, today)
+                forecast = cached_forecast_arrays(plan.location, *fc_range) if fc_range else None
+                run_planning(plan, forecast=forecast)
+                result.replanned.append(plan.pk)
+            except Exception:
+                logger.exception("Не удалось пересчитать план %s", plan.pk)
+                result.failed.append(plan.pk)
+    return result
@@ -0,0 +1,133 @@
+import datetime as dt
+import hashlib
+import io
+import json
+from dataclasses import dataclass
+
+import numpy as np
+from django.conf import settings
+from django.db.models import F
+from django.utils import timezone
+
+from planner.models import PlanResult, PlanResultStats, SessionRequest
+from planner.services.astro_calc import target_resolution
+
+# Меняется вместе с астрономией и набором рядов — старые записи перестают совпадать
+RESULT_CACHE_VERSION = 6
+
+# Ряды до оценки: score считается из них по профилю плана (planning._score_arrays),
+# поэтому пороги плана и профиль оценки в ключ не входят
+RESULT_FIELDS = (
+    "cloud", "precip", "clear_prob", "cloud_spread",
+    "sun_alt", "moon_alt", "moon_illumination", "target_alt", "horizon_alt",
+)
+
+
+@dataclass(frozen=True)
+class CacheStats:
+    entries: int
+    referenced: int
+    hits: int
+    misses: int
+    bytes: int
+
+    @property
+    def hit_rate(self) -> float:
+        """
+        Доля расчётов, взятых из кэша, по счётчикам PlanResultStats за всё время
+        """
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+
+def _count(**increments: int) -> None:
+    fields = {name: F(name) + n for name, n in increments.items()}
+    if not PlanResultStats.objects.filter(pk=1).update(**fields):
+        PlanResultStats.objects.get_or_create(pk=1)
+        PlanResultStats.objects.filter(pk=1).update(**fields)
+
+
+def result_key(plan: SessionRequest, date_from: dt.date, date_to: dt.date, *weather: np.ndarray) -> str:
+    """
+    Хэш всего, от чего зависят почасовые ряды: координаты и профиль горизонта локации,
+    цель после разрешения по каталогу, период и погодные ряды, разложенные по часам плана
+    (облачность, осадки и, в режиме ансамбля, его вероятность ясного неба и разброс)
+    """
+    resolved = target_resolution(plan.target)
+    target = (
+        [resolved.body or "", None if resolved.ra_deg is None else round(resolved.ra_deg, 6),
+         None if resolved.dec_deg is None else round(resolved.dec_deg, 6)]
+        if resolved else None
+    )
+    head = json.dumps(
+        [
+            RESULT_CACHE_VERSION,
+            str(plan.location.latitude), str(plan.location.longitude),
+            plan.target.target_type, target,
+            date_from.isoformat(), date_to.isoformat(),
+        ],
+        separators=(",", ":"),
+    )
+    digest = hashlib.sha256(head.encode())
+    digest.update(bytes(plan.location.horizon or b""))
+    for series in weather:
+        digest.update(np.ascontiguousarray(series, dtype=np.float64).tobytes())
+    return digest.hexdigest()
+
+
+def load_result(key: str) -> dict[str, np.ndarray] | None:
+    """
+    Ряды из кэша (и отметка о попадании) или None. Промах считает store_result —
+    после него ряды всё равно кладут в кэш
+    """
+    data = PlanResult.objects.filter(key=key).values_list("data", flat=True).first()
+    if data is None:
+        return None
+    with np.load(io.BytesIO(bytes(data))) as npz:
+        if not set(RESULT_FIELDS) <= set(npz.files):
+            return None  # запись старого формата (план, посчитанный до смены версии)
+        arrays = {name: npz[name] for name in RESULT_FIELDS}
+    PlanResult.objects.filter(key=key).update(hits=F("hits") + 1, last_used_at=timezone.now())
+    _count(hits=1)
+    return arrays
+
+
+def store_result(key: str, arrays: dict[str, np.ndarray]) -> None:
+    buf = io.BytesIO()
+    np.savez_compressed(buf, **{name: arrays[name] for name in RESULT_FIELDS})
+    PlanResult.objects.update_or_create(
+        key=key,
+        defaults={"data": buf.getvalue(), "hours": len(arrays["target_alt"]), "last_used_at": timezone.now()},
+    )
+    _count(misses=1)
+    evict(settings.PLANNER_PLAN_CACHE_MAX_ENTRIES)
+
+
+def evict(max_entries: int) -> int:
+    """
+    LRU: если записей больше max_entries — удаляем самые давно использованные
+    из тех, на которые не ссылается ни один план
+    """
+    extra = PlanResult.objects.count() - max_entries
+    if extra <= 0:
+        return 0
+    stale = list(
+        PlanResult.objects.filter(plans__isnull=True)
+        .order_by("last_used_at")
+        .values_list("key", flat=True)[:extra]
+    )
+    deleted, _ = PlanResult.objects.filter(key__in=stale).delete()
+    return deleted
+
+
+def cache_stats() -> CacheStats:
+    entries = PlanResult.objects.count()
+    size = sum(len(d) for d in PlanResult.objects.values_list("data", flat=True).iterator())
+    counters = PlanResultStats.objects.filter(pk=1).first() or PlanResultStats()
+    return CacheStats(
+        entries=entries,
+        referenced=PlanResult.objects.filter(plans__isnull=False).distinct().count(),
+        hits=counters.hits,
+        misses=counters.misses,
+        bytes=size,
+    )
@@ -0,0 +1,235 @@
+"""
+Формула score как профиль весов (ScoringProfile), скомпилированный в одно NumPy-выражение.
+Профиль превращается в исходник вида «100.0 - 0.8 * cloud - 15.0 * (precip > 0) + ...»
+и компилируется один раз (кэш по весам): стандартная формула идёт тем же путём,
+поэтому свой профиль стоит столько же, сколько стандартный.
+Дополнительное слагаемое пользователя разбирается через ast — допускаются только
+числа, ряды из FEATURES, арифметика, сравнения, & | ~ и функции из FUNCTIONS
+"""
+import ast
+from dataclasses import dataclass, fields
+from functools import lru_cache
+from types import CodeType
+
+import numpy as np
+
+from planner.models import ScoringProfile
+
+EXTRA_TERM_MAX_LENGTH = 500
+
+# Ряды, доступные в выражении (все — одной формы: часы или цели × часы)
+FEATURES = {
+    "cloud": "облачность, % (0 — нет прогноза)",
+    "precip": "осадки, мм (0 — нет прогноза)",
+    "has_forecast": "1, если на час есть прогноз",
+    "sun_alt": "высота Солнца, °",
+    "dark": "астрономическая ночь (Солнце ниже −18°)",
+    "moon_alt": "высота Луны, °",
+    "moon_illum": "освещённость Луны, 0..1",
+    "moon_up": "высота Луны / 90, 0 под горизонтом",
+    "avoid_moon": "1, если в плане учитывается Луна",
+    "target_alt": "высота цели, °",
+    "min_alt": "минимальная высота цели с учётом горизонта, °",
+    "above": "target_alt − min_alt",
+    "sky_penalty": "штраф за засветку неба локации",
+    "clear_prob": "доля моделей ансамбля, обещающих ясное небо, 0..1 (1 — ансамбля нет)",
+    "cloud_spread": "разброс облачности между моделями ансамбля, п.п. (0 — ансамбля нет)",
+}
+
+FUNCTIONS = {
+    "where": np.where,
+    "minimum": np.minimum,
+    "maximum": np.maximum,
+    "clip": np.clip,
+    "abs": np.abs,
+    "sqrt": np.sqrt,
+    "exp": np.exp,
+    "log": np.log,
+}
+
+_ALLOWED_NODES = (
+    ast.Expression, ast.BinOp, ast.UnaryOp, ast.Compare, ast.Call, ast.Name, ast.Load, ast.Constant,
+    ast.Add, ast.Sub, ast.Mult, ast.Div, ast.Pow, ast.USub, ast.UAdd, ast.Invert, ast.BitAnd, ast.BitOr,
+    ast.Lt, ast.LtE, ast.Gt, ast.GtE,
+)
+
+
+@dataclass(frozen=True)
+class Weights:
+    cloud_weight: float
+    precipitation_penalty: float
+    dark_bonus: float
+    twilight_penalty: float
+    altitude_weight: float
+    altitude_bonus_max: float
+    low_altitude_penalty: float
+    moon_weight: float
+    light_pollution_weight: float
+    clear_weight: float
+
+
+WEIGHT_FIELDS = tuple(f.name for f in fields(Weights))
+
+# Значения по умолчанию — из модели, чтобы формула и форма профиля не расходились
+DEFAULT_WEIGHTS = Weights(**{name: ScoringProfile._meta.get_field(name).default for name in WEIGHT_FIELDS})
+
+
+@dataclass(frozen=True)
+class ScoreExpression:
+    source: str
+    code: CodeType
+
+    def evaluate(self, features: dict[str, np.ndarray]) -> np.ndarray:
+        return eval(self.code, {"__builtins__": {}, **FUNCTIONS}, features)
+
+
+def validate_extra_term(text: str) -> str:
+    """
+    Проверка дополнительного слагаемого: ValueError с понятным сообщением или нормализованный текст
+    """
+    text = " ".join(text.split())
+    if not text:
+        return ""
+    if len(text) > EXTRA_TERM_MAX_LENGTH:
+        raise ValueError(f"Выражение длиннее {EXTRA_TERM_MAX_LENGTH} символов.")
+    try:
+        tree = ast.parse(text, mode="eval")
+    except SyntaxError as e:
+        raise ValueError(f"Синтаксическая ошибка: {e.msg}.") from e
+
+    for node in ast.walk(tree):
+        if not isinstance(node, _ALLOWED_NODES):
+            raise ValueError(f"Недопустимая конструкция: {ast.unparse(node) if isinstance(node, ast.expr) else type(node).__name__}.")
+        if isinstance(node, ast.Name) and node.id not in FEATURES and node.id not in FUNCTIONS:
+            raise ValueError(f"Неизвестное имя «{node.id}». Доступны: {', '.join(FEATURES)}.")
+        if isinstance(node, ast.Call) and (not isinstance(node.func, ast.Name) or node.func.id not in FUNCTIONS or node.keywords):
+            raise ValueError(f"Допустимы функции: {', '.join(FUNCTIONS)} (без именованных аргументов).")
+        if isinstance(node, ast.Name) and node.id in FUNCTIONS and not _is_called(tree, node):
+            raise ValueError(f"«{node.id}» — функция, её нужно вызывать.")
+        if isinstance(node, ast.Constant) and (isinstance(node.value, bool) or not isinstance(node.value, (int, float))):
+            raise ValueError("Допустимы только числовые константы.")
+
+    # Целые константы — во float: «9 ** 9 ** 9» иначе считается длинной арифметикой без ограничений,
+    # а с float переполняется сразу (OverflowError в Python, inf в numpy)
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Constant):
+            node.value = float(node.value)
+    text = ast.unparse(tree)
+
+    # Пробный прогон на паре часов ловит неверное число аргументов и т.п.
+    try:
+        with np.errstate(all="ignore"):
+            value = _compile(text).evaluate(_sample_features())
+        np.broadcast_to(value, (2,))
+    except OverflowError as e:
+        raise ValueError("Выражение переполняется: слишком большие числа.") from e
+    except Exception as e:
+        raise ValueError(f"Выражение не вычисляется: {e}.") from e
+    return text
+
+
+def _is_called(tree: ast.AST, name: ast.Name) -> bool:
+    return any(isinstance(node, ast.Call) and node.func is name for node in ast.walk(tree))
+
+
+def _sample_features() -> dict[str, np.ndarray]:
+    return score_features(
+        np.array([10.0, np.nan]), np.array([0.0, np.nan]), np.array([-30.0, 5.0]), np.array([20.0, -10.0]),
+        np.array([0.5, 0.5]), np.array([40.0, 10.0]), 20.0, True, 0.0,
+        np.array([0.6, np.nan]), np.array([12.0, np.nan]),
+    )
+
+
+def _num(value: float) -> str:
+    return repr(float(value))
+
+
+def build_source(weights: Weights, extra_term: str = "") -> str:
+    """
+    Исходник выражения. При стандартных весах — та же последовательность операций,
+    что и у исходной формулы, поэтому результаты совпадают до бита
+    """
+    w = weights
+    parts = ["100.0"]
+    if w.cloud_weight:
+        parts.append(f"- {_num(w.cloud_weight)} * cloud")
+    if w.precipitation_penalty:
+        parts.append(f"- {_num(w.precipitation_penalty)} * (precip > 0)")
+    if w.dark_bonus or w.twilight_penalty:
+        parts.append(f"+ where(dark, {_num(w.dark_bonus)}, {_num(-w.twilight_penalty)})")
+    parts.append(
+        f"+ where(above > 0, minimum({_num(w.altitude_bonus_max)}, above * {_num(w.altitude_weight)}), "
+        f"{_num(-w.low_altitude_penalty)})"
+    )
+    if w.moon_weight:
+        parts.append(f"- {_num(w.moon_weight)} * avoid_moon * moon_illum * moon_up")
+    if w.light_pollution_weight == 1.0:
+        parts.append("- sky_penalty")
+    elif w.light_pollution_weight:
+        parts.append(f"- {_num(w.light_pollution_weight)} * sky_penalty")
+    if w.clear_weight:
+        # Без ансамбля clear_prob = 1 и слагаемое равно нулю
+        parts.append(f"- {_num(w.clear_weight)} * (1.0 - clear_prob)")
+    if extra_term:
+        parts.append(f"+ ({extra_term})")
+    return " ".join(parts)
+
+
+@lru_cache(maxsize=256)
+def _compile(source: str) -> ScoreExpression:
+    return ScoreExpression(source, compile(source, "<score>", "eval"))
+
+
+def compile_weights(weights: Weights, extra_term: str = "") -> ScoreExpression:
+    return _compile(build_source(weights, extra_term))
+
+
+def profile_expression(profile: ScoringProfile | None) -> ScoreExpression:
+    """
+    Скомпилированная формула профиля (None — стандартная); повторные вызовы берут её из кэша
+    """
+    if profile is None:
+        return compile_weights(DEFAULT_WEIGHTS)
+    weights = Weights(**{name: float(getattr(profile, name)) for name in WEIGHT_FIELDS})
+    return compile_weights(weights, _checked_term(profile.extra_term))
+
+
+@lru_cache(maxsize=256)
+def _checked_term(text: str) -> str:
+    # Профиль мог быть сохранён в обход формы (админка, shell) — в eval попадает только проверенное
+    return validate_extra_term(text)
+
+
+def score_features(
+    cloud: np.ndarray,
+    precip: np.ndarray,
+    sun_alt: np.ndarray,
+    moon_alt: np.ndarray,
+    moon_illum: np.ndarray,
+    target_alt: np.ndarray,
+    min_target_altitude: float | np.ndarray,
+    avoid_moon: bool,
+    sky_penalty: float | np.ndarray,
+    clear_prob: float | np.ndarray = np.nan,
+    cloud_spread: float | np.ndarray = np.nan,
+) -> dict[str, np.ndarray]:
+    """
+    Ряды, над которыми считается выражение (см. FEATURES)
+    """
+    return {
+        "cloud": np.nan_to_num(cloud),
+        "precip": np.nan_to_num(precip),
+        "has_forecast": ~np.isnan(cloud),
+        "sun_alt": sun_alt,
+        "dark": sun_alt < -18.0,
+        "moon_alt": moon_alt,
+        "moon_illum": moon_illum,
+        "moon_up": np.maximum(0.0, moon_alt / 90.0),
+        "avoid_moon": 1.0 if avoid_moon else 0.0,
+        "target_alt": target_alt,
+        "min_alt": min_target_altitude,
+        "above": target_alt - min_target_altitude,
+        "sky_penalty": sky_penalty,
+        "clear_prob": np.nan_to_num(clear_prob, nan=1.0),
+        "cloud_spread": np.nan_to_num(cloud_spread),
+    }
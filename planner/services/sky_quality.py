@@ -0,0 +1,144 @@
+"""
+Яркость ночного неба по глобальному растру засветки (SQM, mag/arcsec²).
+Растр — плоская сетка uint16 (тысячные доли звёздной величины, 0 — нет данных)
+в равнопромежуточной проекции, строки с севера на юг. Открывается через np.memmap:
+воркеры делят страницы файла, в память попадают только прочитанные пиксели.
+Строится командой import_sky_raster (из GeoTIFF атласа засветки)
+"""
+import struct
+from dataclasses import dataclass
+from functools import lru_cache
+from pathlib import Path
+
+import numpy as np
+from django.conf import settings
+
+from planner.models import Location
+
+_MAGIC = b"PLSKYQ01"
+# magic, ширина, высота, долгота левого края, широта верхнего края, шаг по долготе и широте (°)
+_HEADER = struct.Struct("<8sII4d")
+
+SQM_SCALE = 1000.0  # uint16 = SQM × 1000
+
+# Естественный фон неба (атлас Фальки): 22.0 mag/arcsec² ≈ 0.171 мкд/м²
+NATURAL_SKY_MCD = 0.171168
+# Яркость неба (кд/м²) = 10.8e4 · 10^(−0.4 · SQM)
+_SQM_ZERO_CD = 10.8e4
+
+
+@dataclass(frozen=True)
+class SkyRaster:
+    lon0: float
+    lat0: float
+    dlon: float
+    dlat: float
+    grid: np.ndarray  # (высота, ширина) uint16, memmap
+
+    def lookup(self, lat_deg, lon_deg) -> np.ndarray:
+        """
+        SQM в точках (векторно, ближайший пиксель); NaN — вне растра или нет данных
+        """
+        lat = np.asarray(lat_deg, dtype=float)
+        lon = np.mod(np.asarray(lon_deg, dtype=float) - self.lon0, 360.0)
+        height, width = self.grid.shape
+        y = (self.lat0 - lat) / self.dlat
+        x = lon / self.dlon
+        inside = (y >= 0) & (y <= height) & (x <= width)  # нижний край растра (−90°) — последняя строка
+        row = np.minimum(np.floor(y), height - 1).astype(np.int64)
+        col = np.minimum(np.floor(x), width - 1).astype(np.int64)
+
+        raw = np.zeros(lat.shape, dtype=np.uint16)
+        raw[inside] = self.grid[row[inside], col[inside]]
+        return np.where(raw > 0, raw / SQM_SCALE, np.nan)
+
+
+def sqm_from_artificial(mcd_m2: np.ndarray) -> np.ndarray:
+    """
+    Искусственная яркость (мкд/м², как в World Atlas 2015) -> SQM с учётом естественного фона
+    """
+    total_cd = (np.asarray(mcd_m2, dtype=float) + NATURAL_SKY_MCD) / 1000.0
+    return -2.5 * np.log10(total_cd / _SQM_ZERO_CD)
+
+
+def write_header(f, width: int, height: int, lon0: float, lat0: float, dlon: float, dlat: float) -> None:
+    f.write(_HEADER.pack(_MAGIC, width, height, lon0, lat0, dlon, dlat))
+
+
+def encode_sqm(sqm: np.ndarray) -> np.ndarray:
+    """
+    SQM -> uint16 для растра (NaN и значения вне диапазона -> 0, «нет данных»)
+    """
+    scaled = np.rint(np.nan_to_num(np.asarray(sqm, dtype=float), nan=0.0) * SQM_SCALE)
+    return np.where((scaled > 0) & (scaled < 65536), scaled, 0).astype("<u2")
+
+
+def read_raster(path: Path) -> SkyRaster:
+    with open(path, "rb") as f:
+        magic, width, height, lon0, lat0, dlon, dlat = _HEADER.unpack(f.read(_HEADER.size))
+    if magic != _MAGIC:
+        raise ValueError(f"{path}: не растр яркости неба")
+    grid = np.memmap(path, dtype="<u2", mode="r", offset=_HEADER.size, shape=(height, width))
+    return SkyRaster(lon0, lat0, dlon, dlat, grid)
+
+
+@lru_cache(maxsize=4)
+def _load(path: str, mtime: float) -> SkyRaster | None:
+    try:
+        return read_raster(Path(path))
+    except (OSError, ValueError, struct.error):
+        return None
+
+
+def get_sky_raster() -> SkyRaster | None:
+    """
+    Растр из PLANNER_SKY_RASTER_PATH (один раз на процесс); None — файла нет
+    """
+    path = Path(settings.PLANNER_SKY_RASTER_PATH)
+    try:
+        mtime = path.stat().st_mtime
+    except OSError:
+        return None
+    return _load(str(path), mtime)
+
+
+def lookup_sky_quality(latitudes, longitudes) -> np.ndarray:
+    """
+    SQM для массива координат; NaN — растра нет или точка без данных
+    """
+    raster = get_sky_raster()
+    if raster is None:
+        return np.full(np.shape(latitudes), np.nan)
+    return raster.lookup(latitudes, longitudes)
+
+
+def sky_quality(latitude, longitude) -> float | None:
+    value = float(lookup_sky_quality(float(latitude), float(longitude)))
+    return None if np.isnan(value) else round(value, 2)
+
+
+def refresh_locations(queryset=None, batch_size: int = 500) -> int:
+    """
+    Пересчитать Location.sky_quality у всех (или выбранных) локаций одним векторным поиском —
+    после замены растра
+    """
+    locations = list((queryset if queryset is not None else Location.objects.all()).only("pk", "latitude", "longitude"))
+    if not locations:
+        return 0
+    values = lookup_sky_quality(
+        np.array([float(loc.latitude) for loc in locations]),
+        np.array([float(loc.longitude) for loc in locations]),
+    )
+    for loc, value in zip(locations, values.tolist()):
+        loc.sky_quality = None if np.isnan(value) else round(value, 2)
+    Location.objects.bulk_update(locations, ["sky_quality"], batch_size=batch_size)
+    return len(locations)
+
+
+def location_sky_quality(location: Location) -> float | None:
+    """
+    SQM локации: сохранённое при записи значение или (для старых локаций) поиск по растру
+    """
+    if location.sky_quality is not None:
+        return location.sky_quality
+    return sky_quality(location.latitude, location.longitude)
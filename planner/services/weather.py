@@ -0,0 +1,500 @@
+import asyncio
+import datetime as dt
+import json
+import math
+import mmap
+import re
+import time
+from abc import ABC, abstractmethod
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from functools import lru_cache
+from pathlib import Path
+
+import numpy as np
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+from planner.models import ForecastHour, Location
+from planner.services.locks import asingle_flight, single_flight
+
+try:
+    import orjson
+except ImportError:  # необязательная зависимость: быстрее разбирает большие ответы
+    orjson = None
+
+# Сколько дней прогноза запрашиваем за раз (дальше — только астрономия)
+FORECAST_HORIZON_DAYS = 14
+
+HOURLY_FIELDS = ("cloud_cover", "precipitation", "visibility")
+
+# Ансамбль: час «ясный» у модели, если облачность не выше порога и нет осадков
+CLEAR_SKY_CLOUD_COVER = 30
+
+# Упаковка ансамбля в ForecastHour.ensemble: облачность uint8 на модель, затем осадки uint16 (0.01 мм)
+ENSEMBLE_NO_CLOUD = 255
+ENSEMBLE_NO_PRECIP = 0xFFFF
+ENSEMBLE_PRECIP_SCALE = 100.0
+
+FORECAST_CACHE_BATCH_SIZE = 500
+
+# Сколько запросов погоды держим в полёте одновременно
+FETCH_WORKERS = 8
+
+
+def loads(raw: bytes | str) -> dict:
+    if orjson is not None:
+        return orjson.loads(raw)
+    return json.loads(raw)
+
+
+@dataclass(frozen=True)
+class ForecastArrays:
+    """
+    Почасовой прогноз колонками numpy — то, что потребляет планировщик.
+    timestamps — datetime64[s] в UTC-разметке кэша (как ForecastHour.timestamp)
+    """
+    timestamps: np.ndarray  # datetime64[s]
+    cloud_cover: np.ndarray  # uint8, 0..100 (в режиме ансамбля — среднее по моделям)
+    precipitation: np.ndarray  # float32
+    visibility: np.ndarray  # uint32
+    # Ансамбль моделей (PLANNER_WEATHER_ENSEMBLE_MODELS): часы × модели, NaN — модель не дала значения.
+    # None — прогноз одной модели
+    ensemble_cloud: np.ndarray | None = None  # float32
+    ensemble_precip: np.ndarray | None = None  # float32
+
+    def __len__(self) -> int:
+        return len(self.timestamps)
+
+
+def _nanmean(values: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Среднее по моделям (последняя ось) без предупреждений numpy; вторым — число моделей со значением
+    """
+    has = ~np.isnan(values)
+    n = has.sum(axis=-1)
+    total = np.where(has, values, 0.0).sum(axis=-1)
+    return np.divide(total, n, out=np.full(total.shape, np.nan), where=n > 0), n
+
+
+def ensemble_stats(forecast: ForecastArrays) -> tuple[np.ndarray, np.ndarray]:
+    """
+    По часам: вероятность ясного неба (доля моделей с облачностью ≤ CLEAR_SKY_CLOUD_COVER и без осадков)
+    и разброс облачности между моделями (σ, п.п.). NaN — ансамбля нет
+    """
+    if forecast.ensemble_cloud is None:
+        return np.full(len(forecast), np.nan), np.full(len(forecast), np.nan)
+    cloud = forecast.ensemble_cloud.astype(np.float64)
+    precip = np.nan_to_num(forecast.ensemble_precip.astype(np.float64))
+    clear = np.where(np.isnan(cloud), np.nan, (cloud <= CLEAR_SKY_CLOUD_COVER) & (precip <= 0.0))
+    probability, _ = _nanmean(clear)
+    mean, _ = _nanmean(cloud)
+    variance, _ = _nanmean((cloud - mean[:, None]) ** 2)
+    return probability, np.sqrt(variance)
+
+
+def pack_ensemble(cloud: np.ndarray, precip: np.ndarray) -> np.ndarray:
+    """
+    Ансамбль (часы × модели) -> строки по 3 байта на модель для ForecastHour.ensemble
+    """
+    c = np.where(np.isnan(cloud), ENSEMBLE_NO_CLOUD, np.clip(np.rint(np.nan_to_num(cloud)), 0, 100)).astype(np.uint8)
+    p = np.where(
+        np.isnan(precip),
+        ENSEMBLE_NO_PRECIP,
+        np.clip(np.rint(np.nan_to_num(precip) * ENSEMBLE_PRECIP_SCALE), 0, ENSEMBLE_NO_PRECIP - 1),
+    ).astype("<u2")
+    return np.concatenate([c, p.view(np.uint8).reshape(len(p), -1)], axis=1)
+
+
+def unpack_ensemble(packed: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    models = packed.shape[1] // 3
+    c = packed[:, :models]
+    p = np.ascontiguousarray(packed[:, models:]).view("<u2")
+    cloud = np.where(c == ENSEMBLE_NO_CLOUD, np.nan, c).astype(np.float32)
+    precip = np.where(p == ENSEMBLE_NO_PRECIP, np.nan, p / ENSEMBLE_PRECIP_SCALE).astype(np.float32)
+    return cloud, precip
+
+
+def _ensemble_models(hourly: dict) -> list[str]:
+    # При models=a,b Open-Meteo отвечает колонками cloud_cover_a, cloud_cover_b, ...
+    prefix = f"{HOURLY_FIELDS[0]}_"
+    return [key[len(prefix):] for key in hourly if key.startswith(prefix)]
+
+
+def _column(values: list | None, n: int) -> np.ndarray:
+    values = (values or [])[:n]
+    column = np.array(values, dtype=np.float64) if values else np.empty(0)
+    return np.pad(column, (0, n - len(column)), constant_values=np.nan)
+
+
+def parse_hourly(data: dict | bytes | str) -> ForecastArrays:
+    """
+    Блок hourly ответа Open-Meteo -> ForecastArrays за один проход numpy,
+    без datetime/int/float на каждый час. Пропуски (null) -> 0, как и раньше
+    """
+    if not isinstance(data, dict):
+        data = loads(data)
+
+    hourly = data.get("hourly") or {}
+    times = hourly.get("time") or []
+    models = _ensemble_models(hourly)
+    if models:
+        return _parse_ensemble(hourly, times, models)
+    columns = [hourly.get(f) or [] for f in HOURLY_FIELDS]
+    n = min(len(times), *(len(c) for c in columns))
+
+    cloud, precip, vis = (np.nan_to_num(np.array(c[:n], dtype=np.float64)) for c in columns)
+
+    return ForecastArrays(
+        timestamps=np.array(times[:n], dtype="datetime64[s]"),
+        cloud_cover=np.clip(cloud, 0, 100).astype(np.uint8),
+        precipitation=precip.astype(np.float32),
+        visibility=np.clip(vis, 0, np.iinfo(np.uint32).max).astype(np.uint32),
+    )
+
+
+def _parse_ensemble(hourly: dict, times: list, models: list[str]) -> ForecastArrays:
+    """
+    Ответ с несколькими моделями: колонки моделей складываются в матрицы часы × модели,
+    основные колонки — средние по моделям (для фильтров и окон, как у одной модели)
+    """
+    n = len(times)
+    cloud, precip, vis = (
+        np.stack([_column(hourly.get(f"{field}_{model}"), n) for model in models], axis=1)
+        for field in HOURLY_FIELDS
+    )
+    cloud_mean, _ = _nanmean(cloud)
+    precip_mean, _ = _nanmean(precip)
+    vis_mean, _ = _nanmean(vis)
+    return ForecastArrays(
+        timestamps=np.array(times, dtype="datetime64[s]"),
+        cloud_cover=np.clip(np.rint(np.nan_to_num(cloud_mean)), 0, 100).astype(np.uint8),
+        precipitation=np.nan_to_num(precip_mean).astype(np.float32),
+        visibility=np.clip(np.nan_to_num(vis_mean), 0, np.iinfo(np.uint32).max).astype(np.uint32),
+        ensemble_cloud=cloud.astype(np.float32),
+        ensemble_precip=precip.astype(np.float32),
+    )
+
+
+class WeatherProvider(ABC):
+    """
+    Источник почасовой погоды. fetch() возвращает ответ в формате Open-Meteo:
+    {"hourly": {"time": [...], "cloud_cover": [...], "precipitation": [...], "visibility": [...]}}
+    """
+    source = "unknown"
+
+    @abstractmethod
+    def fetch(self, location: Location, date_from: dt.date, date_to: dt.date) -> dict:
+        ...
+
+    async def afetch(self, location: Location, date_from: dt.date, date_to: dt.date) -> dict:
+        """
+        То же, что fetch, для async-вьюх. По умолчанию — fetch() в потоке, чтобы не блокировать event loop
+        """
+        return await asyncio.to_thread(self.fetch, location, date_from, date_to)
+
+    def fetch_many(
+        self, locations: list[Location], date_from: dt.date, date_to: dt.date, return_exceptions: bool = False,
+    ) -> list[dict | Exception]:
+        """
+        Прогнозы для нескольких локаций (в том же порядке).
+        По умолчанию — fetch() в пуле потоков, чтобы ожидание сети перекрывалось.
+        return_exceptions — ошибка запроса встаёт на место ответа (как в asyncio.gather),
+        остальные локации загружаются как обычно
+        """
+        def fetch(location: Location) -> dict | Exception:
+            try:
+                return self.fetch(location, date_from, date_to)
+            except Exception as e:
+                if not return_exceptions:
+                    raise
+                return e
+
+        if len(locations) <= 1:
+            return [fetch(location) for location in locations]
+        with ThreadPoolExecutor(max_workers=min(FETCH_WORKERS, len(locations))) as pool:
+            return list(pool.map(fetch, locations))
+
+
+# Координаты в начале записи Open-Meteo: {"latitude":52.52,"longitude":13.419998,...
+_COORDS_RE = re.compile(rb'"latitude"\s*:\s*(-?[\d.]+)\s*,\s*"longitude"\s*:\s*(-?[\d.]+)')
+
+
+class ReplayProvider(WeatherProvider):
+    """
+    Отдаёт записанные ответы Open-Meteo с диска — для нагрузочных тестов и бенчмарков без сети.
+
+    path — файл .json (один ответ), .ndjson (ответ на строку) или каталог с такими файлами.
+    NDJSON открывается через mmap: в памяти держим только смещения строк по координатам,
+    сама запись декодируется при запросе.
+    Берётся ближайшая по координатам запись; если её часы не попадают в запрошенный период,
+    значения переносятся на период по кругу (записи стареют, а нагрузка нужна реалистичная).
+    latency — искусственная задержка ответа в секундах, как у сетевого провайдера
+    """
+    source = "replay"
+
+    def __init__(self, path: str | Path, latency: float = 0.0):
+        self.path = Path(path)
+        self.latency = latency
+        self._maps: list[mmap.mmap] = []
+        # (lat, lon, номер mmap, начало, конец)
+        self._index: list[tuple[float, float, int, int, int]] = []
+        self._load()
+
+    def _files(self) -> list[Path]:
+        if self.path.is_dir():
+            return sorted(p for p in self.path.iterdir() if p.suffix in (".json", ".ndjson"))
+        return [self.path]
+
+    def _load(self) -> None:
+        for file in self._files():
+            with open(file, "rb") as f:
+                if file.stat().st_size == 0:
+                    continue
+                mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            n = len(self._maps)
+            self._maps.append(mm)
+
+            if file.suffix == ".json":
+                self._add(mm, n, 0, len(mm))
+                continue
+
+            start = 0
+            while start < len(mm):
+                end = mm.find(b"\n", start)
+                if end == -1:
+                    end = len(mm)
+                if end > start:
+                    self._add(mm, n, start, end)
+                start = end + 1
+
+        if not self._index:
+            raise ValueError(f"В {self.path} нет записанных ответов погоды.")
+
+    def _add(self, mm: mmap.mmap, n: int, start: int, end: int) -> None:
+        m = _COORDS_RE.search(mm, start, min(end, start + 256))
+        if m:
+            lat, lon = float(m.group(1)), float(m.group(2))
+        else:
+            record = loads(mm[start:end])
+            lat, lon = float(record["latitude"]), float(record["longitude"])
+        self._index.append((lat, lon, n, start, end))
+
+    def _nearest(self, lat: float, lon: float) -> dict:
+        def dist(entry):
+            return (entry[0] - lat) ** 2 + ((entry[1] - lon) * math.cos(math.radians(lat))) ** 2
+
+        _, _, n, start, end = min(self._index, key=dist)
+        return loads(self._maps[n][start:end])
+
+    def fetch(self, location: Location, date_from: dt.date, date_to: dt.date) -> dict:
+        if self.latency:
+            time.sleep(self.latency)
+        return self._replay(location, date_from, date_to)
+
+    async def afetch(self, location: Location, date_from: dt.date, date_to: dt.date) -> dict:
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        return self._replay(location, date_from, date_to)
+
+    def _replay(self, location: Location, date_from: dt.date, date_to: dt.date) -> dict:
+        record = self._nearest(float(location.latitude), float(location.longitude))
+        hourly = record.get("hourly") or {}
+        times = hourly.get("time") or []
+
+        lo, hi = date_from.isoformat(), (date_to + dt.timedelta(days=1)).isoformat()
+        picked = [i for i, t in enumerate(times) if lo <= t < hi]
+        if picked:
+            out = {"time": [times[i] for i in picked]}
+            for field in _replay_fields(hourly):
+                values = hourly.get(field) or []
+                out[field] = [values[i] if i < len(values) else None for i in picked]
+            return {**record, "hourly": out}
+
+        # Период вне записи — переносим значения на запрошенные часы по кругу
+        hours = ((date_to - date_from).days + 1) * 24
+        start = dt.datetime.combine(date_from, dt.time.min)
+        out = {"time": [(start + dt.timedelta(hours=i)).isoformat(timespec="minutes") for i in range(hours)]}
+        for field in _replay_fields(hourly):
+            values = hourly.get(field) or []
+            out[field] = [values[i % len(values)] for i in range(hours)] if values else [None] * hours
+        return {**record, "hourly": out}
+
+
+def _replay_fields(hourly: dict) -> list[str]:
+    # Все колонки записи, включая колонки моделей ансамбля (cloud_cover_<model> и т.п.)
+    return [field for field in hourly if field != "time"] or list(HOURLY_FIELDS)
+
+
+@lru_cache(maxsize=None)
+def _provider(dotted_path: str, replay_path: str, replay_latency_ms: int) -> WeatherProvider:
+    cls = import_string(dotted_path)
+    if issubclass(cls, ReplayProvider):
+        return cls(replay_path, latency=replay_latency_ms / 1000)
+    return cls()
+
+
+def get_weather_provider() -> WeatherProvider:
+    """
+    Провайдер из настроек PLANNER_WEATHER_PROVIDER (dotted path), создаётся один раз на процесс
+    """
+    return _provider(
+        settings.PLANNER_WEATHER_PROVIDER,
+        settings.PLANNER_WEATHER_REPLAY_PATH,
+        settings.PLANNER_WEATHER_REPLAY_LATENCY_MS,
+    )
+
+
+def _date_range_days(date_from: dt.date, date_to: dt.date) -> int:
+    return (date_to - date_from).days + 1
+
+
+def cache_forecast(location: Location, forecast: ForecastArrays, source: str) -> None:
+    """
+    Кэш в ForecastHour одним upsert'ом пачками вместо update_or_create на каждый час.
+    Ансамбль пишется в тот же upsert: 3 байта на модель в строке часа
+    """
+    timestamps = forecast.timestamps.astype("datetime64[us]").tolist()
+    if forecast.ensemble_cloud is not None:
+        ensemble = [row.tobytes() for row in pack_ensemble(forecast.ensemble_cloud, forecast.ensemble_precip)]
+    else:
+        ensemble = [None] * len(timestamps)
+    ForecastHour.objects.bulk_create(
+        [
+            ForecastHour(
+                location=location,
+                timestamp=ts.replace(tzinfo=dt.timezone.utc),
+                cloud_cover=cloud,
+                precipitation=round(precip, 2),
+                visibility=vis,
+                ensemble=packed,
+                source=source,
+            )
+            for ts, cloud, precip, vis, packed in zip(
+                timestamps,
+                forecast.cloud_cover.tolist(),
+                forecast.precipitation.tolist(),
+                forecast.visibility.tolist(),
+                ensemble,
+            )
+        ],
+        batch_size=FORECAST_CACHE_BATCH_SIZE,
+        update_conflicts=True,
+        unique_fields=["location", "timestamp"],
+        update_fields=["cloud_cover", "precipitation", "visibility", "ensemble", "source"],
+    )
+
+
+def _check_range(date_from: dt.date, date_to: dt.date) -> None:
+    days = _date_range_days(date_from, date_to)
+    if days > FORECAST_HORIZON_DAYS:
+        raise ValueError(f"Период слишком большой. Выберите диапазон до {FORECAST_HORIZON_DAYS} дней.")
+
+
+def fetch_forecast_arrays(
+    location: Location,
+    date_from: dt.date,
+    date_to: dt.date,
+    provider: WeatherProvider | None = None,
+) -> ForecastArrays:
+    """
+    Загружает почасовой прогноз у провайдера погоды, кэширует в ForecastHour (UTC)
+    и возвращает его массивами numpy
+    """
+    _check_range(date_from, date_to)
+
+    provider = provider or get_weather_provider()
+
+    def fetch() -> ForecastArrays:
+        # Open-Meteo возвращает время в timezone локации, в кэше оно размечено как UTC
+        forecast = parse_hourly(provider.fetch(location, date_from, date_to))
+        if len(forecast):
+            cache_forecast(location, forecast, provider.source)
+        return forecast
+
+    # Одновременные запросы той же локации и периода ждут один HTTP-запрос и читают кэш
+    return single_flight(
+        f"forecast:{location.pk}:{date_from}:{date_to}",
+        fetch,
+        lambda: cached_forecast_arrays(location, date_from, date_to),
+    )
+
+
+async def afetch_forecast_arrays(
+    location: Location,
+    date_from: dt.date,
+    date_to: dt.date,
+    provider: WeatherProvider | None = None,
+) -> ForecastArrays:
+    """
+    Async-вариант fetch_forecast_arrays: HTTP без блокировки event loop,
+    запись в кэш и блокировка — через sync_to_async
+    """
+    _check_range(date_from, date_to)
+
+    provider = provider or get_weather_provider()
+
+    async def fetch() -> ForecastArrays:
+        forecast = parse_hourly(await provider.afetch(location, date_from, date_to))
+        if len(forecast):
+            await sync_to_async(cache_forecast)(location, forecast, provider.source)
+        return forecast
+
+    return await asingle_flight(
+        f"forecast:{location.pk}:{date_from}:{date_to}",
+        fetch,
+        sync_to_async(lambda: cached_forecast_arrays(location, date_from, date_to)),
+    )
+
+
+def cached_forecast_arrays(location: Location, date_from: dt.date, date_to: dt.date) -> ForecastArrays:
+    """
+    Прогноз из кэша ForecastHour за дни date_from..date_to (в разметке кэша)
+    """
+    start = dt.datetime.combine(date_from, dt.time(0), tzinfo=dt.timezone.utc)
+    end = dt.datetime.combine(date_to + dt.timedelta(days=1), dt.time(0), tzinfo=dt.timezone.utc)
+    rows = list(
+        ForecastHour.objects.filter(location=location, timestamp__gte=start, timestamp__lt=end)
+        .order_by("timestamp")
+        .values_list("timestamp", "cloud_cover", "precipitation", "visibility", "ensemble")
+    )
+    timestamps, cloud, precip, vis, ensemble = zip(*rows) if rows else ((), (), (), (), ())
+
+    # Ансамбль — только если у всех часов один и тот же набор моделей
+    ensemble_cloud = ensemble_precip = None
+    sizes = {len(e) if e else 0 for e in ensemble}
+    if len(sizes) == 1 and 0 not in sizes:
+        packed = np.frombuffer(b"".join(bytes(e) for e in ensemble), dtype=np.uint8).reshape(len(ensemble), -1)
+        ensemble_cloud, ensemble_precip = unpack_ensemble(packed)
+
+    return ForecastArrays(
+        timestamps=np.array([ts.replace(tzinfo=None) for ts in timestamps], dtype="datetime64[s]"),
+        cloud_cover=np.array(cloud, dtype=np.uint8),
+        precipitation=np.array(precip, dtype=np.float32),
+        visibility=np.array(vis, dtype=np.uint32),
+        ensemble_cloud=ensemble_cloud,
+        ensemble_precip=ensemble_precip,
+    )
+
+
+def fetch_forecast_arrays_many(
+    locations: list[Location],
+    date_from: dt.date,
+    date_to: dt.date,
+    provider: WeatherProvider | None = None,
+) -> list[ForecastArrays]:
+    """
+    То же, что fetch_forecast_arrays, для нескольких локаций: запросы идут параллельно
+    или одним пакетом (если провайдер умеет), запись в кэш — в текущем потоке
+    """
+    _check_range(date_from, date_to)
+
+    provider = provider or get_weather_provider()
+    out: list[ForecastArrays] = []
+    for location, data in zip(locations, provider.fetch_many(locations, date_from, date_to)):
+        forecast = parse_hourly(data)
+        if len(forecast):
+            cache_forecast(location, forecast, provider.source)
+        out.append(forecast)
+    return out
@@ -1,3 +1,650 @@
-from django.test import TestCase
+import datetime as dt
+import json
+import tempfile
+import threading
+import time
+import tracemalloc
+from pathlib import Path
+from unittest import mock
 
-# Create your tests here.
+import numpy as np
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import caches
+from django.db import connection
+from django.http import HttpResponse
+from django.test import RequestFactory, SimpleTestCase, TestCase, override_settings, tag
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from .middleware import QueryBudgetMiddleware
+from .models import (
+    AstroWindow,
+    ForecastHour,
+    Location,
+    NightSummary,
+    PlanHourScore,
+    PlanProfile,
+    PlanResult,
+    SessionRequest,
+    Target,
+)
+from .services import demo, sky_quality
+from .services.ical import reset_feed
+from .services.locks import try_lock, unlock
+from .services.planning import plan_batch, run_planning
+from .services.replanning import affected_plans, changed_hours, replan_changed
+from .services.result_cache import RESULT_FIELDS, cache_stats, load_result, store_result
+from .services.scoring import validate_extra_term
+from .services.weather import (
+    FORECAST_HORIZON_DAYS,
+    ReplayProvider,
+    cache_forecast,
+    cached_forecast_arrays,
+    parse_hourly,
+)
+
+
+class AdminChangelistQueriesTests(TestCase):
+    """
+    Число запросов на страницу списка в админке не должно зависеть от числа строк
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_superuser("admin", "admin@example.com", "pass")
+
+    def setUp(self):
+        self.client.force_login(self.admin)
+
+    def _add_plans(self, n: int):
+        start = timezone.make_aware(dt.datetime(2027, 3, 1), dt.timezone.utc)
+        for i in range(n):
+            loc = Location.objects.create(name=f"loc{i}", latitude=55, longitude=37, owner=self.admin)
+            target = Target.objects.create(name=f"M{i}", target_type=Target.TargetType.DSO, owner=self.admin)
+            plan = SessionRequest.objects.create(
+                user=self.admin, location=loc, target=target,
+                date_from=start.date(), date_to=start.date(),
+            )
+            ForecastHour.objects.create(location=loc, timestamp=start)
+            AstroWindow.objects.create(plan=plan, start_time=start, end_time=start + dt.timedelta(hours=1), score=70)
+            PlanHourScore.objects.create(
+                plan=plan, timestamp=start, score=70, cloud_cover=10, moon_illumination=0.1, target_altitude=40,
+            )
+            NightSummary.objects.create(plan=plan, night=start.date(), best_score=70)
+
+    def _queries(self, model) -> int:
+        url = reverse(f"admin:planner_{model._meta.model_name}_changelist")
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return len(ctx.captured_queries)
+
+    def test_query_count_does_not_grow_with_rows(self):
+        models = [ForecastHour, AstroWindow, PlanHourScore, NightSummary, SessionRequest]
+
+        self._add_plans(2)
+        small = {m: self._queries(m) for m in models}
+        self._add_plans(20)
+        large = {m: self._queries(m) for m in models}
+
+        for m in models:
+            self.assertEqual(small[m], large[m], m.__name__)
+            self.assertLessEqual(large[m], 8, m.__name__)
+
+
+@override_settings(PLANNER_QUERY_SAMPLE_RATE=1.0)
+class QueryBudgetTests(TestCase):
+    """
+    Страницы укладываются в бюджет PLANNER_QUERY_BUDGETS и не делают N+1
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user("astro", password="pass")
+        cls.night = dt.date(2027, 3, 1)
+        cls.plan = cls._add_plans(1)[0]
+
+    @classmethod
+    def _add_plans(cls, n: int) -> list[SessionRequest]:
+        start = timezone.make_aware(dt.datetime.combine(cls.night, dt.time(20)), dt.timezone.utc)
+        plans = []
+        for i in range(n):
+            loc = Location.objects.create(name=f"loc{i}", latitude=55, longitude=37, owner=cls.user)
+            target = Target.objects.create(name=f"M{i}", target_type=Target.TargetType.DSO, owner=cls.user)
+            plan = SessionRequest.objects.create(
+                user=cls.user, location=loc, target=target, date_from=cls.night, date_to=cls.night,
+            )
+            for h in range(3):
+                AstroWindow.objects.create(
+                    plan=plan, start_time=start + dt.timedelta(hours=h), end_time=start + dt.timedelta(hours=h + 1), score=70,
+                )
+                PlanHourScore.objects.create(
+                    plan=plan, timestamp=start + dt.timedelta(hours=h), score=70,
+                    cloud_cover=10, moon_illumination=0.1, target_altitude=40,
+                )
+            NightSummary.objects.create(plan=plan, night=cls.night, best_score=70, windows_count=3)
+            plans.append(plan)
+        return plans
+
+    def setUp(self):
+        self.client.force_login(self.user)
+
+    def _stats(self, name: str, **kwargs):
+        response = self.client.get(reverse(name, kwargs=kwargs or None), {"month": "2027-03"})
+        self.assertEqual(response.status_code, 200)
+        return response.wsgi_request.query_stats
+
+    def _check(self, name: str, **kwargs):
+        small = self._stats(name, **kwargs)
+        self._add_plans(15)
+        large = self._stats(name, **kwargs)
+
+        self.assertEqual(large.view_name, name)
+        self.assertIsNotNone(large.budget, f"нет бюджета для {name}")
+        self.assertFalse(large.over_budget, f"{name}: {large.count} > {large.budget}")
+        self.assertEqual(small.count, large.count, f"{name}: число запросов растёт с числом строк")
+        self.assertEqual(large.repeated(settings.PLANNER_QUERY_REPEAT_THRESHOLD), [])
+
+    def test_plan_list(self):
+        self._check("plan_list")
+
+    def test_plan_detail(self):
+        self._check("plan_detail", pk=self.plan.pk)
+
+    def test_plan_calendar(self):
+        self._check("plan_calendar")
+
+    def test_location_list(self):
+        self._check("location_list")
+
+    def test_target_list(self):
+        self._check("target_list")
+
+    async def test_plan_detail_async(self):
+        """
+        Под ASGI запросы async ORM идут из потока sync_to_async — они тоже должны учитываться
+        """
+        url = reverse("plan_detail", kwargs={"pk": self.plan.pk})
+        sync_count = (await sync_to_async(self._stats)("plan_detail", pk=self.plan.pk)).count
+
+        await self.async_client.aforce_login(self.user)
+        response = await self.async_client.get(url, {"month": "2027-03"})
+        self.assertEqual(response.status_code, 200)
+        stats = response.asgi_request.query_stats
+
+        self.assertGreater(stats.count, 0)
+        self.assertEqual(stats.count, sync_count)
+        self.assertFalse(stats.over_budget, f"{stats.count} > {stats.budget}")
+
+    def test_over_budget_is_logged(self):
+        with override_settings(PLANNER_QUERY_BUDGETS={"plan_list": 1}), self.assertLogs("planner.queries", "WARNING") as logs:
+            stats = self._stats("plan_list")
+        self.assertTrue(stats.over_budget)
+        self.assertIn("plan_list", logs.output[0])
+
+    def test_repeated_shape_is_logged(self):
+        def n_plus_one(request):
+            for plan in SessionRequest.objects.all():
+                plan.location.name
+            return HttpResponse()
+
+        self._add_plans(5)
+        middleware = QueryBudgetMiddleware(n_plus_one)
+        request = RequestFactory().get("/")
+        with self.assertLogs("planner.queries", "WARNING") as logs:
+            middleware(request)
+        self.assertTrue(request.query_stats.repeated(5))
+        self.assertIn("N+1", logs.output[0])
+
+
+class ExtraTermTests(SimpleTestCase):
+    """
+    Дополнительное слагаемое профиля оценки: проверка не должна зависать на длинной арифметике
+    """
+
+    def test_integer_power_tower_is_rejected_quickly(self):
+        started = time.monotonic()
+        with self.assertRaisesMessage(ValueError, "переполняется"):
+            validate_extra_term("cloud * 0 + 9 ** 9 ** 9")
+        self.assertLess(time.monotonic() - started, 1.0)
+
+    def test_constants_become_float(self):
+        self.assertEqual(validate_extra_term("cloud ** 9 ** 9"), "cloud ** 9.0 ** 9.0")
+        self.assertEqual(validate_extra_term("where(dark, 5, -3)"), "where(dark, 5.0, -3.0)")
+
+
+class TargetResolutionTests(TestCase):
+    """
+    Кэш разрешения цели пересчитывается при любом save(), а не только в форме
+    """
+
+    def test_save_refreshes_icrs_cache(self):
+        user = User.objects.create_user("resolver", password="pw")
+        target = Target.objects.create(
+            name="T", target_type=Target.TargetType.DSO, right_ascension=10.0, declination=40.0, owner=user,
+        )
+        self.assertEqual((target.icrs_ra_deg, target.icrs_dec_deg), (10.0, 40.0))
+
+        target.right_ascension = 20.0
+        target.save(update_fields=["right_ascension"])
+        target.refresh_from_db()
+        self.assertEqual(target.icrs_ra_deg, 20.0)
+
+        target.right_ascension = target.declination = None
+        target.save()
+        target.refresh_from_db()
+        self.assertIsNone(target.icrs_ra_deg)
+
+
+class LocationSkyQualityTests(TestCase):
+    """
+    Яркость неба пересчитывается в Location.save() при смене координат
+    """
+
+    def test_moved_location_gets_new_sky_quality(self):
+        # Растр 2 × 1: западное полушарие — засвеченный пригород, восточное — тёмное небо
+        with tempfile.TemporaryDirectory() as tmp:
+            path = Path(tmp) / "sky.bin"
+            with open(path, "wb") as f:
+                sky_quality.write_header(f, 2, 1, -180.0, 90.0, 180.0, 180.0)
+                f.write(sky_quality.encode_sqm(np.array([18.0, 21.5])).tobytes())
+
+            with override_settings(PLANNER_SKY_RASTER_PATH=str(path)):
+                user = User.objects.create_user("sky", password="pw")
+                loc = Location.objects.create(name="loc", latitude=55, longitude=37, owner=user)
+                self.assertEqual(loc.sky_quality, 21.5)
+
+                loc = Location.objects.get(pk=loc.pk)
+                loc.longitude = -70
+                loc.save(update_fields=["longitude"])
+                loc.refresh_from_db()
+                self.assertEqual(loc.sky_quality, 18.0)
+
+
+class PlanBatchLockTests(TestCase):
+    """
+    Пакетный расчёт не пишет план, который сейчас считается в другом месте
+    """
+
+    def test_busy_plan_is_skipped(self):
+        user = User.objects.create_user("batch", password="pass")
+        night = timezone.localdate() + dt.timedelta(days=60)
+        plan = SessionRequest.objects.create(
+            user=user,
+            location=Location.objects.create(name="loc", latitude=55, longitude=37, owner=user),
+            target=Target.objects.create(
+                name="T", target_type=Target.TargetType.DSO, right_ascension=10.0, declination=40.0, owner=user,
+            ),
+            date_from=night,
+            date_to=night,
+        )
+
+        token = try_lock(f"plan:{plan.pk}")
+        [progress] = plan_batch(SessionRequest.objects.all())
+        self.assertEqual((progress.planned, progress.busy), (0, [plan.pk]))
+        self.assertFalse(PlanHourScore.objects.filter(plan=plan).exists())
+
+        unlock(f"plan:{plan.pk}", token, succeeded=True)
+        [progress] = plan_batch(SessionRequest.objects.all())
+        self.assertEqual((progress.planned, progress.busy), (1, []))
+        self.assertEqual(PlanHourScore.objects.filter(plan=plan).count(), 24)
+        # Свою блокировку пакет отпустил
+        self.assertIsNotNone(try_lock(f"plan:{plan.pk}"))
+
+
+@tag("slow")
+class PlanBatchMemoryTests(TestCase):
+    """
+    Пакетный расчёт: пиковая память не растёт с числом планов в пакете.
+    Долгий (минуты под tracemalloc): пропустить — manage.py test --exclude-tag slow
+    """
+
+    PLANS = 10_000
+    CHUNK = 500
+
+    @classmethod
+    def setUpTestData(cls):
+        user = User.objects.create_user("batch", password="pass")
+        # Период за горизонтом прогноза: считается только астрономия, без запросов погоды
+        night = timezone.localdate() + dt.timedelta(days=60)
+        locations = [
+            Location.objects.create(name=f"loc{i}", latitude=45 + 10 * i, longitude=37, owner=user) for i in range(2)
+        ]
+        targets = [
+            Target.objects.create(
+                name=f"T{i}", target_type=Target.TargetType.DSO, right_ascension=80.0 * i + 10, declination=40.0, owner=user,
+            )
+            for i in range(2)
+        ]
+        SessionRequest.objects.bulk_create(
+            (
+                SessionRequest(
+                    user=user, location=locations[i % 2], target=targets[i // 2 % 2], date_from=night, date_to=night,
+                )
+                for i in range(cls.PLANS)
+            ),
+            batch_size=1000,
+        )
+
+    def test_peak_memory_is_flat(self):
+        planned, peaks, current = 0, [], []
+        tracemalloc.start()
+        try:
+            for progress in plan_batch(SessionRequest.objects.all(), chunk_size=self.CHUNK):
+                planned += progress.planned
+                size, peak = tracemalloc.get_traced_memory()
+                peaks.append(peak)
+                current.append(size)
+                tracemalloc.reset_peak()
+        finally:
+            tracemalloc.stop()
+
+        self.assertEqual(planned, self.PLANS)
+        self.assertEqual(PlanHourScore.objects.count(), self.PLANS * 24)
+        self.assertFalse(SessionRequest.objects.filter(result__isnull=True).exists())
+
+        # Первый кусок считает астрономию и прогревает кэши — сравниваем со вторым.
+        # Пик куска не растёт к концу пакета, между кусками ничего не копится
+        self.assertEqual(len(peaks), self.PLANS // self.CHUNK)
+        self.assertLess(max(peaks[2:]), peaks[1] * 1.1, peaks)
+        self.assertLess(current[-1] - current[1], peaks[1] * 0.01, current)
+
+
+class ReplanChangedTests(TestCase):
+    """
+    Планировщик прогноза: пересчитываются только планы с датами, где прогноз заметно изменился
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user("replan", password="pass")
+        cls.today = dt.date(2027, 3, 1)
+        cls.location = Location.objects.create(name="loc", latitude=55, longitude=37, owner=cls.user)
+        cls.plans = {
+            offset: cls._plan(cls.location, cls.today + dt.timedelta(days=offset)) for offset in (1, 3, 5)
+        }
+
+    @classmethod
+    def _plan(cls, location: Location, night: dt.date) -> SessionRequest:
+        target = Target.objects.create(
+            name="T", target_type=Target.TargetType.DSO, right_ascension=10.0, declination=40.0, owner=cls.user,
+        )
+        plan = SessionRequest.objects.create(user=cls.user, location=location, target=target, date_from=night, date_to=night)
+        NightSummary.objects.create(plan=plan, night=night, best_score=70)
+        return plan
+
+    @classmethod
+    def _record(cls, location: Location, edits: dict[tuple[int, int], tuple[float, float]] | None = None) -> dict:
+        """
+        Ответ Open-Meteo на горизонт прогноза: облачность 50%, без осадков; edits — (день, час) -> (облачность, осадки)
+        """
+        hourly = {"time": [], "cloud_cover": [], "precipitation": [], "visibility": []}
+        for day in range(FORECAST_HORIZON_DAYS):
+            for hour in range(24):
+                ts = dt.datetime.combine(cls.today + dt.timedelta(days=day), dt.time(hour))
+                cloud, precip = (edits or {}).get((day, hour), (50, 0.0))
+                hourly["time"].append(ts.isoformat(timespec="minutes"))
+                hourly["cloud_cover"].append(cloud)
+                hourly["precipitation"].append(precip)
+                hourly["visibility"].append(20000)
+        return {"latitude": float(location.latitude), "longitude": float(location.longitude), "hourly": hourly}
+
+    def _replay(self, *records: dict, provider_class=ReplayProvider) -> ReplayProvider:
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        path = Path(tmp.name) / "weather.ndjson"
+        path.write_text("\n".join(json.dumps(r) for r in records))
+        return provider_class(path)
+
+    def _store(self, location: Location) -> None:
+        cache_forecast(location, parse_hourly(self._record(location)), "test")
+
+    def test_only_plans_with_changed_dates_are_replanned(self):
+        self._store(self.location)
+        # День 1: +30 п.п. облачности (выше порога); день 3: +5 п.п.; день 5: 0.1 мм осадков — ниже порогов
+        fresh = self._record(self.location, {(1, 22): (80, 0.0), (3, 22): (55, 0.0), (5, 22): (50, 0.1)})
+
+        stored = cached_forecast_arrays(self.location, self.today, self.today + dt.timedelta(days=FORECAST_HORIZON_DAYS - 1))
+        mask = changed_hours(stored, parse_hourly(fresh))
+        self.assertEqual(mask.sum(), 1)
+
+        result = replan_changed(provider=self._replay(fresh), dry_run=True, today=self.today)
+        self.assertEqual(result.locations, 1)
+        self.assertEqual(result.changed_locations, 1)
+        self.assertEqual(result.replanned, [self.plans[1].pk])
+
+        dates = frozenset({self.today + dt.timedelta(days=1), self.today + dt.timedelta(days=3)})
+        affected = affected_plans(SessionRequest.objects.all(), self.location, dates)
+        self.assertEqual(set(affected), {self.plans[1], self.plans[3]})
+        self.assertFalse(affected_plans(SessionRequest.objects.all(), self.location, frozenset()).exists())
+
+    def test_failed_location_does_not_stop_the_cycle(self):
+        other = Location.objects.create(name="other", latitude=-33, longitude=151, owner=self.user)
+        other_plan = self._plan(other, self.today + dt.timedelta(days=2))
+        self._store(self.location)
+        self._store(other)
+
+        class FlakyProvider(ReplayProvider):
+            def fetch(self, location, date_from, date_to):
+                if location.pk == other.pk:
+                    raise ConnectionError("timeout")
+                return super().fetch(location, date_from, date_to)
+
+        provider = self._replay(self._record(self.location, {(1, 22): (90, 0.0)}), provider_class=FlakyProvider)
+        with self.assertLogs("planner.services.replanning", "ERROR"):
+            result = replan_changed(provider=provider, dry_run=True, today=self.today)
+
+        self.assertEqual(result.failed_locations, [other.pk])
+        self.assertEqual(result.replanned, [self.plans[1].pk])
+        self.assertNotIn(other_plan.pk, result.replanned)
+
+
+class PlanProfilingTests(TestCase):
+    """
+    Профиль расчёта пишется только по запросу staff или флагу плана
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user("astro", password="pass")
+        cls.staff = User.objects.create_user("staff", password="pass", is_staff=True)
+        cls.night = timezone.localdate() + dt.timedelta(days=60)  # за горизонтом прогноза — без сети
+        cls.location = Location.objects.create(name="loc", latitude=55, longitude=37, owner=cls.user)
+        cls.target = Target.objects.create(
+            name="T", target_type=Target.TargetType.DSO, right_ascension=10.0, declination=40.0, owner=cls.user,
+        )
+
+    def _plan(self, user: User, **kwargs) -> SessionRequest:
+        return SessionRequest.objects.create(
+            user=user, location=self.location, target=self.target, date_from=self.night, date_to=self.night, **kwargs,
+        )
+
+    def _run(self, user: User, plan: SessionRequest, **params):
+        self.client.force_login(user)
+        response = self.client.post(reverse("plan_run", kwargs={"pk": plan.pk}), params)
+        self.assertRedirects(response, reverse("plan_detail", kwargs={"pk": plan.pk}), fetch_redirect_response=False)
+        self.assertTrue(plan.night_summaries.exists())
+
+    def test_staff_request_stores_profile(self):
+        plan = self._plan(self.staff)
+        self._run(self.staff, plan, profile=PlanProfile.MODE_CPROFILE)
+        profile = PlanProfile.objects.get(plan=plan)
+        self.assertEqual((profile.mode, profile.requested_by), (PlanProfile.MODE_CPROFILE, "staff"))
+        self.assertTrue(profile.summary)
+
+    def test_flagged_plan_stores_profile_once(self):
+        plan = self._plan(self.user, profile_next_run=True)
+        self._run(self.user, plan)
+        profile = PlanProfile.objects.get(plan=plan)
+        self.assertEqual(profile.requested_by, "флаг плана")
+
+        plan.refresh_from_db()
+        self.assertFalse(plan.profile_next_run)
+        self._run(self.user, plan)
+        self.assertEqual(PlanProfile.objects.filter(plan=plan).count(), 1)
+
+    def test_nothing_captured_when_profiling_is_off(self):
+        plan = self._plan(self.user)
+        # Не staff — параметр и заголовок игнорируются
+        self.client.force_login(self.user)
+        self.client.post(reverse("plan_run", kwargs={"pk": plan.pk}), {"profile": "cprofile"}, HTTP_X_PLANNER_PROFILE="sample")
+        self.assertTrue(plan.night_summaries.exists())
+        self.assertFalse(PlanProfile.objects.exists())
+
+
+class ResultCacheTests(TestCase):
+    """
+    Кэш PlanResult: одинаковый вход берёт готовые ряды, счётчики переживают вытеснение
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user("cache", password="pass")
+        cls.night = timezone.localdate() + dt.timedelta(days=60)  # за горизонтом прогноза — без сети
+        cls.location = Location.objects.create(name="loc", latitude=55, longitude=37, owner=cls.user)
+        cls.target = Target.objects.create(
+            name="T", target_type=Target.TargetType.DSO, right_ascension=10.0, declination=40.0, owner=cls.user,
+        )
+
+    def _plan(self, date_to: dt.date | None = None) -> SessionRequest:
+        return SessionRequest.objects.create(
+            user=self.user, location=self.location, target=self.target, date_from=self.night, date_to=date_to or self.night,
+        )
+
+    def test_identical_plan_hits_and_changed_period_misses(self):
+        first = self._plan()
+        run_planning(first)
+        second = self._plan()
+        run_planning(second)
+
+        self.assertEqual(second.result_id, first.result_id)
+        stats = cache_stats()
+        self.assertEqual((stats.hits, stats.misses, stats.entries), (1, 1, 1))
+
+        changed = self._plan(date_to=self.night + dt.timedelta(days=1))
+        run_planning(changed)
+        self.assertNotEqual(changed.result_id, first.result_id)
+        stats = cache_stats()
+        self.assertEqual((stats.hits, stats.misses, stats.entries), (1, 2, 2))
+        self.assertAlmostEqual(stats.hit_rate, 1 / 3)
+
+    @override_settings(PLANNER_PLAN_CACHE_MAX_ENTRIES=2)
+    def test_eviction_keeps_miss_count(self):
+        arrays = {name: np.zeros(24) for name in RESULT_FIELDS}
+        for key in ("a", "b", "c"):
+            store_result(key, arrays)
+
+        # Вытеснена самая давно использованная запись без планов
+        self.assertEqual(set(PlanResult.objects.values_list("key", flat=True)), {"b", "c"})
+        self.assertIsNone(load_result("a"))
+        self.assertIsNotNone(load_result("c"))
+
+        stats = cache_stats()
+        self.assertEqual((stats.entries, stats.hits, stats.misses), (2, 1, 3))
+        self.assertEqual(stats.hit_rate, 0.25)
+
+
+class CalendarFeedTests(TestCase):
+    """
+    Лента календаря: опрос без изменений — 304, пересчёт и удаление меняют ETag
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user("feed", password="pass")
+        cls.night = timezone.localdate() + dt.timedelta(days=60)  # за горизонтом прогноза — без сети
+        cls.location = Location.objects.create(name="loc", latitude=55, longitude=37, owner=cls.user)
+        cls.plan = SessionRequest.objects.create(
+            user=cls.user,
+            location=cls.location,
+            target=Target.objects.create(
+                name="T", target_type=Target.TargetType.DSO, right_ascension=10.0, declination=40.0, owner=cls.user,
+            ),
+            date_from=cls.night,
+            date_to=cls.night,
+        )
+
+    def setUp(self):
+        self.url = reverse("calendar_feed", kwargs={"token": reset_feed(self.user).token})
+
+    def _etag(self) -> str:
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        return response["ETag"]
+
+    def test_unchanged_feed_returns_304(self):
+        etag = self._etag()
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response["ETag"], etag)
+        self.assertEqual(response.content, b"")
+
+    def test_replanning_changes_etag(self):
+        etag = self._etag()
+        run_planning(self.plan)
+
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response["ETag"], etag)
+        self.assertIn(b"BEGIN:VEVENT", response.content)
+
+    def test_location_delete_changes_etag(self):
+        run_planning(self.plan)
+        etag = self._etag()
+
+        self.client.force_login(self.user)
+        self.client.post(reverse("location_delete", kwargs={"pk": self.location.pk}))
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response["ETag"], etag)
+        self.assertNotIn(b"BEGIN:VEVENT", response.content)
+
+
+@override_settings(PLANNER_WEATHER_PROVIDER="planner.services.weather.ReplayProvider", PLANNER_DEMO_RATE_LIMIT=3)
+class DemoTests(TestCase):
+    """
+    Демо для гостей: соседние точки делят кэш, лимит по IP и отказ, когда слоты заняты
+    """
+
+    def setUp(self):
+        caches[settings.PLANNER_DEMO_CACHE].clear()
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        path = Path(tmp.name) / "weather.json"
+        times = [f"2027-01-01T{h:02d}:00" for h in range(24)]
+        path.write_text(json.dumps({
+            "latitude": 55.7,
+            "longitude": 37.6,
+            "hourly": {"time": times, "cloud_cover": [20] * 24, "precipitation": [0] * 24, "visibility": [20000] * 24},
+        }))
+        self.enterContext(override_settings(PLANNER_WEATHER_REPLAY_PATH=str(path)))
+
+    def _get(self, latitude: float, longitude: float):
+        return self.client.get(reverse("demo"), {
+            "latitude": latitude, "longitude": longitude, "target_type": Target.TargetType.DSO, "target_name": "M31",
+            "date_from": timezone.localdate() + dt.timedelta(days=1), "nights": 1,
+            "min_target_altitude": 20, "max_cloud_cover": 40, "avoid_moon": "on", "tz": "UTC",
+        })
+
+    def test_nearby_coordinates_share_cached_result(self):
+        with mock.patch("planner.services.demo._compute", wraps=demo._compute) as compute:
+            first = self._get(55.71, 37.61)
+            second = self._get(55.69, 37.58)
+        self.assertEqual((first.status_code, second.status_code), (200, 200))
+        self.assertEqual(compute.call_count, 1)
+        self.assertEqual(second.context["result"].chart, first.context["result"].chart)
+
+    def test_rate_limit_returns_429(self):
+        for _ in range(settings.PLANNER_DEMO_RATE_LIMIT):
+            self.assertEqual(self._get(55.7, 37.6).status_code, 200)
+        self.assertEqual(self._get(55.7, 37.6).status_code, 429)
+
+    def test_busy_returns_503(self):
+        with mock.patch("planner.services.demo._slots", threading.BoundedSemaphore(1)) as slots:
+            slots.acquire()
+            response = self._get(55.7, 37.6)
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response["Retry-After"], "60")
@@ -11,10 +11,23 @@ from .views import (
     TargetCreateView,
     TargetUpdateView,
     TargetDeleteView,
+    ScoringProfileListView,
+    ScoringProfileCreateView,
+    ScoringProfileUpdateView,
+    ScoringProfileDeleteView,
     PlanListView,
     PlanCreateView,
     PlanDetailView,
     PlanRunView,
+    PlanRescoreView,
+    PlanCalendarView,
+    CalendarFeedView,
+    CalendarFeedResetView,
+    PlanExportView,
+    PlanChartView,
+    TonightView,
+    CompareView,
+    DemoView,
 )
 
 urlpatterns = [
@@ -30,10 +43,24 @@ urlpatterns = [
     path("targets/<int:pk>/edit/", TargetUpdateView.as_view(), name="target_edit"),
     path("targets/<int:pk>/delete/", TargetDeleteView.as_view(), name="target_delete"),
 
+    path("scoring/", ScoringProfileListView.as_view(), name="scoring_profile_list"),
+    path("scoring/create/", ScoringProfileCreateView.as_view(), name="scoring_profile_create"),
+    path("scoring/<int:pk>/edit/", ScoringProfileUpdateView.as_view(), name="scoring_profile_edit"),
+    path("scoring/<int:pk>/delete/", ScoringProfileDeleteView.as_view(), name="scoring_profile_delete"),
+
     path("plans/", PlanListView.as_view(), name="plan_list"),
     path("plans/create/", PlanCreateView.as_view(), name="plan_create"),
     path("plans/<int:pk>/", PlanDetailView.as_view(), name="plan_detail"),
     path("plans/<int:pk>/run/", PlanRunView.as_view(), name="plan_run"),
+    path("plans/<int:pk>/rescore/", PlanRescoreView.as_view(), name="plan_rescore"),
+    path("plans/<int:pk>/export/", PlanExportView.as_view(), name="plan_export"),
+    path("plans/<int:pk>/chart/", PlanChartView.as_view(), name="plan_chart"),
+    path("tonight/", TonightView.as_view(), name="tonight"),
+    path("compare/", CompareView.as_view(), name="compare"),
+    path("calendar/", PlanCalendarView.as_view(), name="plan_calendar"),
+    path("calendar/feed/reset/", CalendarFeedResetView.as_view(), name="calendar_feed_reset"),
+    path("calendar/feed/<str:token>.ics", CalendarFeedView.as_view(), name="calendar_feed"),
+    path("demo/", DemoView.as_view(), name="demo"),
     path("register/", views.register, name="register"),
     path("accounts/login/", CustomLoginView.as_view(), name="login"),
     path("accounts/logout/", CustomLogoutView.as_view(), name="logout"),
@@ -1,17 +1,43 @@
+import calendar
+import datetime as dt
+import heapq
+import json
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
 from django.contrib import messages
 from django.contrib.auth import login
 from django.contrib.auth.forms import UserCreationForm
 from django.contrib.auth.mixins import LoginRequiredMixin
 from django.contrib.auth.views import LoginView, LogoutView
-from django.db.models import Count
-from django.shortcuts import redirect, render
-from django.urls import reverse_lazy
+from django.db.models import Max, Sum
+from django.http import Http404, HttpResponse, HttpResponseBadRequest, JsonResponse, StreamingHttpResponse
+from django.shortcuts import get_object_or_404, redirect, render
+from django.urls import reverse, reverse_lazy
+from django.utils import timezone
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date
 from django.views import View
-from django.views.generic import CreateView, DeleteView, DetailView, ListView, UpdateView
-
-from .forms import LocationForm, TargetForm, SessionRequestForm
-from .models import Location, Target, SessionRequest
-from .services.planning import run_planning
+from django.views.generic import CreateView, DeleteView, ListView, TemplateView, UpdateView
+
+from .forms import (
+    CompareForm,
+    DemoForm,
+    LocationForm,
+    PlanRescoreForm,
+    ScoringProfileForm,
+    TargetForm,
+    SessionRequestForm,
+    TonightForm,
+)
+from .models import CalendarFeed, Location, NightSummary, ScoringProfile, Target, SessionRequest
+from .services.charts import chart_payload
+from .services.demo import DEMO_COORD_STEP, DemoBusy, DemoQuery, allow_request, bucket, demo_plan
+from .services.export import CONTENT_TYPES, EXPORT_FORMATS, EXPORT_KINDS, export_queryset, export_stream
+from .services.ical import feed_body, feed_state, reset_feed, touch_feeds
+from .services.planning import arun_planning, rescore_plan, run_planning
+from .services.profiling import PROFILE_MODES, requested_mode
+from .services.ranking import compare_locations, rank_targets
 
 
 def home(request):
@@ -94,6 +120,12 @@ class LocationDeleteView(LoginRequiredMixin, DeleteView):
     def get_queryset(self):
         return Location.objects.filter(owner=self.request.user)
 
+    def form_valid(self, form):
+        # Планы локации удаляются каскадом вместе с окнами — лента календаря устарела
+        response = super().form_valid(form)
+        touch_feeds(self.request.user.pk)
+        return response
+
 
 class TargetListView(LoginRequiredMixin, ListView):
     model = Target
@@ -143,20 +175,93 @@ class TargetDeleteView(LoginRequiredMixin, DeleteView):
     def get_queryset(self):
         return Target.objects.filter(owner=self.request.user)
 
+    def form_valid(self, form):
+        # Планы цели удаляются каскадом вместе с окнами
+        response = super().form_valid(form)
+        touch_feeds(self.request.user.pk)
+        return response
+
+
+class ScoringProfileListView(LoginRequiredMixin, ListView):
+    model = ScoringProfile
+    template_name = "planner/scoring_profile_list.html"
+    context_object_name = "profiles"
+
+    def get_queryset(self):
+        return ScoringProfile.objects.filter(owner=self.request.user)
+
+
+class ScoringProfileCreateView(LoginRequiredMixin, CreateView):
+    model = ScoringProfile
+    form_class = ScoringProfileForm
+    template_name = "planner/form.html"
+    success_url = reverse_lazy("scoring_profile_list")
+
+    def form_valid(self, form):
+        form.instance.owner = self.request.user
+        return super().form_valid(form)
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        context["page_title"] = "Добавить профиль оценки"
+        return context
+
+
+class ScoringProfileUpdateView(LoginRequiredMixin, UpdateView):
+    model = ScoringProfile
+    form_class = ScoringProfileForm
+    template_name = "planner/form.html"
+    success_url = reverse_lazy("scoring_profile_list")
+
+    def get_queryset(self):
+        return ScoringProfile.objects.filter(owner=self.request.user)
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        context["page_title"] = "Редактировать профиль оценки"
+        return context
+
+
+class ScoringProfileDeleteView(LoginRequiredMixin, DeleteView):
+    model = ScoringProfile
+    template_name = "planner/confirm_delete.html"
+    success_url = reverse_lazy("scoring_profile_list")
+
+    def get_queryset(self):
+        return ScoringProfile.objects.filter(owner=self.request.user)
 
 
 class PlanListView(LoginRequiredMixin, ListView):
     model = SessionRequest
     template_name = "planner/plan_list.html"
     context_object_name = "plans"
+    paginate_by = 20
 
     def get_queryset(self):
         return (
             SessionRequest.objects.filter(user=self.request.user)
-            .annotate(windows_count=Count("astro_windows"))
+            .select_related("location", "target")
             .order_by("-created_at")
         )
 
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        plans = context["plans"]
+
+        # Итоги берём из свода по ночам и только для планов текущей страницы
+        rollup = {
+            row["plan"]: row
+            for row in NightSummary.objects.filter(plan__in=[p.pk for p in plans])
+            .values("plan")
+            .annotate(windows_count=Sum("windows_count"), best_score=Max("best_score"))
+        }
+        for p in plans:
+            row = rollup.get(p.pk, {})
+            p.windows_count = row.get("windows_count") or 0
+            p.best_score = row.get("best_score")
+
+        return context
+
 
 class PlanCreateView(LoginRequiredMixin, CreateView):
     model = SessionRequest
@@ -168,6 +273,7 @@ class PlanCreateView(LoginRequiredMixin, CreateView):
         form = super().get_form(form_class)
         form.fields["location"].queryset = Location.objects.filter(owner=self.request.user)
         form.fields["target"].queryset = Target.objects.filter(owner=self.request.user)
+        form.fields["scoring_profile"].queryset = ScoringProfile.objects.filter(owner=self.request.user)
         return form
 
     def form_valid(self, form):
@@ -180,46 +286,378 @@ class PlanCreateView(LoginRequiredMixin, CreateView):
         return context
 
 
-class PlanDetailView(LoginRequiredMixin, DetailView):
-    model = SessionRequest
+class AsyncLoginRequiredMixin(LoginRequiredMixin):
+    """
+    LoginRequiredMixin для async-вьюх: пользователь читается через auser(),
+    без синхронного обращения к БД из event loop
+    """
+
+    async def dispatch(self, request, *args, **kwargs):
+        request.user = await request.auser()
+        if not request.user.is_authenticated:
+            return self.handle_no_permission()
+        return await super(LoginRequiredMixin, self).dispatch(request, *args, **kwargs)
+
+
+async def _aget_plan(user, pk: int) -> SessionRequest:
+    try:
+        return await SessionRequest.objects.select_related("location", "target", "scoring_profile").aget(user=user, pk=pk)
+    except SessionRequest.DoesNotExist:
+        raise Http404("План не найден.")
+
+
+class PlanDetailView(AsyncLoginRequiredMixin, View):
+    """
+    Страница плана (async): чтение через async ORM, пока другие запросы ждут погоду.
+    Профайлер (requested_mode) здесь не подключён: страница только читает сохранённые ряды,
+    профилируется расчёт — PlanRunView
+    """
     template_name = "planner/plan_detail.html"
-    context_object_name = "plan"
 
-    def get_queryset(self):
-        return SessionRequest.objects.filter(user=self.request.user)
+    async def get(self, request, pk: int):
+        plan = await _aget_plan(request.user, pk)
+
+        windows = [w async for w in plan.astro_windows.order_by("-score", "start_time")]
+
+        # Один проход values_list вместо PlanHourScore на каждый час: первые три колонки —
+        # ряд графика, остальные нужны только таблице лучших часов.
+        # JSON, а не repr списка: облачность за горизонтом прогноза — null.
+        # Длинные ряды прореживаются; полное разрешение — PlanChartView
+        rows = [
+            r async for r in plan.hour_scores.order_by("timestamp").values_list(
+                "timestamp", "score", "cloud_cover", "target_altitude", "moon_illumination", "is_astronomical_dark",
+                named=True,
+            )
+        ]
+        hours_best = heapq.nlargest(10, rows, key=lambda r: r.score)
+        chart = chart_payload(rows)
+        context = {
+            "plan": plan,
+            "profile_modes": PROFILE_MODES if request.user.is_staff else (),
+            "rescore_form": PlanRescoreForm(user=request.user, initial={"scoring_profile": plan.scoring_profile_id}),
+            "windows": windows,
+            "hours_best": hours_best,
+            "chart_labels": json.dumps(chart["labels"]),
+            "chart_scores": json.dumps(chart["scores"]),
+            "chart_clouds": json.dumps(chart["clouds"]),
+            "chart_points": len(chart["labels"]),
+            "chart_total": chart["total"],
+            "chart_downsampled": chart["downsampled"],
+        }
+        # Шаблон читает сообщения из сессии — рендерим в потоке
+        return await sync_to_async(render)(request, self.template_name, context)
+
+
+class PlanChartView(AsyncLoginRequiredMixin, View):
+    """
+    Ряды графика плана в JSON: по умолчанию полное разрешение, ?points=N — прореживание
+    """
+
+    async def get(self, request, pk: int):
+        plan = await _aget_plan(request.user, pk)
+
+        try:
+            points = int(request.GET["points"]) if request.GET.get("points") else None
+        except ValueError:
+            return HttpResponseBadRequest("points должно быть целым числом.")
+
+        rows = [r async for r in plan.hour_scores.order_by("timestamp").values_list("timestamp", "score", "cloud_cover")]
+        return JsonResponse(chart_payload(rows, max_points=points))
+
+
+class PlanCalendarView(LoginRequiredMixin, TemplateView):
+    """
+    Календарь ночей по всем планам пользователя (?month=YYYY-MM).
+    Читает только свод NightSummary за один месяц
+    """
+    template_name = "planner/plan_calendar.html"
+    nights_per_day = 3
+
+    def _month(self) -> dt.date:
+        raw = self.request.GET.get("month", "")
+        try:
+            return dt.datetime.strptime(raw, "%Y-%m").date()
+        except ValueError:
+            return timezone.localdate().replace(day=1)
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        plan = self.object
+        month = self._month()
+
+        weeks = calendar.Calendar().monthdatescalendar(month.year, month.month)
+        summaries = (
+            NightSummary.objects.filter(
+                plan__user=self.request.user,
+                night__range=(weeks[0][0], weeks[-1][-1]),
+            )
+            .select_related("plan__location", "plan__target")
+            .order_by("night", "-best_score")
+        )
+
+        by_day: dict[dt.date, list[NightSummary]] = {}
+        for summary in summaries:
+            day_nights = by_day.setdefault(summary.night, [])
+            if len(day_nights) < self.nights_per_day:
+                day_nights.append(summary)
+
+        feed = CalendarFeed.objects.filter(user=self.request.user).only("token").first()
+        if feed is not None:
+            feed_url = self.request.build_absolute_uri(reverse("calendar_feed", args=[feed.token]))
+            context["feed_url"] = feed_url
+            context["feed_webcal_url"] = "webcal://" + feed_url.split("://", 1)[1]
+
+        context["month"] = month
+        context["prev_month"] = (month - dt.timedelta(days=1)).strftime("%Y-%m")
+        context["next_month"] = (month + dt.timedelta(days=32)).strftime("%Y-%m")
+        context["weekdays"] = ["Пн", "Вт", "Ср", "Чт", "Пт", "Сб", "Вс"]
+        context["weeks"] = [
+            [
+                {"day": day, "in_month": day.month == month.month, "nights": by_day.get(day, [])}
+                for day in week
+            ]
+            for week in weeks
+        ]
+        return context
+
+
+class CalendarFeedResetView(LoginRequiredMixin, View):
+    """
+    Создать ссылку на ленту календаря или заменить её новой (старая перестаёт работать)
+    """
 
-        context["windows"] = plan.astro_windows.all().order_by("-score", "start_time")
+    def post(self, request):
+        reset_feed(request.user)
+        messages.success(request, "Ссылка на календарь обновлена.")
+        return redirect("plan_calendar")
 
-        hours = plan.hour_scores.all().order_by("timestamp")
-        context["hours_best"] = plan.hour_scores.all().order_by("-score", "timestamp")[:10]
 
-        context["chart_labels"] = [h.timestamp.strftime("%Y-%m-%d %H:%M") for h in hours]
-        context["chart_scores"] = [round(h.score, 2) for h in hours]
-        context["chart_clouds"] = [h.cloud_cover for h in hours]
+class CalendarFeedView(View):
+    """
+    Лента окон съёмки в iCalendar по секретной ссылке, без входа.
+    Опрос без изменений стоит одного запроса по токену и ответа 304
+    """
+
+    def get(self, request, token: str):
+        state = feed_state(token)
+        if state is None:
+            raise Http404("Лента не найдена")
+
+        # HTTP-даты — с точностью до секунды
+        last_modified = int(state.last_modified.timestamp())
+        response = get_conditional_response(request, etag=state.etag, last_modified=last_modified)
+        if response is None:
+            response = HttpResponse(
+                feed_body(state, request.build_absolute_uri("/")),
+                content_type="text/calendar; charset=utf-8",
+            )
+            response["Content-Disposition"] = 'inline; filename="astro-windows.ics"'
+        response["ETag"] = state.etag
+        response["Last-Modified"] = http_date(last_modified)
+        patch_cache_control(response, private=True, max_age=settings.PLANNER_CALENDAR_FEED_MAX_AGE)
+        return response
+
+
+class TonightView(LoginRequiredMixin, TemplateView):
+    """
+    «Что снимать сегодня»: рейтинг всех целей пользователя (и, по желанию, каталога)
+    для одной локации и ночи
+    """
+    template_name = "planner/tonight.html"
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        user = self.request.user
+
+        if "location" in self.request.GET:
+            form = TonightForm(self.request.GET, user=user)
+        else:
+            form = TonightForm(user=user, initial={"night": timezone.localdate()})
+        context["form"] = form
+
+        if form.is_bound and form.is_valid():
+            data = form.cleaned_data
+            try:
+                context["ranking"] = rank_targets(
+                    data["location"],
+                    data["night"],
+                    Target.objects.filter(owner=user),
+                    include_catalog=data["include_catalog"],
+                    min_target_altitude=data["min_target_altitude"],
+                    max_cloud_cover=data["max_cloud_cover"],
+                    avoid_moon=data["avoid_moon"],
+                    top=data["top"],
+                )
+            except Exception as e:
+                messages.error(self.request, f"Ошибка расчёта: {e}")
 
         return context
 
 
-class PlanRunView(LoginRequiredMixin, View):
+class CompareView(LoginRequiredMixin, TemplateView):
     """
-    Запуск расчёта по кнопке (POST)
-    Делает запрос к Open-Meteo, считает AstroPy, сохраняет окна AstroWindow
+    Какая из сохранённых локаций лучше для цели на ближайшие дни
     """
+    template_name = "planner/compare.html"
 
-    def post(self, request, pk: int):
-        plan = SessionRequest.objects.filter(user=request.user, pk=pk).first()
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        user = self.request.user
+
+        if "target" in self.request.GET:
+            form = CompareForm(self.request.GET, user=user)
+        else:
+            today = timezone.localdate()
+            form = CompareForm(user=user, initial={"date_from": today, "date_to": today + dt.timedelta(days=6)})
+        context["form"] = form
+
+        if form.is_bound and form.is_valid():
+            data = form.cleaned_data
+            try:
+                context["sites"] = compare_locations(
+                    data["target"],
+                    list(data["locations"]),
+                    data["date_from"],
+                    data["date_to"],
+                    min_target_altitude=data["min_target_altitude"],
+                    max_cloud_cover=data["max_cloud_cover"],
+                    avoid_moon=data["avoid_moon"],
+                )
+            except Exception as e:
+                messages.error(self.request, f"Ошибка расчёта: {e}")
+
+        return context
+
+
+class DemoView(TemplateView):
+    """
+    Демо-планировщик для гостей: расчёт в памяти без записи в БД, ответы кэшируются
+    по округлённым координатам, запросы с одного IP ограничены
+    """
+    template_name = "planner/demo.html"
+
+    def get(self, request, *args, **kwargs):
+        if "latitude" in request.GET:
+            form = DemoForm(request.GET)
+        else:
+            form = DemoForm(initial={"date_from": timezone.localdate()})
+        context = self.get_context_data(form=form, coord_step=DEMO_COORD_STEP)
+
+        if not form.is_bound or not form.is_valid():
+            return self.render_to_response(context)
+
+        if not allow_request(request.META.get("REMOTE_ADDR", "")):
+            messages.error(request, "Слишком много запросов. Подождите минуту или зарегистрируйтесь.")
+            return self.render_to_response(context, status=429)
+
+        data = form.cleaned_data
+        query = DemoQuery(
+            latitude=bucket(data["latitude"]),
+            longitude=bucket(data["longitude"]),
+            timezone=data["tz"],
+            target_name=data["target_name"],
+            target_type=data["target_type"],
+            resolved=data["resolved"],
+            date_from=data["date_from"],
+            date_to=data["date_to"],
+            min_target_altitude=data["min_target_altitude"],
+            max_cloud_cover=data["max_cloud_cover"],
+            avoid_moon=data["avoid_moon"],
+        )
+        try:
+            context["result"] = demo_plan(query)
+        except DemoBusy as e:
+            messages.error(request, str(e))
+            response = self.render_to_response(context, status=503)
+            response["Retry-After"] = "60"
+            return response
+        except Exception as e:
+            messages.error(request, f"Ошибка расчёта: {e}")
+            return self.render_to_response(context)
+
+        context["query"] = query
+        context["hours_best"] = sorted(context["result"].hours, key=lambda h: h.score, reverse=True)[:10]
+        context["chart_labels"] = json.dumps(context["result"].chart["labels"])
+        context["chart_scores"] = json.dumps(context["result"].chart["scores"])
+        context["chart_clouds"] = json.dumps(context["result"].chart["clouds"])
+        return self.render_to_response(context)
+
+
+class PlanRunView(AsyncLoginRequiredMixin, View):
+    """
+    Запуск расчёта по кнопке (POST), async: ожидание Open-Meteo не занимает воркер,
+    AstroPy считается в пуле потоков, окна AstroWindow сохраняются как раньше
+    """
+
+    async def post(self, request, pk: int):
+        plan = await SessionRequest.objects.select_related("location", "target").filter(user=request.user, pk=pk).afirst()
         if not plan:
             messages.error(request, "План не найден.")
             return redirect("plan_list")
 
+        # Профайлер — только по запросу staff (?profile=cprofile|sample, X-Planner-Profile) или флагу плана
+        profile = requested_mode(request)
         try:
-            run_planning(plan)
+            await arun_planning(plan, profile=profile, requested_by=request.user.get_username() if profile else "")
             messages.success(request, "Расчёт выполнен. Окна съёмки обновлены.")
+            if profile:
+                messages.info(request, "Профиль расчёта сохранён (админка → «Профили расчётов»).")
         except Exception as e:
             messages.error(request, f"Ошибка расчёта: {e}")
 
         return redirect("plan_detail", pk=pk)
+
+
+class PlanRescoreView(LoginRequiredMixin, View):
+    """
+    Пересчёт score плана по другому профилю оценки: ряды последнего расчёта берутся из PlanResult,
+    эфемериды и погода заново не считаются
+    """
+
+    def post(self, request, pk: int):
+        plan = get_object_or_404(SessionRequest.objects.select_related("location", "target"), user=request.user, pk=pk)
+        form = PlanRescoreForm(request.POST, user=request.user)
+        if not form.is_valid():
+            messages.error(request, "Профиль оценки не найден.")
+            return redirect("plan_detail", pk=pk)
+
+        plan.scoring_profile = form.cleaned_data["scoring_profile"]
+        plan.save(update_fields=["scoring_profile"])
+        try:
+            if rescore_plan(plan) is None:
+                run_planning(plan)  # рядов уже нет в кэше — полный расчёт
+            messages.success(request, f"Оценка пересчитана по профилю «{plan.scoring_profile or 'Стандартный'}».")
+        except Exception as e:
+            messages.error(request, f"Ошибка расчёта: {e}")
+        return redirect("plan_detail", pk=pk)
+
+
+class PlanExportView(LoginRequiredMixin, View):
+    """
+    Потоковая выгрузка плана: ?kind=hours|windows&format=csv|parquet&from=YYYY-MM-DD&to=YYYY-MM-DD
+    Строки читаются iterator() пачками — память не растёт с размером плана
+    """
+
+    def get(self, request, pk: int):
+        plan = get_object_or_404(SessionRequest, user=request.user, pk=pk)
+
+        kind = request.GET.get("kind", "hours")
+        fmt = request.GET.get("format", "csv")
+        if kind not in EXPORT_KINDS or fmt not in EXPORT_FORMATS:
+            return HttpResponseBadRequest("Неизвестный kind или format.")
+
+        try:
+            date_from = dt.date.fromisoformat(request.GET["from"]) if request.GET.get("from") else None
+            date_to = dt.date.fromisoformat(request.GET["to"]) if request.GET.get("to") else None
+        except ValueError:
+            return HttpResponseBadRequest("Даты в формате YYYY-MM-DD.")
+
+        queryset = export_queryset(kind, SessionRequest.objects.filter(pk=plan.pk), date_from, date_to)
+        try:
+            stream = export_stream(kind, fmt, queryset)
+        except RuntimeError as e:
+            return HttpResponseBadRequest(str(e))
+
+        ext = "csv" if fmt == "csv" else "parquet"
+        response = StreamingHttpResponse(stream, content_type=CONTENT_TYPES[fmt])
+        response["Content-Disposition"] = f'attachment; filename="plan-{plan.pk}-{kind}.{ext}"'
+        return response